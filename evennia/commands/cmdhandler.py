@@ -33,15 +33,18 @@ command line. The processing of a command works as follows:
 13. Return deferred that will fire with the return from `cmdobj.func()` (unused by default).
 """
 
-from collections import defaultdict
-from weakref import WeakValueDictionary
+from collections import defaultdict, OrderedDict
 from traceback import format_exc
 from itertools import chain
 from copy import copy
+from weakref import ref, proxy
 from twisted.internet.defer import inlineCallbacks, returnValue
 from django.conf import settings
 from evennia.comms.channelhandler import CHANNELHANDLER
+from evennia.locks.lockhandler import clear_lock_cache
 from evennia.utils import logger, utils
+from evennia.utils.dbserialize import flush_pending_saves
+from evennia.utils.idmapper.models import flush_field_saves
 from evennia.utils.utils import string_suggestions, to_unicode
 
 from django.utils.translation import ugettext as _
@@ -50,7 +53,6 @@ _IN_GAME_ERRORS = settings.IN_GAME_ERRORS
 
 __all__ = ("cmdhandler",)
 _GA = object.__getattribute__
-_CMDSET_MERGE_CACHE = WeakValueDictionary()
 
 # tracks recursive calls by each caller
 # to avoid infinite loops (commands calling themselves)
@@ -151,6 +153,135 @@ def _msg_err(receiver, stringtuple):
                                    errmsg=stringtuple[1].strip(),
                                    timestamp=timestamp).strip())
 
+
+class _CmdSetMergeCache(object):
+    """
+    A size-limited LRU cache of merged cmdsets. Each cache key is built
+    from the `merge_id`, `merge_version` and `duplicates` setting of the
+    cmdsets taking part in the merge, in merge order. The `merge_id`
+    is never reused and `merge_version` is bumped whenever a cmdset
+    changes or its CmdSetHandler updates, so a stale merger will never
+    be returned.
+
+    Entries only hold weak references to the cmdsets they were merged
+    from, and are dropped once one of those is garbage collected. The
+    merged cmdset does however hold the merged commands, and through
+    their `obj` the objects they are defined on. So until an outdated
+    entry ages out of the cache, it may keep objects in memory that
+    were deleted or evicted from the idmapper cache. The cache size
+    bounds how much is kept this way.
+
+    """
+    def __init__(self, maxsize):
+        """
+        Args:
+            maxsize (int): The maximum number of mergers to store. If
+                <= 0, no caching will happen.
+
+        """
+        self.maxsize = maxsize
+        self.cache = OrderedDict()  # {mergehash: (cmdset, [weakref to source cmdset, ...])}
+        # entries whose source cmdsets were garbage collected. These are
+        # removed on the next get/set rather than in the weakref callback,
+        # which may run in the middle of changing the cache.
+        self.dead = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, mergehash):
+        """
+        Get a cached merger, marking it as recently used.
+
+        Args:
+            mergehash (tuple): The merge key.
+
+        Returns:
+            cmdset (CmdSet or None): The cached merged cmdset, or
+                `None` if there was no cached merger.
+
+        """
+        if self.dead:
+            self._remove_dead()
+        try:
+            entry = self.cache.pop(mergehash)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.cache[mergehash] = entry
+        self.hits += 1
+        return entry[0]
+
+    def set(self, mergehash, cmdset, sources=()):
+        """
+        Store a merged cmdset, evicting the least recently used
+        merger if the cache is full.
+
+        Args:
+            mergehash (tuple): The merge key.
+            cmdset (CmdSet): The merged cmdset.
+            sources (list, optional): The cmdsets merged into `cmdset`.
+                The entry is dropped when any of them is garbage
+                collected.
+
+        """
+        if self.maxsize <= 0:
+            return
+        if self.dead:
+            self._remove_dead()
+        dead = self.dead
+        callback = lambda _, mergehash=mergehash: dead.append(mergehash)
+        self.cache[mergehash] = (cmdset, [ref(source, callback) for source in sources])
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def _remove_dead(self):
+        """
+        Remove the entries whose source cmdsets were garbage collected.
+
+        """
+        while self.dead:
+            self.cache.pop(self.dead.pop(), None)
+
+    def clear(self):
+        """
+        Empty the cache and reset all counters.
+
+        """
+        self.cache.clear()
+        del self.dead[:]
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            stats (dict): Contains `size`, `maxsize`, `hits`, `misses`
+                and `evictions`.
+
+        """
+        return {"size": len(self.cache), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+_CMDSET_MERGE_CACHE = _CmdSetMergeCache(settings.CMDSET_MERGE_CACHE_SIZE)
+
+
+def get_merge_cache_stats():
+    """
+    Get statistics for the cache of merged cmdsets. This is useful for
+    tuning the `CMDSET_MERGE_CACHE_SIZE` setting.
+
+    Returns:
+        stats (dict): Contains `size`, `maxsize`, `hits`, `misses`
+            and `evictions`.
+
+    """
+    return _CMDSET_MERGE_CACHE.stats()
+
+
 # custom Exceptions
 
 class NoCmdSets(Exception):
@@ -226,9 +357,11 @@ def get_and_merge_cmdsets(caller, session, player, obj, callertype):
                     location = None
                 if location:
                     # Gather all cmdsets stored on objects in the room and
-                    # also in the caller's inventory and the location itself
-                    local_objlist = yield (location.contents_get(exclude=obj) +
-                                           obj.contents_get() + [location])
+                    # also in the caller's inventory and the location itself.
+                    # The contents caches only return objects that may
+                    # actually contribute cmdsets.
+                    local_objlist = yield (location.contents_cache.get_with_cmdsets(exclude=obj) +
+                                           obj.contents_cache.get_with_cmdsets() + [location])
                     local_objlist = [o for o in local_objlist if not o._is_deleted]
                     for lobj in local_objlist:
                         try:
@@ -344,12 +477,12 @@ def get_and_merge_cmdsets(caller, session, player, obj, callertype):
                if cmdset.key == "_CMDSET_ERROR"]
 
         if cmdsets:
+            sources = cmdsets
             # faster to do tuple on list than to build tuple directly
-            mergehash = tuple([id(cmdset) for cmdset in cmdsets])
-            if mergehash in _CMDSET_MERGE_CACHE:
-                # cached merge exist; use that
-                cmdset = _CMDSET_MERGE_CACHE[mergehash]
-            else:
+            mergehash = tuple([(cmdset.merge_id, cmdset.merge_version, cmdset.duplicates)
+                               for cmdset in cmdsets])
+            cmdset = _CMDSET_MERGE_CACHE.get(mergehash)
+            if cmdset is None:
                 # we group and merge all same-prio cmdsets separately (this avoids
                 # order-dependent clashes in certain cases, such as
                 # when duplicates=True)
@@ -369,10 +502,11 @@ def get_and_merge_cmdsets(caller, session, player, obj, callertype):
                 cmdset = cmdsets[0]
                 for merging_cmdset in cmdsets[1:]:
                     cmdset = yield cmdset + merging_cmdset
-                # store the full sets for diagnosis
-                cmdset.merged_from = cmdsets
+                # store the full sets for diagnosis. These are weak references,
+                # so the cached merger doesn't keep the cmdsets alive.
+                cmdset.merged_from = [proxy(source) for source in sources]
                 # cache
-                _CMDSET_MERGE_CACHE[mergehash] = cmdset
+                _CMDSET_MERGE_CACHE.set(mergehash, cmdset, sources)
         else:
             cmdset = None
         for cset in (cset for cset in local_obj_cmdsets if cset):
@@ -510,6 +644,13 @@ def cmdhandler(called_by, raw_string, _testing=False, callertype="session", sess
             raise ErrorReported
         finally:
             _COMMAND_NESTING[called_by] -= 1
+            if not _COMMAND_NESTING[called_by]:
+                # cached lock results only live for one command
+                clear_lock_cache()
+                # save Attributes updated in-situ during the command
+                flush_pending_saves()
+                # save fields changed during the command
+                flush_field_saves()
 
 
     raw_string = to_unicode(raw_string, force_string=True)
@@ -13,6 +13,44 @@ from evennia.utils.logger import log_trace
 
 _MULTIMATCH_REGEX = re.compile(settings.SEARCH_MULTIMATCH_REGEX, re.I + re.U)
 
+
+def _get_cmdname_index(cmdset):
+    """
+    Get the index of command names for a cmdset, building it if
+    the cmdset changed since the index was last built. The index
+    is stored on the cmdset, so for a cached merged cmdset it is
+    only built once per merge.
+
+    Args:
+        cmdset (CmdSet): The cmdset to index.
+
+    Returns:
+        index (tuple): A tuple `(lengths, names)` where `lengths` is a
+            sorted tuple of all distinct (lowercase) command-name lengths
+            and `names` maps each lowercase command name (key or alias)
+            to a list of `(position, cmdname, cmdobj)`. The position
+            is used to retain the order of the cmdset's commands.
+
+    """
+    stored = cmdset._cmdname_index
+    if (stored and stored[0] == cmdset.merge_version and
+            stored[1] is cmdset.commands):
+        return stored[2]
+
+    names = {}
+    position = 0
+    for cmd in cmdset.commands:
+        try:
+            for cmdname in [cmd.key] + cmd.aliases:
+                if cmdname:
+                    names.setdefault(cmdname.lower(), []).append((position, cmdname, cmd))
+                position += 1
+        except Exception:
+            log_trace("cmdparser error when indexing command %s." % cmd)
+    index = (tuple(sorted(set(len(cmdname) for cmdname in names))), names)
+    cmdset._cmdname_index = (cmdset.merge_version, cmdset.commands, index)
+    return index
+
 def cmdparser(raw_string, cmdset, caller, match_index=None):
     """
     This function is called by the cmdhandler once it has
@@ -74,15 +112,22 @@ def cmdparser(raw_string, cmdset, caller, match_index=None):
 
     matches = []
 
-    # match everything that begins with a matching cmdname.
+    # match everything that begins with a matching cmdname. We only
+    # need to look up the prefixes of raw_string having the same length
+    # as some command name in the cmdset.
     l_raw_string = raw_string.lower()
-    for cmd in cmdset:
+    lengths, names = _get_cmdname_index(cmdset)
+    candidates = []
+    for cmdlen in lengths:
+        if cmdlen > len(l_raw_string):
+            break
+        candidates.extend(names.get(l_raw_string[:cmdlen], ()))
+    # retain the order of the commands in the cmdset
+    candidates.sort(key=lambda candidate: candidate[0])
+    for _, cmdname, cmd in candidates:
         try:
-            matches.extend([create_match(cmdname, raw_string, cmd)
-                      for cmdname in [cmd.key] + cmd.aliases
-                        if cmdname and l_raw_string.startswith(cmdname.lower())
-                           and (not cmd.arg_regex or
-                             cmd.arg_regex.match(l_raw_string[len(cmdname):]))])
+            if not cmd.arg_regex or cmd.arg_regex.match(l_raw_string[len(cmdname):]):
+                matches.append(create_match(cmdname, raw_string, cmd))
         except Exception:
             log_trace("cmdhandler error. raw_input:%s" % raw_string)
 
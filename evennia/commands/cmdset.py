@@ -28,11 +28,17 @@ Set theory.
 """
 from future.utils import listvalues, with_metaclass
 
+from itertools import count
 from weakref import WeakKeyDictionary
 from django.utils.translation import ugettext as _
 from evennia.utils.utils import inherits_from, is_iter
 __all__ = ("CmdSet",)
 
+# unique, never-reused identifiers for cmdset instances. These are
+# used by the cmdhandler to cache cmdset mergers (unlike id(), they
+# will not be recycled after the cmdset is garbage collected).
+_MERGE_IDS = count(1)
+
 
 class _CmdSetMeta(type):
     """
@@ -185,6 +191,11 @@ class CmdSet(with_metaclass(_CmdSetMeta, object)):
         # this is set only on merged sets, in cmdhandler.py, in order to
         # track, list and debug mergers correctly.
         self.merged_from = []
+        # stable identity and change-counter, used as merge-cache key
+        self.merge_id = next(_MERGE_IDS)
+        self.merge_version = 0
+        # lookup index of command names, built on demand by the cmdparser
+        self._cmdname_index = None
 
         # initialize system
         self.at_cmdset_creation()
@@ -476,6 +487,7 @@ class CmdSet(with_metaclass(_CmdSetMeta, object)):
             cmds = [self._instantiate(cmd)]
         commands = self.commands
         system_commands = self.system_commands
+        self.merge_version += 1
         for cmd in cmds:
             # add all commands
             if not hasattr(cmd, 'obj'):
@@ -506,6 +518,7 @@ class CmdSet(with_metaclass(_CmdSetMeta, object)):
 
         """
         cmd = self._instantiate(cmd)
+        self.merge_version += 1
         if cmd.key.startswith("__"):
             try:
                 ic = self.system_commands.index(cmd)
@@ -584,6 +597,7 @@ class CmdSet(with_metaclass(_CmdSetMeta, object)):
             else:
                 unique[cmd.key] = cmd
         self.commands = listvalues(unique)
+        self.merge_version += 1
 
     def get_all_cmd_keys_and_aliases(self, caller=None):
         """
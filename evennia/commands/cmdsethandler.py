@@ -364,9 +364,16 @@ class CmdSetHandler(object):
                 new_current = cmdset + new_current
             except TypeError:
                 continue
+            # invalidate cached cmdhandler mergers involving this set
+            cmdset.merge_version += 1
             self.mergetype_stack.append(new_current.actual_mergetype)
         self.current = new_current
 
+        # let our location know if we may contribute cmdsets to it
+        location = getattr(self.obj, "db_location", None)
+        if location:
+            location.contents_cache.update_cmdsets(self.obj)
+
     def add(self, cmdset, emit_to_obj=None, permanent=False, default_cmdset=False):
         """
         Add a cmdset to the handler, on top of the old ones, unless it
@@ -45,6 +45,7 @@ class CharacterCmdSet(CmdSet):
         self.add(system.CmdAbout())
         self.add(system.CmdTime())
         self.add(system.CmdServerLoad())
+        self.add(system.CmdIdmapper())
         #self.add(system.CmdPs())
         self.add(system.CmdTickers())
 
@@ -20,6 +20,7 @@ from evennia.objects.models import ObjectDB
 from evennia.players.models import PlayerDB
 from evennia.utils import logger, utils, gametime, create, prettytable
 from evennia.utils.evtable import EvTable
+from evennia.utils.ansi import get_parse_cache_stats
 from evennia.utils.utils import crop, class_from_module
 
 COMMAND_DEFAULT_CLASS = class_from_module(settings.COMMAND_DEFAULT_CLASS)
@@ -27,11 +28,12 @@ COMMAND_DEFAULT_CLASS = class_from_module(settings.COMMAND_DEFAULT_CLASS)
 # delayed imports
 _RESOURCE = None
 _IDMAPPER = None
+_CMDHANDLER = None
 
 # limit symbol import for API
 __all__ = ("CmdReload", "CmdReset", "CmdShutdown", "CmdPy",
            "CmdScripts", "CmdObjects", "CmdService", "CmdAbout",
-           "CmdTime", "CmdServerLoad")
+           "CmdTime", "CmdServerLoad", "CmdIdmapper")
 
 
 class CmdReload(COMMAND_DEFAULT_CLASS):
@@ -713,23 +715,29 @@ class CmdServerLoad(COMMAND_DEFAULT_CLASS):
                 import resource as _RESOURCE
 
             loadavg = os.getloadavg()[0]
-            rmem = float(os.popen('ps -p %d -o %s | tail -1' % (pid, "rss")).read()) / 1000.0  # resident memory
-            vmem = float(os.popen('ps -p %d -o %s | tail -1' % (pid, "vsz")).read()) / 1000.0  # virtual memory
-            pmem = float(os.popen('ps -p %d -o %s | tail -1' % (pid, "%mem")).read())  # percent of resident memory to total
+            rmem, vmem = _IDMAPPER.process_memory()  # resident and virtual memory
+            totalmem = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1.0e6
+            if rmem is None:
+                # only the peak is known on this system
+                rmemname, rmem = "Peak memory usage", _IDMAPPER.peak_memory() or 0.0
+            else:
+                rmemname = "Memory usage"
+            pmem = 100.0 * rmem / totalmem  # percent of resident memory to total
+            vmemstring = "unknown" if vmem is None else "%g MB" % vmem
             rusage = _RESOURCE.getrusage(_RESOURCE.RUSAGE_SELF)
 
             if "mem" in self.switches:
-                string = "Memory usage: RMEM: {w%g{n MB (%g%%), " \
-                         " VMEM (res+swap+cache): {w%g{n MB."
-                self.caller.msg(string % (rmem, pmem, vmem))
+                string = "%s: RMEM: {w%g{n MB (%g%%), " \
+                         " VMEM (res+swap+cache): {w%s{n."
+                self.caller.msg(string % (rmemname, rmem, pmem, vmemstring))
                 return
 
             loadtable = EvTable("property", "statistic", align="l")
             loadtable.add_row("Server load (1 min)", "%g" % loadavg)
             loadtable.add_row("Process ID", "%g" % pid),
-            loadtable.add_row("Memory usage","%g MB (%g%%)" % (rmem, pmem))
+            loadtable.add_row(rmemname, "%g MB (%g%%)" % (rmem, pmem))
             loadtable.add_row("Virtual address space", "")
-            loadtable.add_row("{x(resident+swap+caching){n", "%g MB" % vmem)
+            loadtable.add_row("{x(resident+swap+caching){n", vmemstring)
             loadtable.add_row("CPU time used (total)", "%s (%gs)" % (utils.time_format(rusage.ru_utime), rusage.ru_utime))
             loadtable.add_row("CPU time used (user)", "%s (%gs)" % (utils.time_format(rusage.ru_stime), rusage.ru_stime))
             loadtable.add_row("Page faults", "%g hard,  %g soft, %g swapouts" % (rusage.ru_majflt, rusage.ru_minflt, rusage.ru_nswap))
@@ -750,11 +758,83 @@ class CmdServerLoad(COMMAND_DEFAULT_CLASS):
         for tup in sorted_cache:
             memtable.add_row(tup[0], "%i" % tup[1], "%.2f" % (float(tup[1]) / total_num * 100))
 
-        string += "\n{w Entity idmapper cache:{n %i items\n%s" % (total_num, memtable)
+        cache_mem, _ = _IDMAPPER.cache_memory()
+        string += "\n{w Entity idmapper cache:{n %i items (~%g MB)\n%s" % (total_num, cache_mem, memtable)
+
+        # cmdset merge cache
+        global _CMDHANDLER
+        if not _CMDHANDLER:
+            from evennia.commands import cmdhandler as _CMDHANDLER
+        stats = _CMDHANDLER.get_merge_cache_stats()
+        string += "\n{w Cmdset merge cache:{n %i/%i mergers, " \
+                  "%i hits, %i misses, %i evictions" % (stats["size"], stats["maxsize"],
+                                                        stats["hits"], stats["misses"],
+                                                        stats["evictions"])
+
+        # text parse cache
+        stats = get_parse_cache_stats()
+        string += "\n{w Text parse cache:{n %i items, %i/%i KB, " \
+                  "%i hits, %i misses, %i evictions" % (stats["items"], stats["size"] / 1024,
+                                                        stats["maxsize"] / 1024, stats["hits"],
+                                                        stats["misses"], stats["evictions"])
 
         # return to caller
         self.caller.msg(string)
 
+
+class CmdIdmapper(COMMAND_DEFAULT_CLASS):
+    """
+    show idmapper cache statistics
+
+    Usage:
+      @idmapper[/trim] [<percent>]
+
+    Switch:
+      trim - evict the given percent (default 50) of the least
+             recently used objects from each cache
+
+    This shows how well the cache of database entities performs
+    for each type of entity. A cache with a low hit rate and many
+    evictions may need a higher cap (see the
+    IDMAPPER_CACHE_MAXENTRIES setting). Objects that can't be flushed
+    (such as those with NAttributes) are never evicted.
+
+    """
+    key = "@idmapper"
+    aliases = ["@cachestats"]
+    locks = "cmd:perm(list) or perm(Immortals)"
+    help_category = "System"
+
+    def func(self):
+        "Show the cache statistics."
+
+        global _IDMAPPER
+        if not _IDMAPPER:
+            from evennia.utils.idmapper import models as _IDMAPPER
+
+        if "trim" in self.switches:
+            try:
+                percent = float(self.args) if self.args else 50.0
+            except ValueError:
+                self.caller.msg("Usage: @idmapper/trim [<percent>]")
+                return
+            nevicted = _IDMAPPER.trim_cache(min(max(percent, 0.0), 100.0) / 100.0)
+            self.caller.msg("Evicted |w%i|n objects from the idmapper cache." % nevicted)
+            return
+
+        total_num, statdict = _IDMAPPER.cache_size(stats=True)
+        cache_mem, memdict = _IDMAPPER.cache_memory()
+        table = EvTable("database model", "cached", "max", "hits", "misses",
+                        "hit %", "evictions", "~MB", align="l")
+        for name, stats in sorted(statdict.items()):
+            lookups = stats["hits"] + stats["misses"]
+            table.add_row(name, "%i" % stats["size"], "%i" % stats["maxsize"] if stats["maxsize"] else "-",
+                          "%i" % stats["hits"], "%i" % stats["misses"],
+                          "%.2f" % (100.0 * stats["hits"] / lookups) if lookups else "-",
+                          "%i" % stats["evictions"], "%.2f" % memdict[name]["mem"])
+        self.caller.msg("{wIdmapper cache:{n %i items (~%g MB)\n%s" % (total_num, cache_mem, table))
+
+
 class CmdTickers(COMMAND_DEFAULT_CLASS):
     """
     View running tickers
@@ -146,6 +146,9 @@ class TestSystem(CommandTest):
     def test_server_load(self):
         self.call(system.CmdServerLoad(), "", "Server CPU and Memory load:")
 
+    def test_idmapper(self):
+        self.call(system.CmdIdmapper(), "", "Idmapper cache:")
+
 
 class TestAdmin(CommandTest):
     def test_emit(self):
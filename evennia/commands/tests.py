@@ -240,7 +240,9 @@ class TestCmdSetMergers(TestCase):
 
 # test cmdhandler functions
 
+import gc
 from evennia.commands import cmdhandler
+from twisted.internet.defer import inlineCallbacks
 from twisted.trial.unittest import TestCase as TwistedTestCase
 class TestGetAndMergeCmdSets(TwistedTestCase, EvenniaTest):
     "Test the cmdhandler.get_and_merge_cmdsets function."
@@ -336,3 +338,110 @@ class TestGetAndMergeCmdSets(TwistedTestCase, EvenniaTest):
             self.assertEqual(len(cmdset.commands), 9)
         deferred.addCallback(_callback)
         return deferred
+
+    def test_merge_cache(self):
+        a, b = self.cmdset_a, self.cmdset_b
+        a.no_exits = True
+        a.no_channels = True
+        self.set_cmdsets(self.obj1, a, b)
+        deferred = cmdhandler.get_and_merge_cmdsets(self.obj1, None, None, self.obj1, "object")
+        def _callback(cmdset):
+            # an unchanged cmdset stack re-uses the cached merger
+            deferred2 = cmdhandler.get_and_merge_cmdsets(self.obj1, None, None, self.obj1, "object")
+            deferred2.addCallback(lambda cmdset2: self.assertTrue(cmdset2 is cmdset))
+            yield deferred2
+            # changing a cmdset in the stack invalidates it
+            a.remove(_CmdD("A"))
+            deferred3 = cmdhandler.get_and_merge_cmdsets(self.obj1, None, None, self.obj1, "object")
+            def _callback3(cmdset3):
+                self.assertFalse(cmdset3 is cmdset)
+                self.assertEqual(cmdset3.count(), 3)
+            deferred3.addCallback(_callback3)
+            yield deferred3
+        _callback = inlineCallbacks(_callback)
+        deferred.addCallback(_callback)
+        return deferred
+
+    def test_local_cmdset_objects(self):
+        contents_cache = self.room1.contents_cache
+        self.assertTrue(self.exit in contents_cache.get_with_cmdsets())
+        self.assertFalse(self.obj2 in contents_cache.get_with_cmdsets())
+        self.obj2.cmdset.add(self.cmdset_b)
+        self.assertTrue(self.obj2 in contents_cache.get_with_cmdsets())
+        self.assertFalse(self.obj2 in contents_cache.get_with_cmdsets(exclude=self.obj2))
+        self.obj2.location = self.room2
+        self.assertFalse(self.obj2 in contents_cache.get_with_cmdsets())
+        self.assertTrue(self.obj2 in self.room2.contents_cache.get_with_cmdsets())
+        self.obj2.cmdset.remove("B")
+        self.assertFalse(self.obj2 in self.room2.contents_cache.get_with_cmdsets())
+
+
+class TestCmdSetMergeCache(TestCase):
+    "Test the LRU cache of merged cmdsets."
+    def test_lru(self):
+        cache = cmdhandler._CmdSetMergeCache(2)
+        cache.set((1,), "one")
+        cache.set((2,), "two")
+        self.assertEqual(cache.get((1,)), "one")
+        cache.set((3,), "three")
+        self.assertEqual(cache.get((2,)), None)
+        self.assertEqual(cache.get((1,)), "one")
+        self.assertEqual(cache.stats(), {"size": 2, "maxsize": 2, "hits": 2,
+                                         "misses": 1, "evictions": 1})
+
+    def test_weak_sources(self):
+        cache = cmdhandler._CmdSetMergeCache(2)
+        source = CmdSet()
+        cache.set((1,), "merged", [source])
+        self.assertEqual(cache.get((1,)), "merged")
+        del source
+        gc.collect()
+        self.assertEqual(cache.get((1,)), None)
+        self.assertEqual(cache.stats()["size"], 0)
+
+
+# test the default cmdparser
+
+from evennia.commands import cmdparser
+
+class _CmdLook(Command):
+    key = "look"
+    aliases = ["l"]
+class _CmdLookAt(Command):
+    key = "look at"
+class _CmdLeave(Command):
+    key = "leave"
+    arg_regex = r"\s|$"
+
+class _CmdSetParse(CmdSet):
+    key = "Parse"
+    def at_cmdset_creation(self):
+        self.add(_CmdLook())
+        self.add(_CmdLookAt())
+        self.add(_CmdLeave())
+
+class TestCmdParser(EvenniaTest):
+    "Test the default cmdparser"
+    def setUp(self):
+        super(TestCmdParser, self).setUp()
+        self.cmdset = _CmdSetParse()
+
+    def test_longest_match(self):
+        matches = cmdparser.cmdparser("look at box", self.cmdset, self.char1)
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0][0], "look at")
+        self.assertEqual(matches[0][1], " box")
+
+    def test_alias_and_arg_regex(self):
+        matches = cmdparser.cmdparser("l me", self.cmdset, self.char1)
+        self.assertEqual([match[0] for match in matches], ["l"])
+        # arg_regex stops 'leave' from matching, leaving only the 'l' alias
+        self.assertEqual([match[0] for match in
+                          cmdparser.cmdparser("leaves", self.cmdset, self.char1)], ["l"])
+        self.assertEqual(cmdparser.cmdparser("leave", self.cmdset, self.char1)[0][0], "leave")
+        self.assertEqual(cmdparser.cmdparser("xyz", self.cmdset, self.char1), [])
+
+    def test_index_update(self):
+        self.assertEqual(cmdparser.cmdparser("leave", self.cmdset, self.char1)[0][0], "leave")
+        self.cmdset.remove(_CmdLeave())
+        self.assertEqual(cmdparser.cmdparser("leave", self.cmdset, self.char1)[0][0], "l")
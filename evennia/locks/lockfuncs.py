@@ -11,6 +11,15 @@ Note that `accessing_obj` and `accessed_obj` can be any object type
 with a lock variable/field, so be careful to not expect
 a certain object type.
 
+Lock functions decorated with `lock_depends` declare which data their
+result depends on; this allows their results to be cached if
+`settings.LOCK_CACHE_TIMEOUT` is set (see `evennia.locks.lockhandler`).
+Changes to data not tracked this way (such as normal properties checked
+by `attr`, or which Player puppets an Object) are only picked up once
+the cache is cleared at the end of the current command or times out.
+Functions depending on such data all the time (like `inside` or
+`holds`) are not decorated and will never be cached.
+
 
 **Appendix: MUX locks**
 
@@ -91,6 +100,7 @@ from __future__ import print_function
 
 from django.conf import settings
 from evennia.utils import utils
+from evennia.locks.lockhandler import lock_depends
 
 _PERMISSION_HIERARCHY = [p.lower() for p in settings.PERMISSION_HIERARCHY]
 
@@ -105,24 +115,29 @@ def _to_player(accessing_obj):
 
 # lock functions
 
+@lock_depends()
 def true(*args, **kwargs):
     "Always returns True."
     return True
 
 
+@lock_depends()
 def all(*args, **kwargs):
     return True
 
 
+@lock_depends()
 def false(*args, **kwargs):
     "Always returns False"
     return False
 
 
+@lock_depends()
 def none(*args, **kwargs):
     return False
 
 
+@lock_depends()
 def self(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Check if accessing_obj is the same as accessed_obj
@@ -136,6 +151,7 @@ def self(accessing_obj, accessed_obj, *args, **kwargs):
     return accessing_obj == accessed_obj
 
 
+@lock_depends("permissions", "attributes")
 def perm(accessing_obj, accessed_obj, *args, **kwargs):
     """
     The basic permission-checker. Ignores case.
@@ -203,6 +219,7 @@ def perm(accessing_obj, accessed_obj, *args, **kwargs):
     return False
 
 
+@lock_depends("permissions", "attributes")
 def perm_above(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Only allow objects with a permission *higher* in the permission
@@ -214,6 +231,7 @@ def perm_above(accessing_obj, accessed_obj, *args, **kwargs):
     return perm(accessing_obj, accessed_obj, *args, **kwargs)
 
 
+@lock_depends("permissions", "attributes")
 def pperm(accessing_obj, accessed_obj, *args, **kwargs):
     """
     The basic permission-checker only for Player objects. Ignores case.
@@ -229,6 +247,7 @@ def pperm(accessing_obj, accessed_obj, *args, **kwargs):
     return perm(_to_player(accessing_obj), accessed_obj, *args, **kwargs)
 
 
+@lock_depends("permissions", "attributes")
 def pperm_above(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Only allow Player objects with a permission *higher* in the permission
@@ -239,6 +258,7 @@ def pperm_above(accessing_obj, accessed_obj, *args, **kwargs):
     return perm_above(_to_player(accessing_obj), accessed_obj, *args, **kwargs)
 
 
+@lock_depends()
 def dbref(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -260,6 +280,7 @@ def dbref(accessing_obj, accessed_obj, *args, **kwargs):
     return False
 
 
+@lock_depends()
 def pdbref(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Same as dbref, but making sure accessing_obj is a player.
@@ -267,11 +288,13 @@ def pdbref(accessing_obj, accessed_obj, *args, **kwargs):
     return dbref(_to_player(accessing_obj), accessed_obj, *args, **kwargs)
 
 
+@lock_depends()
 def id(accessing_obj, accessed_obj, *args, **kwargs):
     "Alias to dbref"
     return dbref(accessing_obj, accessed_obj, *args, **kwargs)
 
 
+@lock_depends()
 def pid(accessing_obj, accessed_obj, *args, **kwargs):
     "Alias to dbref, for Players"
     return dbref(_to_player(accessing_obj), accessed_obj, *args, **kwargs)
@@ -287,6 +310,7 @@ CF_MAPPING = {'eq': lambda val1, val2: val1 == val2 or str(val1) == str(val2) or
               'default': lambda val1, val2: False}
 
 
+@lock_depends("attributes")
 def attr(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -352,6 +376,7 @@ def attr(accessing_obj, accessed_obj, *args, **kwargs):
     return False
 
 
+@lock_depends("attributes")
 def objattr(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -404,6 +429,7 @@ def objlocattr(accessing_obj, accessed_obj, *args, **kwargs):
         return attr(accessed_obj.location, accessed_obj, *args, **kwargs)
 
 
+@lock_depends("attributes")
 def attr_eq(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -412,6 +438,7 @@ def attr_eq(accessing_obj, accessed_obj, *args, **kwargs):
     return attr(accessing_obj, accessed_obj, *args, **kwargs)
 
 
+@lock_depends("attributes")
 def attr_gt(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -422,6 +449,7 @@ def attr_gt(accessing_obj, accessed_obj, *args, **kwargs):
     return attr(accessing_obj, accessed_obj, *args, **{'compare': 'gt'})
 
 
+@lock_depends("attributes")
 def attr_ge(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -432,6 +460,7 @@ def attr_ge(accessing_obj, accessed_obj, *args, **kwargs):
     return attr(accessing_obj, accessed_obj, *args, **{'compare': 'ge'})
 
 
+@lock_depends("attributes")
 def attr_lt(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -442,6 +471,7 @@ def attr_lt(accessing_obj, accessed_obj, *args, **kwargs):
     return attr(accessing_obj, accessed_obj, *args, **{'compare': 'lt'})
 
 
+@lock_depends("attributes")
 def attr_le(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -452,6 +482,7 @@ def attr_le(accessing_obj, accessed_obj, *args, **kwargs):
     return attr(accessing_obj, accessed_obj, *args, **{'compare': 'le'})
 
 
+@lock_depends("attributes")
 def attr_ne(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -461,6 +492,7 @@ def attr_ne(accessing_obj, accessed_obj, *args, **kwargs):
     """
     return attr(accessing_obj, accessed_obj, *args, **{'compare': 'ne'})
 
+@lock_depends("tags")
 def tag(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -478,6 +510,7 @@ def tag(accessing_obj, accessed_obj, *args, **kwargs):
     category = args[1] if len(args) > 1 else None
     return accessing_obj.tags.get(tagkey, category=category)
 
+@lock_depends("tags")
 def objtag(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Usage:
@@ -551,6 +584,7 @@ def holds(accessing_obj, accessed_obj, *args, **kwargs):
                 return True
 
 
+@lock_depends()
 def superuser(*args, **kwargs):
     """
     Only accepts an accesing_obj that is superuser (e.g. user #1)
@@ -571,6 +605,7 @@ def has_player(accessing_obj, accessed_obj, *args, **kwargs):
     """
     return hasattr(accessing_obj, "has_player") and accessing_obj.has_player
 
+@lock_depends()
 def serversetting(accessing_obj, accessed_obj, *args, **kwargs):
     """
     Only returns true if the Evennia settings exists, alternatively has
@@ -108,11 +108,14 @@ from builtins import object
 
 import re
 import inspect
+from collections import defaultdict
+from time import time
 from django.conf import settings
 from evennia.utils import logger, utils
 from django.utils.translation import ugettext as _
 
-__all__ = ("LockHandler", "LockException")
+__all__ = ("LockHandler", "LockException", "lock_depends",
+           "invalidate_lock_cache", "clear_lock_cache")
 
 WARNING_LOG = "lockwarnings.log"
 
@@ -142,6 +145,104 @@ def _cache_lockfuncs():
     for modulepath in settings.LOCK_FUNC_MODULES:
         _LOCKFUNCS.update(utils.callables_from_module(modulepath))
 
+#
+# Lock result cache
+#
+# This is only active if settings.LOCK_CACHE_TIMEOUT > 0. A lock result
+# is cached per (compiled lock, accessing_obj) and is valid until the
+# timeout, until the cache is cleared (the cmdhandler clears it after
+# every command) or until one of the lock's dependencies changes.
+# Only locks where all lock functions declare their dependencies
+# (using the lock_depends decorator) are cached.
+#
+
+_LOCK_CACHE = {}
+_LOCK_CACHE_TIMEOUT = settings.LOCK_CACHE_TIMEOUT
+_LOCK_CACHE_MAXSIZE = 10000
+_LOCK_DEPENDENCY_VERSIONS = defaultdict(int)
+
+
+def lock_depends(*dependencies):
+    """
+    Decorator for lock functions, declaring which kinds of data the
+    result of the lock function depends on. This makes results of locks
+    using the function cacheable when `settings.LOCK_CACHE_TIMEOUT` is
+    set. Lock functions without this decorator are never cached.
+
+    Args:
+        dependencies (str): Zero or more of `"permissions"`, `"tags"`,
+            `"aliases"` and `"attributes"`. A lock function giving the
+            same result every time for the same objects should declare
+            no dependencies.
+
+    Example:
+        ```python
+        @lock_depends("tags")
+        def has_tag(accessing_obj, accessed_obj, *args, **kwargs):
+            return accessing_obj.tags.get(args[0])
+        ```
+
+    """
+    def decorator(func):
+        func.lock_dependencies = frozenset(dependencies)
+        return func
+    return decorator
+
+
+def invalidate_lock_cache(dependency):
+    """
+    Invalidate all cached lock results depending on a given kind of
+    data. This is called automatically by the Tag- and
+    AttributeHandlers when they change.
+
+    Args:
+        dependency (str): The kind of data that changed, such as
+            `"permissions"` or `"attributes"`.
+
+    """
+    _LOCK_DEPENDENCY_VERSIONS[dependency] += 1
+
+
+def clear_lock_cache():
+    """
+    Remove all cached lock results.
+
+    """
+    _LOCK_CACHE.clear()
+
+
+def _cached_check(lock, accessing_obj, accessed_obj):
+    """
+    Check a compiled lock, using the lock cache.
+
+    Args:
+        lock (callable): A cacheable lock, as created by `_compile_lock`.
+        accessing_obj (object): The object seeking access.
+        accessed_obj (object): The object the lock is defined on.
+
+    Returns:
+        result (bool): The result of the lock.
+
+    """
+    versions = tuple(_LOCK_DEPENDENCY_VERSIONS[dep] for dep in lock.dependencies)
+    now = time()
+    key = (lock, accessing_obj)
+    try:
+        result, expires, cached_versions = _LOCK_CACHE[key]
+        if expires > now and cached_versions == versions:
+            return result
+    except KeyError:
+        pass
+    except TypeError:
+        # accessing_obj is not hashable (such as unsaved database objects)
+        return lock(accessing_obj, accessed_obj)
+    result = lock(accessing_obj, accessed_obj)
+    if len(_LOCK_CACHE) >= _LOCK_CACHE_MAXSIZE:
+        _LOCK_CACHE.clear()
+    _LOCK_CACHE[key] = (result, now + _LOCK_CACHE_TIMEOUT, versions)
+    return result
+
+
 #
 # pre-compiled regular expressions
 #
@@ -151,6 +252,88 @@ _RE_SEPS = re.compile(r"(?<=[ )])AND(?=\s)|(?<=[ )])OR(?=\s)|(?<=[ )])NOT(?=\s)"
 _RE_OK = re.compile(r"%s|and|or|not")
 
 
+#
+# Lock compilation
+#
+
+def _compile_lock(tokens, lock_funcs):
+    """
+    Compile a lock definition into a function evaluating it.
+
+    Args:
+        tokens (list): The lock definition's separators and
+            lock-function placeholders, like `["%s", "and", "not", "%s"]`.
+            Each `%s` stands for the next lock function in `lock_funcs`.
+        lock_funcs (tuple): Tuples `(func, args, kwargs)` for every
+            lock function in the definition, in order.
+
+    Returns:
+        lock (callable): A function `lock(accessing_obj, accessed_obj)`
+            returning the boolean result of the lock. `NOT` binds
+            tighter than `AND`, which binds tighter than `OR`. Evaluation
+            short-circuits, so lock functions are only called when their
+            result can still affect the outcome. Its `dependencies`
+            property is a tuple with the combined dependencies of the
+            lock functions (see `lock_depends`), or `None` if any of
+            them did not declare its dependencies.
+
+    Raises:
+        ValueError: If the tokens do not form a valid lock definition.
+
+    """
+    # the definition is stored as a sequence of OR'ed groups, each
+    # group being a sequence of AND'ed (negate, func, args, kwargs).
+    or_groups = []
+    and_group = []
+    negate = False
+    ifunc = 0
+    expect_operand = True
+    for token in tokens:
+        if expect_operand:
+            if token == "not":
+                negate = not negate
+            elif token == "%s":
+                func, args, kwargs = lock_funcs[ifunc]
+                and_group.append((negate, func, args, kwargs))
+                ifunc += 1
+                negate = False
+                expect_operand = False
+            else:
+                raise ValueError(token)
+        elif token == "and":
+            expect_operand = True
+        elif token == "or":
+            or_groups.append(tuple(and_group))
+            and_group = []
+            expect_operand = True
+        else:
+            raise ValueError(token)
+    if expect_operand or ifunc != len(lock_funcs):
+        raise ValueError("incomplete lock definition")
+    or_groups.append(tuple(and_group))
+    or_groups = tuple(or_groups)
+
+    def lock(accessing_obj, accessed_obj):
+        for and_group in or_groups:
+            for negate, func, args, kwargs in and_group:
+                if bool(func(accessing_obj, accessed_obj, *args, **kwargs)) is negate:
+                    # this group failed, try the next one
+                    break
+            else:
+                return True
+        return False
+
+    dependencies = set()
+    for func, _, _ in lock_funcs:
+        func_dependencies = getattr(func, "lock_dependencies", None)
+        if func_dependencies is None:
+            dependencies = None
+            break
+        dependencies.update(func_dependencies)
+    lock.dependencies = None if dependencies is None else tuple(sorted(dependencies))
+    return lock
+
+
 #
 #
 # Lock handler
@@ -236,9 +419,8 @@ class LockHandler(object):
             if len(lock_funcs) < nfuncs:
                 continue
             try:
-                # purge the eval string of any superfluous items, then test it
-                evalstring = " ".join(_RE_OK.findall(evalstring))
-                eval(evalstring % tuple(True for func in funclist), {}, {})
+                # purge the eval string of any superfluous items, then compile it
+                lock = _compile_lock(_RE_OK.findall(evalstring), tuple(lock_funcs))
             except Exception:
                 elist.append(_("Lock: definition '%s' has syntax errors.") % raw_lockstring)
                 continue
@@ -246,7 +428,7 @@ class LockHandler(object):
                 duplicates += 1
                 wlist.append(_("LockHandler on %(obj)s: access type '%(access_type)s' changed from '%(source)s' to '%(goal)s' " % \
                         {"obj":self.obj, "access_type":access_type, "source":locks[access_type][2], "goal":raw_lockstring}))
-            locks[access_type] = (evalstring, tuple(lock_funcs), raw_lockstring)
+            locks[access_type] = (lock, tuple(lock_funcs), raw_lockstring)
         if wlist:
             # a warning text was set, it's not an error, so only report
             logger.log_file("\n".join(wlist), WARNING_LOG)
@@ -430,17 +612,16 @@ class LockHandler(object):
 
             Parsing the lockstring, we (during cache) extract the valid
             lock functions and store their function objects in the right
-            order along with their args/kwargs. These are now executed in
-            sequence, creating a list of True/False values. This is put
-            into the evalstring, which is a string of AND/OR/NOT entries
-            separated by placeholders where each function result should
-            go. We just put those results in and evaluate the string to
-            get a final, combined True/False value for the lockstring.
+            order along with their args/kwargs. The AND/OR/NOT entries
+            separating them are compiled together with the functions into
+            a single callable. Calling it runs the lock functions in
+            order, stopping as soon as the combined True/False value for
+            the lockstring is known.
 
             The important bit with this solution is that the full
-            lockstring is never blindly evaluated, and thus there (should
-            be) no way to sneak in malign code in it. Only "safe" lock
-            functions (as defined by your settings) are executed.
+            lockstring is never evaluated, and thus there (should be) no
+            way to sneak in malign code in it. Only "safe" lock functions
+            (as defined by your settings) are executed.
 
         """
         try:
@@ -457,18 +638,16 @@ class LockHandler(object):
         # no superuser or bypass -> normal lock operation
         if access_type in self.locks:
             # we have a lock, test it.
-            evalstring, func_tup, raw_string = self.locks[access_type]
-            # execute all lock funcs in the correct order, producing a tuple of True/False results.
-            true_false = tuple(bool(tup[0](accessing_obj, self.obj, *tup[1], **tup[2])) for tup in func_tup)
-            # the True/False tuple goes into evalstring, which combines them
-            # with AND/OR/NOT in order to get the final result.
-            return eval(evalstring % true_false)
+            lock = self.locks[access_type][0]
+            if _LOCK_CACHE_TIMEOUT and lock.dependencies is not None:
+                return _cached_check(lock, accessing_obj, self.obj)
+            return lock(accessing_obj, self.obj)
         else:
             return default
 
     def _eval_access_type(self, accessing_obj, locks, access_type):
         """
-        Helper method for evaluating the access type using eval().
+        Helper method for evaluating the access type.
 
         Args:
             accessing_obj (object): Object seeking access.
@@ -476,10 +655,7 @@ class LockHandler(object):
             access_type (str): An access-type key to evaluate.
 
         """
-        evalstring, func_tup, raw_string = locks[access_type]
-        true_false = tuple(tup[0](accessing_obj, self.obj, *tup[1], **tup[2])
-                           for tup in func_tup)
-        return eval(evalstring % true_false)
+        return locks[access_type][0](accessing_obj, self.obj)
 
     def check_lockstring(self, accessing_obj, lockstring, no_superuser_bypass=False,
                          default=False, access_type=None):
@@ -53,3 +53,54 @@ class TestLockfuncs(EvenniaTest):
         self.assertEquals(False, lockfuncs.attr_lt(self.obj2, self.obj1, 'testattr', '45'))
         self.assertEquals(True, lockfuncs.attr_le(self.obj2, self.obj1, 'testattr', '45'))
         self.assertEquals(False, lockfuncs.attr_ne(self.obj2, self.obj1, 'testattr', '45'))
+
+
+class TestLockCompile(TestCase):
+    def testrun(self):
+        from evennia.locks.lockhandler import _compile_lock
+        called = []
+        def _true(*args):
+            called.append(True)
+            return True
+        def _false(*args):
+            called.append(False)
+            return False
+        true, false = (_true, (), {}), (_false, (), {})
+        self.assertEquals(True, _compile_lock(["%s", "or", "%s", "and", "%s"], (true, false, false))(None, None))
+        # short-circuits after the first OR'ed group passed
+        self.assertEquals([True], called)
+        self.assertEquals(False, _compile_lock(["not", "%s", "or", "%s", "and", "%s"], (true, true, false))(None, None))
+        self.assertEquals(True, _compile_lock(["not", "not", "%s", "and", "not", "%s"], (true, false))(None, None))
+        self.assertRaises(ValueError, _compile_lock, ["%s", "and"], (true,))
+        self.assertRaises(ValueError, _compile_lock, ["%s", "%s"], (true, true))
+
+
+class TestLockCache(EvenniaTest):
+    def setUp(self):
+        super(TestLockCache, self).setUp()
+        from evennia.locks import lockhandler
+        self.lockhandler = lockhandler
+        self.old_timeout = lockhandler._LOCK_CACHE_TIMEOUT
+        lockhandler._LOCK_CACHE_TIMEOUT = 60
+        lockhandler.clear_lock_cache()
+
+    def tearDown(self):
+        self.lockhandler._LOCK_CACHE_TIMEOUT = self.old_timeout
+        self.lockhandler.clear_lock_cache()
+        super(TestLockCache, self).tearDown()
+
+    def testrun(self):
+        self.obj1.locks.add("edit:perm(Wizards);get:tag(strong) and attr(can_lift);enter:inside()")
+        self.assertEquals(False, self.obj1.locks.check(self.obj2, 'edit'))
+        self.assertEquals(1, len(self.lockhandler._LOCK_CACHE))
+        self.obj2.permissions.add('Wizards')
+        self.assertEquals(True, self.obj1.locks.check(self.obj2, 'edit'))
+        self.assertEquals(False, self.obj1.locks.check(self.obj2, 'get'))
+        self.obj2.tags.add("strong")
+        self.obj2.db.can_lift = True
+        self.assertEquals(True, self.obj1.locks.check(self.obj2, 'get'))
+        # inside() does not declare its dependencies so is never cached
+        self.assertEquals(False, self.obj1.locks.check(self.obj2, 'enter'))
+        self.assertEquals(2, len(self.lockhandler._LOCK_CACHE))
+        self.lockhandler.clear_lock_cache()
+        self.assertEquals(0, len(self.lockhandler._LOCK_CACHE))
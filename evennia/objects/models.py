@@ -24,6 +24,44 @@ from evennia.objects.manager import ObjectDBManager
 from evennia.utils import logger
 from evennia.utils.utils import (make_iter, dbref, lazy_property)
 
+# delayed import
+_DefaultObject = None
+# caches if a given class overloads the at_cmdset_get hook
+_AT_CMDSET_GET_OVERLOADS = {}
+
+
+def _has_cmdsets(obj):
+    """
+    Check if an object may contribute cmdsets to the cmdhandler when
+    it is present in a location.
+
+    Args:
+        obj (Object): The object to check.
+
+    Returns:
+        result (bool): `True` if the object has a non-empty cmdset stack or
+            has a custom `at_cmdset_get` hook (which may add cmdsets
+            on the fly, like Exits do).
+
+    """
+    global _DefaultObject
+    if not _DefaultObject:
+        from evennia.objects.objects import DefaultObject as _DefaultObject
+    cls = obj.__class__
+    overloaded = _AT_CMDSET_GET_OVERLOADS.get(cls)
+    if overloaded is None:
+        at_cmdset_get = getattr(cls, "at_cmdset_get", None)
+        overloaded = getattr(at_cmdset_get, "__func__", None) is not \
+                _DefaultObject.at_cmdset_get.__func__
+        _AT_CMDSET_GET_OVERLOADS[cls] = overloaded
+    if overloaded:
+        return True
+    cmdsethandler = obj.__dict__.get("cmdset")
+    if cmdsethandler:
+        return any(cmdset.key != "_EMPTY_CMDSET" for cmdset in cmdsethandler.cmdset_stack)
+    # cmdset handler not yet loaded; only permanent cmdsets can exist
+    return any(obj.cmdset_storage)
+
 
 class ContentsHandler(object):
     """
@@ -31,6 +69,9 @@ class ContentsHandler(object):
     lookups (this is done very often due to cmdhandler needing to look
     for object-cmdsets). It is stored on the 'contents_cache' property
     of the ObjectDB.
+
+    The handler also tracks which of the contents may contribute
+    cmdsets, so the cmdhandler does not have to check them all.
     """
     def __init__(self, obj):
         """
@@ -43,6 +84,7 @@ class ContentsHandler(object):
         """
         self.obj = obj
         self._pkcache = {}
+        self._cmdset_pkcache = {}
         self._idcache = obj.__class__.__instance_cache__
         self.init()
 
@@ -51,24 +93,26 @@ class ContentsHandler(object):
         Re-initialize the content cache
 
         """
-        self._pkcache.update(dict((obj.pk, None) for obj in
-                            ObjectDB.objects.filter(db_location=self.obj) if obj.pk))
+        objects = [obj for obj in ObjectDB.objects.filter(db_location=self.obj) if obj.pk]
+        self._pkcache.update(dict((obj.pk, None) for obj in objects))
+        self._cmdset_pkcache.update(dict((obj.pk, None) for obj in objects if _has_cmdsets(obj)))
 
-    def get(self, exclude=None):
+    def _get_from_pks(self, pkcache, exclude=None):
         """
-        Return the contents of the cache.
+        Get objects from the idmapper cache.
 
         Args:
+            pkcache (dict): The cache with the pks to get.
             exclude (Object or list of Object): object(s) to ignore
 
         Returns:
-            objects (list): the Objects inside this location
+            objects (list): The Objects matching the pks.
 
         """
         if exclude:
-            pks = [pk for pk in self._pkcache if pk not in [excl.pk for excl in make_iter(exclude)]]
+            pks = [pk for pk in pkcache if pk not in [excl.pk for excl in make_iter(exclude)]]
         else:
-            pks = self._pkcache
+            pks = pkcache
         try:
             return [self._idcache[pk] for pk in pks]
         except KeyError:
@@ -80,7 +124,36 @@ class ContentsHandler(object):
             except KeyError:
                 # this means an actual failure of caching. Return real database match.
                 logger.log_err("contents cache failed for %s." % (self.obj.key))
-                return list(ObjectDB.objects.filter(db_location=self.obj))
+                return [obj for obj in ObjectDB.objects.filter(db_location=self.obj)
+                        if obj.pk in pkcache]
+
+    def get(self, exclude=None):
+        """
+        Return the contents of the cache.
+
+        Args:
+            exclude (Object or list of Object): object(s) to ignore
+
+        Returns:
+            objects (list): the Objects inside this location
+
+        """
+        return self._get_from_pks(self._pkcache, exclude=exclude)
+
+    def get_with_cmdsets(self, exclude=None):
+        """
+        Return the contents that may contribute cmdsets.
+
+        Args:
+            exclude (Object or list of Object): object(s) to ignore
+
+        Returns:
+            objects (list): the Objects inside this location that
+                either have a non-empty cmdset stack or a custom
+                `at_cmdset_get` hook.
+
+        """
+        return self._get_from_pks(self._cmdset_pkcache, exclude=exclude)
 
     def add(self, obj):
         """
@@ -91,6 +164,7 @@ class ContentsHandler(object):
 
         """
         self._pkcache[obj.pk] = None
+        self.update_cmdsets(obj)
 
     def remove(self, obj):
         """
@@ -101,6 +175,22 @@ class ContentsHandler(object):
 
         """
         self._pkcache.pop(obj.pk, None)
+        self._cmdset_pkcache.pop(obj.pk, None)
+
+    def update_cmdsets(self, obj):
+        """
+        Re-check if an object in this location may contribute
+        cmdsets. This is called by the object's CmdSetHandler
+        whenever its cmdset stack changes.
+
+        Args:
+            obj (Object): object to update
+
+        """
+        if obj.pk in self._pkcache and _has_cmdsets(obj):
+            self._cmdset_pkcache[obj.pk] = None
+        else:
+            self._cmdset_pkcache.pop(obj.pk, None)
 
     def clear(self):
         """
@@ -108,6 +198,7 @@ class ContentsHandler(object):
 
         """
         self._pkcache = {}
+        self._cmdset_pkcache = {}
         self.init()
 
 #------------------------------------------------------------
@@ -211,12 +302,12 @@ class ObjectDB(TypedObject):
     def __cmdset_storage_set(self, value):
         "setter"
         self.db_cmdset_storage =  ",".join(str(val).strip() for val in make_iter(value))
-        self.save(update_fields=["db_cmdset_storage"])
+        self._save_field("db_cmdset_storage")
 
     def __cmdset_storage_del(self):
         "deleter"
         self.db_cmdset_storage = None
-        self.save(update_fields=["db_cmdset_storage"])
+        self._save_field("db_cmdset_storage")
     cmdset_storage = property(__cmdset_storage_get, __cmdset_storage_set, __cmdset_storage_del)
 
     # location getsetter
@@ -254,15 +345,13 @@ class ObjectDB(TypedObject):
 
             old_location = self.db_location
 
-            # this is checked in _db_db_location_post_save below
-            self._safe_contents_update = True
-
             # actually set the field (this will error if location is invalid)
             self.db_location = location
-            self.save(update_fields=["db_location"])
 
-            # remove the safe flag
-            del self._safe_contents_update
+            # this is checked (and removed) in at_db_location_postsave
+            # below, whenever the (maybe delayed) save happens
+            self._safe_contents_update = True
+            self._save_field("db_location")
 
             # update the contents cache
             if old_location:
@@ -280,7 +369,7 @@ class ObjectDB(TypedObject):
     def __location_del(self):
         "Cleanly delete the location reference"
         self.db_location = None
-        self.save(update_fields=["db_location"])
+        self._save_field("db_location")
     location = property(__location_get, __location_set, __location_del)
 
     def at_db_location_postsave(self, new):
@@ -295,7 +384,7 @@ class ObjectDB(TypedObject):
             new (bool): Set if this location has not yet been saved before.
 
         """
-        if not hasattr(self, "_safe_contents_update"):
+        if not self.__dict__.pop("_safe_contents_update", False):
             # changed/set outside of the location handler
             if new:
                 # if new, there is no previous location to worry about
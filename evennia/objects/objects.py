@@ -576,6 +576,8 @@ class DefaultObject(with_metaclass(TypeclassBase, ObjectDB)):
         if exclude:
             exclude = make_iter(exclude)
             contents = [obj for obj in contents if obj not in exclude]
+        # load the receivers' Attributes in one go, for use by their msg hooks
+        ObjectDB.objects.prefetch_attributes(contents)
         for obj in contents:
             if mapping:
                 substitutions = {t: sub.get_display_name(obj)
@@ -1324,9 +1326,10 @@ class DefaultObject(with_metaclass(TypeclassBase, ObjectDB)):
         """
         if not looker:
             return
-        # get and identify all objects
-        visible = (con for con in self.contents if con != looker and
-                                                    con.access(looker, "view"))
+        # get and identify all objects, loading their Attributes in one go
+        contents = ObjectDB.objects.prefetch_attributes(self.contents)
+        visible = (con for con in contents if con != looker and
+                                              con.access(looker, "view"))
         exits, users, things = [], [], []
         for con in visible:
             key = con.get_display_name(looker)
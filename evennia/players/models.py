@@ -158,7 +158,7 @@ class PlayerDB(TypedObject, AbstractUser):
 
     def __username_set(self, value):
         self.username = value
-        self.save(update_fields=["username"])
+        self._save_field("username")
 
     def __username_del(self):
         del self.username
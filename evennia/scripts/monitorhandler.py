@@ -83,6 +83,20 @@ class MonitorHandler(object):
         # make sure to clean data from database
         ServerConfig.objects.conf(key=self.savekey, delete=True)
 
+    def has_monitors(self, obj):
+        """
+        Check if there are any monitors on an object's fields. This
+        is called on every save, so it should be fast.
+
+        Args:
+            obj (Object): The object to check.
+
+        Returns:
+            monitored (bool): If there are monitors on `obj`.
+
+        """
+        return bool(self.monitors) and obj in self.monitors
+
     def at_update(self, obj, fieldname):
         """
         Called by the field as it saves.
@@ -3,6 +3,7 @@ from unittest import TestCase
 from evennia.scripts.models import ScriptDB, ObjectDoesNotExist
 from evennia.utils.create import create_script
 from evennia.scripts.scripts import DoNothing
+from evennia.scripts.monitorhandler import MonitorHandler
 
 
 class TestScriptDB(TestCase):
@@ -40,3 +41,18 @@ class TestScriptDB(TestCase):
         "Can deleted scripts be said to be valid?"
         self.scr.delete()
         self.assertFalse(self.scr.is_valid())  # assertRaises? See issue #509
+
+
+class TestMonitorHandler(TestCase):
+    "Check the save-time monitor lookup"
+    def setUp(self):
+        self.scr = create_script(DoNothing)
+        self.handler = MonitorHandler()
+
+    def tearDown(self):
+        self.scr.delete()
+
+    def test_has_monitors(self):
+        self.assertFalse(self.handler.has_monitors(self.scr))
+        self.handler.monitors[self.scr]["db_key"]["test"] = (lambda **kwargs: None, False, {})
+        self.assertTrue(self.handler.has_monitors(self.scr))
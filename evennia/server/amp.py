@@ -19,6 +19,7 @@ from __future__ import print_function
 
 # imports needed on both server and portal side
 import os
+import struct
 from time import time
 from collections import defaultdict
 from itertools import count
@@ -28,10 +29,16 @@ try:
 except ImportError:
     import pickle
 from twisted.protocols import amp
-from twisted.internet import protocol
-from twisted.internet.defer import Deferred
+from twisted.internet import protocol, reactor
+from twisted.internet.defer import Deferred, succeed
+from django.conf import settings
 from evennia.utils import logger
-from evennia.utils.utils import to_str, variable_from_module
+from evennia.utils.utils import to_str, variable_from_module, make_iter, class_from_module
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 class DummySession(object):
     sessid = 0
@@ -51,17 +58,57 @@ SSYNC = chr(8)        # server session sync
 SCONN = chr(11)        # server creating new connection (for irc bots and etc)
 PCONNSYNC = chr(12)   # portal post-syncing a session
 PDISCONNALL = chr(13) # portal session disconnect all
+PCONNBATCH = chr(14)  # portal session connect, many sessions at once
 AMP_MAXLEN = amp.MAX_VALUE_LENGTH    # max allowed data length in AMP protocol (cannot be changed)
 
 BATCH_RATE = 250    # max commands/sec before switching to batch-sending
 BATCH_TIMEOUT = 0.5 # how often to poll to empty batch queue, in seconds
+BATCH_MAXSIZE = 500 # max messages per batch before it is sent immediately
+
+_AMP_BATCH_SEND = settings.AMP_BATCH_SEND
+_AMP_COMPRESS_THRESHOLD = settings.AMP_COMPRESS_THRESHOLD
+_AMP_COMPRESS_LEVEL = settings.AMP_COMPRESS_LEVEL
+
+# header byte marking if data on the wire is compressed or not
+_RAW = chr(0)
+_ZLIB = chr(1)
+
+# compression statistics, see get_compression_stats
+_COMPRESS_STATS = defaultdict(float)
 
 # buffers
-_SENDBATCH = defaultdict(list)
-_MSGBUFFER = defaultdict(list)
+_MSGBUFFER = defaultdict(list)  # {batch command: [(sessid, kwargs), ...]}
 
 import zlib
 
+def get_compression_stats(reset=False):
+    """
+    Get statistics on the data sent and received over AMP by this
+    process.
+
+    Args:
+        reset (bool, optional): Zero the counters after reading them.
+
+    Returns:
+        stats (dict): A dict with keys
+            - `bytes_out`: Data bytes to send, before compression.
+            - `bytes_out_wire`: Bytes actually sent, after compression.
+            - `bytes_in_wire`: Bytes received, before decompression.
+            - `bytes_in`: Data bytes received, after decompression.
+            - `compressed`: Number of sends that were compressed.
+            - `uncompressed`: Number of sends that were not.
+            - `compress_time`: Seconds spent compressing.
+            - `decompress_time`: Seconds spent decompressing.
+
+    """
+    stats = dict((key, _COMPRESS_STATS[key]) for key in (
+        "bytes_out", "bytes_out_wire", "bytes_in_wire", "bytes_in",
+        "compressed", "uncompressed", "compress_time", "decompress_time"))
+    if reset:
+        _COMPRESS_STATS.clear()
+    return stats
+
+
 def get_restart_mode(restart_file):
     """
     Parse the server/portal restart status
@@ -213,7 +260,8 @@ class Compressed(amp.String):
     def fromBox(self, name, strings, objects, proto):
         """
         Converts from box representation to python. We
-        group very long data into batches.
+        group very long data into batches, then decompress
+        the joined data.
         """
         value = StringIO()
         value.write(strings.get(name))
@@ -223,14 +271,14 @@ class Compressed(amp.String):
             if chunk is None:
                 break
             value.write(chunk)
-        objects[name] = value.getvalue()
+        objects[name] = self.fromString(value.getvalue())
 
     def toBox(self, name, strings, objects, proto):
         """
-        Convert from data to box. We handled too-long
-        batched data and put it together here.
+        Convert from data to box. The data is compressed
+        first, then too-long data is split into batches.
         """
-        value = StringIO(objects[name])
+        value = StringIO(self.toString(objects[name]))
         strings[name] = value.read(AMP_MAXLEN)
         for counter in count(2):
             chunk = value.read(AMP_MAXLEN)
@@ -240,15 +288,37 @@ class Compressed(amp.String):
 
     def toString(self, inObject):
         """
-        Convert to send on the wire, with compression.
+        Convert to send on the wire, with compression. Data shorter
+        than `AMP_COMPRESS_THRESHOLD`, or which does not get smaller
+        when compressed, is sent as-is. A header byte tells the
+        receiving side which it is.
         """
-        return zlib.compress(inObject, 9)
+        _COMPRESS_STATS["bytes_out"] += len(inObject)
+        if len(inObject) >= _AMP_COMPRESS_THRESHOLD:
+            t0 = time()
+            outString = zlib.compress(inObject, _AMP_COMPRESS_LEVEL)
+            _COMPRESS_STATS["compress_time"] += time() - t0
+            if len(outString) < len(inObject):
+                _COMPRESS_STATS["compressed"] += 1
+                _COMPRESS_STATS["bytes_out_wire"] += len(outString) + 1
+                return _ZLIB + outString
+        _COMPRESS_STATS["uncompressed"] += 1
+        _COMPRESS_STATS["bytes_out_wire"] += len(inObject) + 1
+        return _RAW + inObject
 
     def fromString(self, inString):
         """
-        Convert (decompress) from the wire to Python.
+        Convert (decompress if needed) from the wire to Python.
         """
-        return zlib.decompress(inString)
+        _COMPRESS_STATS["bytes_in_wire"] += len(inString)
+        if inString[:1] == _ZLIB:
+            t0 = time()
+            outString = zlib.decompress(inString[1:])
+            _COMPRESS_STATS["decompress_time"] += time() - t0
+        else:
+            outString = inString[1:]
+        _COMPRESS_STATS["bytes_in"] += len(outString)
+        return outString
 
 
 class MsgPortal2Server(amp.Command):
@@ -273,6 +343,54 @@ class MsgServer2Portal(amp.Command):
     response = []
 
 
+class MsgServer2PortalMulti(amp.Command):
+    """
+    Message Server -> many Portal sessions
+
+    This sends the same message to many sessions, such as for a
+    broadcast, as a tuple ([sessid, ...], kwargs). The payload is
+    only sent once, no matter how many sessions receive it.
+
+    """
+    key = "MsgServer2PortalMulti"
+    arguments = [('packed_data', Compressed())]
+    errors = {Exception: 'EXCEPTION'}
+    response = []
+
+
+class MsgPortal2ServerBatch(amp.Command):
+    """
+    Many messages Portal -> Server
+
+    This sends all messages buffered during a reactor tick as a list
+    of (sessid, kwargs) tuples. It requires no answer, so no
+    Deferred is created for it on the sending side.
+
+    """
+    key = "MsgPortal2ServerBatch"
+    arguments = [('packed_data', Compressed())]
+    errors = {Exception: 'EXCEPTION'}
+    response = []
+    requiresAnswer = False
+
+
+class MsgServer2PortalBatch(amp.Command):
+    """
+    Many messages Server -> Portal
+
+    This sends all messages buffered during a reactor tick as a list
+    of (sessid, kwargs) tuples. The sessid may also be a list of
+    sessids, for messages going to many sessions. It requires no
+    answer, so no Deferred is created for it on the sending side.
+
+    """
+    key = "MsgServer2PortalBatch"
+    arguments = [('packed_data', Compressed())]
+    errors = {Exception: 'EXCEPTION'}
+    response = []
+    requiresAnswer = False
+
+
 class AdminPortal2Server(amp.Command):
     """
     Administration Portal -> Server
@@ -318,12 +436,274 @@ class FunctionCall(amp.Command):
     response = [('result', amp.String())]
 
 
+# the message types to buffer when batch-sending, and the command
+# used to send their batch
+_BATCH_COMMANDS = {MsgPortal2Server: MsgPortal2ServerBatch,
+                   MsgServer2Portal: MsgServer2PortalBatch,
+                   MsgServer2PortalMulti: MsgServer2PortalBatch}
+# the message types for which consecutive messages with the same
+# payload are merged into one multi-session message when batching
+_MULTI_COMMANDS = (MsgServer2Portal, MsgServer2PortalMulti)
+# the message types using the AMP_CODEC (the others use pickle)
+_CODEC_COMMANDS = (MsgPortal2Server, MsgServer2Portal, MsgServer2PortalMulti)
+
 # Helper functions for pickling.
 
 dumps = lambda data: to_str(pickle.dumps(to_str(data), pickle.HIGHEST_PROTOCOL))
 loads = lambda data: pickle.loads(to_str(data))
 
 
+#------------------------------------------------------------
+# Message codecs
+#------------------------------------------------------------
+
+# The (sessid, kwargs) payloads of the Msg* commands have already been
+# cleaned by clean_senddata into strings, numbers, lists and dicts, so
+# they don't need the full power (and risk) of pickle. The codec to use
+# is set by settings.AMP_CODEC. Every encoded message starts with the
+# tag of its codec, so it is always decoded with the right one.
+
+class PickleCodec(object):
+    """
+    Encodes messages as pickles. This can send any picklable data but
+    also means unpickling whatever the other side sends, so it is only
+    accepted when it is the codec set by `settings.AMP_CODEC`.
+
+    """
+    # change this if the format changes, keeping the old one readable
+    tag = "P"
+
+    def encode(self, data):
+        """
+        Encode data to send on the wire.
+
+        Args:
+            data (any): The data to encode.
+
+        Returns:
+            string (str): The encoded data.
+
+        """
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, string):
+        """
+        Decode data created with `encode`.
+
+        Args:
+            string (str): The encoded data.
+
+        Returns:
+            data (any): The decoded data.
+
+        """
+        return pickle.loads(string)
+
+
+_STRUCT_INT = struct.Struct(">q")
+_STRUCT_FLOAT = struct.Struct(">d")
+_STRUCT_LEN = struct.Struct(">I")
+_MININT, _MAXINT = -2 ** 63, 2 ** 63 - 1
+
+
+class BinaryCodec(PickleCodec):
+    """
+    A compact, length-prefixed binary format in pure Python. Each value
+    is a one-character type code followed by its data. Tuples are sent
+    as lists, and types not supported (which should not survive
+    clean_senddata) are sent as their string representation.
+
+    """
+    tag = "B"
+
+    def _encode(self, data, out):
+        "Append encoded data to the out list."
+        dtype = type(data)
+        if dtype == str:
+            out.append("s" + _STRUCT_LEN.pack(len(data)) + data)
+        elif dtype == unicode:
+            data = data.encode("utf-8")
+            out.append("u" + _STRUCT_LEN.pack(len(data)) + data)
+        elif dtype in (list, tuple):
+            out.append("l" + _STRUCT_LEN.pack(len(data)))
+            for item in data:
+                self._encode(item, out)
+        elif dtype == dict:
+            out.append("d" + _STRUCT_LEN.pack(len(data)))
+            for key, value in data.iteritems():
+                self._encode(key, out)
+                self._encode(value, out)
+        elif dtype == bool:
+            out.append("T" if data else "F")
+        elif dtype in (int, long) and _MININT <= data <= _MAXINT:
+            out.append("i" + _STRUCT_INT.pack(data))
+        elif dtype in (int, long):
+            data = str(data)
+            out.append("I" + _STRUCT_LEN.pack(len(data)) + data)
+        elif dtype == float:
+            out.append("f" + _STRUCT_FLOAT.pack(data))
+        elif data is None:
+            out.append("N")
+        else:
+            self._encode(to_str(data, force_string=True), out)
+
+    def _decode(self, string, pos):
+        "Decode the value at pos. Returns (value, next pos)."
+        code = string[pos]
+        pos += 1
+        if code in "suI":
+            length = _STRUCT_LEN.unpack_from(string, pos)[0]
+            pos += 4
+            data = string[pos:pos + length]
+            if code == "u":
+                data = data.decode("utf-8")
+            elif code == "I":
+                data = long(data)
+            return data, pos + length
+        elif code == "l":
+            length = _STRUCT_LEN.unpack_from(string, pos)[0]
+            pos += 4
+            data = []
+            for _ in xrange(length):
+                item, pos = self._decode(string, pos)
+                data.append(item)
+            return data, pos
+        elif code == "d":
+            length = _STRUCT_LEN.unpack_from(string, pos)[0]
+            pos += 4
+            data = {}
+            for _ in xrange(length):
+                key, pos = self._decode(string, pos)
+                data[key], pos = self._decode(string, pos)
+            return data, pos
+        elif code == "i":
+            return _STRUCT_INT.unpack_from(string, pos)[0], pos + 8
+        elif code == "f":
+            return _STRUCT_FLOAT.unpack_from(string, pos)[0], pos + 8
+        elif code == "T":
+            return True, pos
+        elif code == "F":
+            return False, pos
+        elif code == "N":
+            return None, pos
+        raise ValueError("Unknown type code %r in AMP message." % code)
+
+    def encode(self, data):
+        out = []
+        self._encode(data, out)
+        return "".join(out)
+
+    def decode(self, string):
+        return self._decode(string, 0)[0]
+
+
+class MsgpackCodec(PickleCodec):
+    """
+    Encodes messages with msgpack. This is faster than the other codecs
+    but requires the msgpack package (`pip install "msgpack<1.0"` for
+    Python 2). If it is not installed, BinaryCodec is used instead.
+
+    """
+    tag = "M"
+
+    def __init__(self):
+        if not msgpack:
+            raise ImportError("MsgpackCodec requires the msgpack package:\n"
+                              "    pip install \"msgpack<1.0\"")
+
+    def _default(self, item):
+        "Send unsupported types as strings, like BinaryCodec."
+        if isinstance(item, (int, long)):
+            # don't turn integers msgpack can't hold into strings
+            raise OverflowError("Integer %i is too large for msgpack." % item)
+        return to_str(item, force_string=True)
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True, default=self._default)
+
+    def decode(self, string):
+        return msgpack.unpackb(string, raw=False, use_list=True)
+
+
+# {tag: codec} for all codecs able to read messages
+_CODECS = {}
+_CODEC = None
+
+
+def _get_codec(tag=None):
+    """
+    Get a codec instance.
+
+    Args:
+        tag (str, optional): Get the codec with this tag. If not given,
+            get the codec set by `settings.AMP_CODEC`.
+
+    Returns:
+        codec (PickleCodec): The codec.
+
+    Raises:
+        ValueError: If no codec with this tag is available.
+
+    """
+    global _CODEC
+    if not _CODEC:
+        _CODECS[BinaryCodec.tag] = BinaryCodec()
+        if msgpack:
+            _CODECS[MsgpackCodec.tag] = MsgpackCodec()
+        codec = class_from_module(settings.AMP_CODEC)
+        if codec == MsgpackCodec and not msgpack:
+            logger.log_info("AMP: msgpack is not installed, using BinaryCodec instead.")
+            codec = BinaryCodec
+        if codec.tag not in _CODECS or type(_CODECS[codec.tag]) != codec:
+            _CODECS[codec.tag] = codec()
+        _CODEC = _CODECS[codec.tag]
+    if tag is None:
+        return _CODEC
+    try:
+        return _CODECS[tag]
+    except KeyError:
+        raise ValueError("No AMP codec with tag '%s' is available to "
+                         "read this message." % tag)
+
+
+def encode_msg(data):
+    """
+    Encode message data with the current codec.
+
+    Args:
+        data (any): The data, usually a (sessid, kwargs) tuple or
+            a list of them.
+
+    Returns:
+        string (str): The encoded data, starting with the codec tag.
+
+    Notes:
+        Messages the codec can't send as-is (like integers beyond
+        64 bits for msgpack) are encoded with BinaryCodec instead.
+
+    """
+    codec = _get_codec()
+    try:
+        return codec.tag + codec.encode(data)
+    except OverflowError:
+        codec = _CODECS[BinaryCodec.tag]
+        return codec.tag + codec.encode(data)
+
+
+def decode_msg(string):
+    """
+    Decode message data created with `encode_msg`.
+
+    Args:
+        string (str): The encoded data.
+
+    Returns:
+        data (any): The decoded data. Tuples may come back as lists.
+
+    """
+    return _get_codec(string[:1]).decode(string[1:])
+
+
 #------------------------------------------------------------
 # Core AMP protocol for communication Server <-> Portal
 #------------------------------------------------------------
@@ -409,20 +789,82 @@ class AMPProtocol(amp.AMP):
 
         Args:
             command (AMP Command): A protocol send command.
-            sessid (int): A unique Session id.
+            sessid (int or list): A unique Session id, or a list of
+                them for a multi-session command.
 
         Returns:
             deferred (deferred or None): A deferred with an errback.
 
         Notes:
-            Data will be sent across the wire pickled as a tuple
-            (sessid, kwargs).
+            Data will be sent across the wire as a tuple (sessid,
+            kwargs), encoded with the AMP_CODEC for Msg* commands and
+            pickled for the others. If `settings.AMP_BATCH_SEND` is set,
+            messages are instead buffered and all messages from the same
+            reactor tick are sent together as a list of such tuples.
+            Other commands always flush the buffer first, so the
+            order of everything sent is kept. When batching, a
+            Server->Portal message with the same payload as the one
+            buffered just before it (like when a channel message
+            goes to all subscribers) is merged into that message, so
+            the payload is only sent once.
 
         """
+        if _AMP_BATCH_SEND and command in _BATCH_COMMANDS:
+            batch = _MSGBUFFER[_BATCH_COMMANDS[command]]
+            if command in _MULTI_COMMANDS and batch and batch[-1][1] == kwargs:
+                prev_sessid = batch[-1][0]
+                if not isinstance(prev_sessid, list):
+                    prev_sessid = [prev_sessid]
+                    batch[-1] = (prev_sessid, batch[-1][1])
+                prev_sessid.extend(make_iter(sessid))
+                return succeed(None)
+            batch.append((sessid, kwargs))
+            if len(batch) >= BATCH_MAXSIZE:
+                self.send_batch()
+            elif not self.send_task:
+                self.send_task = reactor.callLater(0, self.send_batch)
+            return succeed(None)
+        if _MSGBUFFER:
+            self.send_batch()
+        encode = encode_msg if command in _CODEC_COMMANDS else dumps
         return self.callRemote(command,
-                               packed_data=dumps((sessid, kwargs))
+                               packed_data=encode((sessid, kwargs))
                                ).addErrback(self.errback, command.key)
 
+    def send_batch(self):
+        """
+        Send all buffered messages across the wire, one batch command
+        per message type.
+
+        """
+        if self.send_task and self.send_task.active():
+            self.send_task.cancel()
+        self.send_task = None
+        for command, batch in list(_MSGBUFFER.items()):
+            del _MSGBUFFER[command]
+            try:
+                self.callRemote(command, packed_data=encode_msg(batch))
+            except Exception:
+                logger.log_trace("AMP Error for %s" % command.key)
+
+    def receive_batch(self, packed_data, receiver):
+        """
+        Unpack a batch of messages and hand them to the receiver in
+        the order they were sent.
+
+        Args:
+            packed_data (str): An encoded list of (sessid, kwargs).
+            receiver (callable): Called as `receiver(sessid, kwargs)`
+                for every message.
+
+        """
+        for sessid, kwargs in decode_msg(packed_data):
+            try:
+                receiver(sessid, kwargs)
+            except Exception:
+                # since batches are not answered, we must log errors here
+                logger.log_trace()
+
     # Message definition + helper methods to call/create each message type
 
     # Portal -> Server Msg
@@ -434,13 +876,38 @@ class AMPProtocol(amp.AMP):
         on the Server.
 
         Args:
-            packed_data (str): Data to receive (a pickled tuple (sessid,kwargs))
+            packed_data (str): Data to receive (an encoded tuple (sessid,kwargs))
+
+        """
+        self.server_receive_msg(*decode_msg(packed_data))
+        return {}
+
+    def server_receive_msg(self, sessid, kwargs):
+        """
+        Pass a message from the Portal on to the Session. This is
+        executed on the Server.
+
+        Args:
+            sessid (int): Unique Session id.
+            kwargs (dict): The message data.
 
         """
-        sessid, kwargs = loads(packed_data)
         session = self.factory.server.sessions.get(sessid, None)
         if session:
             self.factory.server.sessions.data_in(session, **kwargs)
+
+    @MsgPortal2ServerBatch.responder
+    def server_receive_msgportal2server_batch(self, packed_data):
+        """
+        Receives a batch of messages arriving to the server. This
+        method is executed on the Server.
+
+        Args:
+            packed_data (str): Data to receive (an encoded list of
+                (sessid, kwargs) tuples)
+
+        """
+        self.receive_batch(packed_data, self.server_receive_msg)
         return {}
 
     def send_MsgPortal2Server(self, session, **kwargs):
@@ -466,12 +933,70 @@ class AMPProtocol(amp.AMP):
         This method is executed on the Portal.
 
         Args:
-            packed_data (str): Pickled data (sessid, kwargs) coming over the wire.
+            packed_data (str): Encoded data (sessid, kwargs) coming over the wire.
         """
-        sessid, kwargs = loads(packed_data)
+        self.portal_receive_msg(*decode_msg(packed_data))
+        return {}
+
+    def portal_receive_msg(self, sessid, kwargs):
+        """
+        Pass a message from the Server on to the Session. This is
+        executed on the Portal.
+
+        Args:
+            sessid (int): Unique Session id.
+            kwargs (dict): The message data.
+
+        """
+        if isinstance(sessid, list):
+            self.portal_receive_multi(sessid, kwargs)
+            return
         session = self.factory.portal.sessions.get(sessid, None)
         if session:
             self.factory.portal.sessions.data_out(session, **kwargs)
+
+    def portal_receive_multi(self, sessids, kwargs):
+        """
+        Pass a message from the Server on to many Sessions. This is
+        executed on the Portal.
+
+        Args:
+            sessids (list): Unique Session ids.
+            kwargs (dict): The message data.
+
+        """
+        sessionhandler = self.factory.portal.sessions
+        sessions = [session for session in (sessionhandler.get(sessid) for sessid in sessids)
+                    if session]
+        if sessions:
+            sessionhandler.data_out_multi(sessions, **kwargs)
+
+    @MsgServer2PortalMulti.responder
+    def portal_receive_server2portal_multi(self, packed_data):
+        """
+        Receives a message to many sessions arriving to Portal from
+        Server. This method is executed on the Portal.
+
+        Args:
+            packed_data (str): Encoded data ([sessid, ...], kwargs)
+                coming over the wire.
+
+        """
+        self.portal_receive_multi(*decode_msg(packed_data))
+        return {}
+
+    @MsgServer2PortalBatch.responder
+    def portal_receive_server2portal_batch(self, packed_data):
+        """
+        Receives a batch of messages arriving to Portal from Server.
+        This method is executed on the Portal.
+
+        Args:
+            packed_data (str): Encoded list of (sessid, kwargs) tuples
+                coming over the wire.
+
+        """
+        self.receive_batch(packed_data, self.portal_receive_msg)
         return {}
 
 
@@ -487,6 +1012,19 @@ class AMPProtocol(amp.AMP):
         """
         return self.send_data(MsgServer2Portal, session.sessid, **kwargs)
 
+    def send_MsgServer2PortalMulti(self, sessions, **kwargs):
+        """
+        Access method - executed on the Server for sending the same
+            data to many sessions on the Portal.
+
+        Args:
+            sessions (list): Sessions to send to.
+            kwargs (any, optional): Extra data.
+
+        """
+        return self.send_data(MsgServer2PortalMulti,
+                              [session.sessid for session in sessions], **kwargs)
+
     # Server administration from the Portal side
     @AdminPortal2Server.responder
     def server_receive_adminportal2server(self, packed_data):
@@ -507,6 +1045,10 @@ class AMPProtocol(amp.AMP):
             # create a new session and sync it
             server_sessionhandler.portal_connect(kwargs.get("sessiondata"))
 
+        elif operation == PCONNBATCH:  # portal_session_connect, many sessions
+            # create many new sessions and sync them
+            server_sessionhandler.portal_connect_batch(kwargs.get("sessiondata"))
+
         elif operation == PCONNSYNC: #portal_session_sync
             server_sessionhandler.portal_session_sync(kwargs.get("sessiondata"))
 
@@ -659,6 +1201,8 @@ class AMPProtocol(amp.AMP):
             function call
 
         """
+        if _MSGBUFFER:
+            self.send_batch()
         return self.callRemote(FunctionCall,
                                module=modulepath,
                                function=functionname,
@@ -250,6 +250,23 @@ def get_inputfuncs(session, *args, **kwargs):
     session.msg(get_inputfuncs=inputfuncsdict)
 
 
+def output_paused(session, *args, **kwargs):
+    """
+    Sent by the Portal when the client doesn't receive output as fast
+    as it is sent (args[0] is True) and when it has caught up again
+    (args[0] is False). Output sent meanwhile is held back by the
+    Portal (see settings.PORTAL_OUTPUT_OVERFLOW_POLICY). Override
+    this inputfunc to have the game react, for example by not sending
+    channel spam to the session while it is paused.
+
+    Notes:
+        Since clients can send any inputfunc, this should only be
+        used as a hint.
+
+    """
+    session.protocol_flags["OUTPUT_PAUSED"] = bool(args and args[0])
+
+
 def login(session, *args, **kwargs):
     """
     Peform a login. This only works if session is currently not logged
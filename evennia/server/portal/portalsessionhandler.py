@@ -6,10 +6,12 @@ from __future__ import division
 
 from time import time
 from collections import deque
+from zope.interface import implementer
 from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
 from django.conf import settings
 from evennia.server.sessionhandler import SessionHandler, PCONN, PDISCONN, \
-                                          PCONNSYNC, PDISCONNALL
+                                          PCONNSYNC, PDISCONNALL, PCONNBATCH
 from evennia.utils.logger import log_trace
 
 # module import
@@ -18,16 +20,128 @@ _MOD_IMPORT = None
 # throttles
 _MAX_CONNECTION_RATE = float(settings.MAX_CONNECTION_RATE)
 _MAX_COMMAND_RATE = float(settings.MAX_COMMAND_RATE)
+_MAX_SESSION_COMMAND_RATE = float(settings.MAX_SESSION_COMMAND_RATE)
+_MAX_SESSION_COMMAND_BURST = float(settings.MAX_SESSION_COMMAND_BURST)
+_MAX_SESSION_COMMAND_QUEUE = settings.MAX_SESSION_COMMAND_QUEUE
 
 _MIN_TIME_BETWEEN_CONNECTS = 1.0 / float(settings.MAX_CONNECTION_RATE)
+_MAX_CONNECTION_BATCH = settings.MAX_CONNECTION_BATCH
+_CONNECTION_LATENCY_TARGET = settings.CONNECTION_LATENCY_TARGET
 _ERROR_COMMAND_OVERFLOW = settings.COMMAND_RATE_WARNING
 
 _CONNECTION_QUEUE = deque()
 
+# slow consumers
+_OUTPUT_HIGH_WATERMARK = settings.PORTAL_OUTPUT_HIGH_WATERMARK
+_OUTPUT_BACKLOG_SIZE = settings.PORTAL_OUTPUT_BACKLOG_SIZE
+_OUTPUT_OVERFLOW_POLICY = settings.PORTAL_OUTPUT_OVERFLOW_POLICY
+_OUTPUT_TRUNCATED = "[output truncated]"
+_OUTPUT_OVERFLOW_DISCONNECT = "Disconnected: Your client is not receiving data fast enough."
+
+
+def _copy_kwargs(kwargs):
+    """
+    Copy send-kwargs, so a protocol changing them (like the options
+    updated by `send_prompt`) won't affect the next session.
+
+    """
+    kwargs = dict(kwargs)
+    if "options" in kwargs:
+        kwargs["options"] = dict(kwargs["options"])
+    return kwargs
+
+
+def _data_size(kwargs):
+    "Approximate the size of send-kwargs by the length of their string args."
+    return sum(len(arg) for cmdargs, _ in kwargs.values()
+               for arg in cmdargs if isinstance(arg, basestring))
+
+
 class DummySession(object):
     sessid = 0
 DUMMYSESSION = DummySession()
 
+
+class TokenBucket(object):
+    """
+    Rate limiter allowing `rate` actions per second on average, with
+    bursts of up to `burst` actions. A rate <= 0 means no limit. The
+    burst is at least 1, since an action needs a whole token.
+
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.last = time()
+
+    def refill(self, now):
+        """
+        Add the tokens earned since the last refill.
+
+        Args:
+            now (float): The current time.
+
+        """
+        if self.rate > 0:
+            # the clock may be set back; never lose tokens because of it
+            elapsed = max(0.0, now - self.last)
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.last = now
+
+    def ready(self):
+        """
+        Check if an action is allowed right now.
+
+        Returns:
+            ready (bool): If there is a token to take.
+
+        """
+        return self.rate <= 0 or self.tokens >= 1
+
+    def take(self):
+        """
+        Use up a token.
+
+        """
+        self.tokens -= 1
+
+    def wait_time(self):
+        """
+        Get the time until the next token is available.
+
+        Returns:
+            wait (float): Seconds to wait.
+
+        """
+        if self.ready():
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@implementer(IPushProducer)
+class OutputProducer(object):
+    """
+    Registered with the transport of each session to be told when the
+    client is not receiving data as fast as we are sending it. Twisted
+    pauses the producer when the transport's write buffer grows past
+    its `bufferSize` (set by `PORTAL_OUTPUT_HIGH_WATERMARK`) and resumes
+    it when the buffer has been fully written.
+
+    """
+    def __init__(self, sessionhandler, session):
+        self.sessionhandler = sessionhandler
+        self.session = session
+
+    def pauseProducing(self):
+        self.sessionhandler.output_paused(self.session)
+
+    def resumeProducing(self):
+        self.sessionhandler.output_resumed(self.session)
+
+    def stopProducing(self):
+        pass
+
 #------------------------------------------------------------
 # Portal-SessionHandler class
 #------------------------------------------------------------
@@ -54,11 +168,20 @@ class PortalSessionHandler(SessionHandler):
         self.uptime = time()
         self.connection_time = 0
 
-        self.connection_last = time()
+        self.connection_last = 0
         self.connection_task = None
-        self.command_counter = 0
-        self.command_counter_reset = time()
-        self.command_overflow = False
+        # if we wait for the Server to confirm admitted connections
+        self.connection_pending = False
+        # connections to admit at once, adapted to the Server latency
+        self.connection_batch_size = 1
+        # input throttling
+        self.command_bucket = TokenBucket(_MAX_COMMAND_RATE, _MAX_COMMAND_RATE)
+        self.session_buckets = {}  # {sessid: TokenBucket}
+        self.command_queues = {}  # {sessid: deque of input kwargs}
+        self.command_queue_order = deque()  # sessids with queued input
+        self.command_queue_task = None
+        # {sessid: [deque of send-kwargs, size]} for paused sessions
+        self.output_backlogs = {}
 
     def at_server_connection(self):
         """
@@ -81,7 +204,13 @@ class PortalSessionHandler(SessionHandler):
             We implement a throttling mechanism here to limit the speed at
             which new connections are accepted - this is both a stop
             against DoS attacks as well as helps using the Dummyrunner
-            tester with a large number of connector dummies.
+            tester with a large number of connector dummies. New
+            connections are queued and admitted to the Server in
+            batches, at most `MAX_CONNECTION_RATE` batches per second
+            and never before the Server has confirmed the previous
+            batch. The batch size grows while the Server answers faster
+            than `CONNECTION_LATENCY_TARGET` and shrinks when it is
+            slower.
 
         """
         global _CONNECTION_QUEUE
@@ -91,35 +220,191 @@ class PortalSessionHandler(SessionHandler):
             self.latest_sessid += 1
             session.sessid = self.latest_sessid
             session.server_connected = False
+            self.register_output_producer(session)
             _CONNECTION_QUEUE.appendleft(session)
             if len(_CONNECTION_QUEUE) > 1:
                 session.data_out(text=[["%s DoS protection is active. You are queued to connect in %g seconds ..." % (
                                  settings.SERVERNAME,
-                                 len(_CONNECTION_QUEUE)*_MIN_TIME_BETWEEN_CONNECTS)],{}])
-        now = time()
-        if (now - self.connection_last < _MIN_TIME_BETWEEN_CONNECTS) or not self.portal.amp_protocol:
-            if not session or not self.connection_task:
-                self.connection_task = reactor.callLater(_MIN_TIME_BETWEEN_CONNECTS, self.connect, None)
-            self.connection_last = now
+                                 len(_CONNECTION_QUEUE) * _MIN_TIME_BETWEEN_CONNECTS
+                                 / self.connection_batch_size)],{}])
+        if not self.connection_task and not self.connection_pending:
+            self._schedule_connections()
+
+    def _schedule_connections(self):
+        """
+        Admit queued connections now, or schedule it for when the
+        connection rate allows.
+
+        """
+        wait = _MIN_TIME_BETWEEN_CONNECTS - (time() - self.connection_last)
+        if not self.portal.amp_protocol:
+            # wait for the Server to come back
+            wait = max(wait, _MIN_TIME_BETWEEN_CONNECTS)
+        if wait > 0:
+            self.connection_task = reactor.callLater(wait, self._admit_connections)
+        else:
+            self._admit_connections()
+
+    def _admit_connections(self):
+        """
+        Send a batch of queued connections to the Server.
+
+        """
+        global _CONNECTION_QUEUE
+        self.connection_task = None
+        if not _CONNECTION_QUEUE or self.connection_pending:
+            return
+        if not self.portal.amp_protocol:
+            self._schedule_connections()
             return
-        elif not session:
-            if _CONNECTION_QUEUE:
-                # keep launching tasks until queue is empty
-                self.connection_task = reactor.callLater(_MIN_TIME_BETWEEN_CONNECTS, self.connect, None)
-            else:
-                self.connection_task = None
-        self.connection_last = now
 
-        if _CONNECTION_QUEUE:
-            # sync with server-side
+        now = time()
+        self.connection_last = now
+        sessions = []
+        while _CONNECTION_QUEUE and len(sessions) < self.connection_batch_size:
             session = _CONNECTION_QUEUE.pop()
-            sessdata = session.get_sync_data()
-
             self[session.sessid] = session
             session.server_connected = True
-            self.portal.amp_protocol.send_AdminPortal2Server(session,
-                                                             operation=PCONN,
-                                                             sessiondata=sessdata)
+            sessions.append(session)
+
+        # sync with server-side
+        if len(sessions) == 1:
+            deferred = self.portal.amp_protocol.send_AdminPortal2Server(
+                sessions[0], operation=PCONN, sessiondata=sessions[0].get_sync_data())
+        else:
+            deferred = self.portal.amp_protocol.send_AdminPortal2Server(
+                DUMMYSESSION, operation=PCONNBATCH,
+                sessiondata=[session.get_sync_data() for session in sessions])
+        self.connection_pending = True
+        deferred.addBoth(self._connections_admitted, now, len(sessions))
+
+    def _connections_admitted(self, result, sendtime, nsessions):
+        """
+        Called when the Server has handled a batch of connections.
+        Adapts the batch size to the Server's latency and admits the
+        next batch.
+
+        Args:
+            result (any): The result from the Server.
+            sendtime (float): When the batch was sent.
+            nsessions (int): How many sessions were in the batch.
+
+        Returns:
+            result (any): The result, passed through.
+
+        """
+        self.connection_pending = False
+        if time() - sendtime < _CONNECTION_LATENCY_TARGET:
+            if nsessions >= self.connection_batch_size:
+                # the batch was full and the Server kept up
+                self.connection_batch_size = min(self.connection_batch_size * 2,
+                                                 _MAX_CONNECTION_BATCH)
+        else:
+            self.connection_batch_size = max(1, self.connection_batch_size // 2)
+        if _CONNECTION_QUEUE and not self.connection_task:
+            self._schedule_connections()
+        return result
+
+    def register_output_producer(self, session):
+        """
+        Register a producer with the session's transport, so the
+        handler is told if the client can't keep up with its output.
+        Protocols without a suitable transport are skipped.
+
+        Args:
+            session (PortalSession): The Session connecting.
+
+        """
+        transport = getattr(session, "transport", None)
+        if _OUTPUT_HIGH_WATERMARK and hasattr(transport, "registerProducer"):
+            try:
+                transport.registerProducer(OutputProducer(self, session), True)
+                if hasattr(transport, "bufferSize"):
+                    transport.bufferSize = _OUTPUT_HIGH_WATERMARK
+            except Exception:
+                log_trace()
+
+    def output_paused(self, session):
+        """
+        Called when the session's transport has more data waiting to
+        be written than its high watermark. Output to the session is
+        kept in a backlog until the client catches up, and the Server
+        is informed with an `output_paused` input.
+
+        Args:
+            session (PortalSession): The slow session.
+
+        """
+        if session.sessid not in self.output_backlogs:
+            self.output_backlogs[session.sessid] = [deque(), 0]
+            self.report_output_paused(session, True)
+
+    def output_resumed(self, session):
+        """
+        Called when the session's transport has written all its data.
+        The backlog is sent until it is empty or the transport is
+        paused again.
+
+        Args:
+            session (PortalSession): The session that caught up.
+
+        """
+        backlog = self.output_backlogs.pop(session.sessid, None)
+        if not backlog:
+            return
+        queue = backlog[0]
+        while queue:
+            self.data_out(session, **queue.popleft())
+            if session.sessid in self.output_backlogs:
+                # paused again; keep the rest, in order
+                newqueue, newsize = self.output_backlogs[session.sessid]
+                queue.extend(newqueue)
+                self.output_backlogs[session.sessid] = [queue, sum(_data_size(kwargs)
+                                                                   for kwargs in queue)]
+                return
+        self.report_output_paused(session, False)
+
+    def report_output_paused(self, session, paused):
+        """
+        Tell the Server that output to a session was paused or resumed.
+
+        Args:
+            session (PortalSession): The session.
+            paused (bool): If output was paused or resumed.
+
+        """
+        session.protocol_flags["OUTPUT_PAUSED"] = paused
+        if session.server_connected and self.portal.amp_protocol:
+            self.portal.amp_protocol.send_MsgPortal2Server(
+                session, output_paused=[[paused], {}])
+
+    def _backlog_output(self, session, kwargs):
+        """
+        Add output to a paused session's backlog, applying the
+        `PORTAL_OUTPUT_OVERFLOW_POLICY` if the backlog grows too big.
+
+        Args:
+            session (PortalSession): The paused session.
+            kwargs (dict): The send-kwargs to queue.
+
+        """
+        backlog = self.output_backlogs[session.sessid]
+        queue = backlog[0]
+        queue.append(kwargs)
+        backlog[1] += _data_size(kwargs)
+        if backlog[1] <= _OUTPUT_BACKLOG_SIZE:
+            return
+        if _OUTPUT_OVERFLOW_POLICY == "disconnect":
+            del self.output_backlogs[session.sessid]
+            session.disconnect(_OUTPUT_OVERFLOW_DISCONNECT)
+        elif _OUTPUT_OVERFLOW_POLICY == "truncate":
+            queue.clear()
+            queue.append({"text": [[_OUTPUT_TRUNCATED], {}]})
+            backlog[1] = len(_OUTPUT_TRUNCATED)
+        else:
+            # drop the oldest output, but always keep the newest
+            while backlog[1] > _OUTPUT_BACKLOG_SIZE and len(queue) > 1:
+                backlog[1] -= _data_size(queue.popleft())
 
     def sync(self, session):
         """
@@ -164,6 +449,11 @@ class PortalSessionHandler(SessionHandler):
 
         """
         global _CONNECTION_QUEUE
+        self.output_backlogs.pop(session.sessid, None)
+        self.session_buckets.pop(session.sessid, None)
+        if self.command_queues.pop(session.sessid, None) is not None:
+            if session.sessid in self.command_queue_order:
+                self.command_queue_order.remove(session.sessid)
         if session in _CONNECTION_QUEUE:
             # connection was already dropped before we had time
             # to forward this to the Server, so now we just remove it.
@@ -357,30 +647,98 @@ class PortalSessionHandler(SessionHandler):
 
         if session:
             now = time()
-            if self.command_counter > _MAX_COMMAND_RATE:
-                # data throttle (anti DoS measure)
-                dT = now - self.command_counter_reset
-                self.command_counter = 0
-                self.command_counter_reset = now
-                self.command_overflow = dT < 1.0
-                if self.command_overflow:
-                    reactor.callLater(1.0, self.data_in, None)
-            if self.command_overflow:
+            session.cmd_last = now
+            sessid = session.sessid
+            queue = self.command_queues.get(sessid)
+            if queue is None:
+                bucket = self.session_buckets.get(sessid)
+                if not bucket:
+                    bucket = self.session_buckets[sessid] = TokenBucket(
+                        _MAX_SESSION_COMMAND_RATE, _MAX_SESSION_COMMAND_BURST)
+                bucket.refill(now)
+                self.command_bucket.refill(now)
+                if bucket.ready() and self.command_bucket.ready():
+                    bucket.take()
+                    self.command_bucket.take()
+                    self._relay_data_in(session, kwargs)
+                    return
+            if len(queue or ()) >= _MAX_SESSION_COMMAND_QUEUE:
+                # data throttle (anti DoS measure). This is checked before
+                # creating the queue, so a limit <= 0 queues nothing.
                 self.data_out(session, text=[[_ERROR_COMMAND_OVERFLOW],{}])
                 return
-            # scrub data
-            kwargs = self.clean_senddata(session, kwargs)
+            if queue is None:
+                queue = self.command_queues[sessid] = deque()
+                self.command_queue_order.append(sessid)
+            queue.append((session, kwargs))
+            if not self.command_queue_task:
+                self.command_queue_task = reactor.callLater(self._command_queue_wait(),
+                                                            self._process_command_queues)
 
-            # relay data to Server
-            self.command_counter += 1
-            session.cmd_last = now
-            self.portal.amp_protocol.send_MsgPortal2Server(session,
-                                                           **kwargs)
-        else:
-           # called by the callLater callback
-            if self.command_overflow:
-                self.command_overflow = False
-                reactor.callLater(1.0, self.data_in, None)
+    def _relay_data_in(self, session, kwargs):
+        """
+        Scrub input and send it to the Server.
+
+        Args:
+            session (PortalSession): Session receiving data.
+            kwargs (dict): The input from the protocol.
+
+        """
+        kwargs = self.clean_senddata(session, kwargs)
+        self.portal.amp_protocol.send_MsgPortal2Server(session,
+                                                       **kwargs)
+
+    def _command_queue_wait(self):
+        """
+        Get the time until queued input may be relayed.
+
+        Returns:
+            wait (float): Seconds until the first session in the queue
+                and the global bucket both have a token.
+
+        """
+        waits = [self.session_buckets[sessid].wait_time()
+                 for sessid in self.command_queue_order if sessid in self.session_buckets]
+        return max(self.command_bucket.wait_time(), min(waits) if waits else 0.0)
+
+    def _process_command_queues(self):
+        """
+        Relay input queued by `data_in` as tokens become available. The
+        sessions with queued input take turns, one input each, so a
+        flooding session can't starve the others.
+
+        """
+        self.command_queue_task = None
+        now = time()
+        self.command_bucket.refill(now)
+        for sessid in list(self.command_queue_order):
+            bucket = self.session_buckets[sessid]
+            bucket.refill(now)
+        progress = True
+        while progress and self.command_queue_order and self.command_bucket.ready():
+            progress = False
+            for _ in range(len(self.command_queue_order)):
+                if not self.command_bucket.ready():
+                    break
+                sessid = self.command_queue_order.popleft()
+                bucket = self.session_buckets[sessid]
+                queue = self.command_queues[sessid]
+                if bucket.ready():
+                    bucket.take()
+                    self.command_bucket.take()
+                    session, kwargs = queue.popleft()
+                    progress = True
+                    try:
+                        self._relay_data_in(session, kwargs)
+                    except Exception:
+                        log_trace()
+                if queue:
+                    self.command_queue_order.append(sessid)
+                else:
+                    del self.command_queues[sessid]
+        if self.command_queue_order:
+            self.command_queue_task = reactor.callLater(self._command_queue_wait(),
+                                                        self._process_command_queues)
 
     def data_out(self, session, **kwargs):
         """
@@ -400,6 +758,11 @@ class PortalSessionHandler(SessionHandler):
         #from evennia.server.profiling.timetrace import timetrace
         #text = timetrace(text, "portalsessionhandler.data_out")
 
+        if session and session.sessid in self.output_backlogs:
+            # the client is not keeping up
+            self._backlog_output(session, kwargs)
+            return
+
         # distribute outgoing data to the correct session methods.
         if session:
             for cmdname, (cmdargs, cmdkwargs) in kwargs.iteritems():
@@ -419,4 +782,50 @@ class PortalSessionHandler(SessionHandler):
                     except Exception:
                         log_trace()
 
+    def data_out_multi(self, sessions, **kwargs):
+        """
+        Called by server for having the portal relay the same data to
+        many sessions, such as for a broadcast.
+
+        Args:
+            sessions (list): The Sessions to send to.
+
+        Kwargs:
+            kwargs (any): Each key is a command instruction to the
+                protocol on the form key = [[args],{kwargs}], as for
+                `data_out`.
+
+        Notes:
+            Text and prompts are only rendered (ANSI, MXP etc) once for
+            every distinct rendering profile among the sessions (see
+            the protocols' `render_profile`) and the result is then sent
+            to all sessions sharing that profile. Protocols not
+            supporting this, as well as all other commands, are sent to
+            one session at a time using `data_out`.
+
+        """
+        for cmdname, (cmdargs, cmdkwargs) in kwargs.iteritems():
+            cmd = cmdname.strip().lower()
+            if cmd in ("text", "prompt"):
+                renderkwargs = cmdkwargs
+                if cmd == "prompt":
+                    options = dict(cmdkwargs.get("options", {}), send_prompt=True)
+                    renderkwargs = dict(cmdkwargs, options=options)
+                rendered = {}
+                for session in sessions:
+                    if not hasattr(session, "render_text") or \
+                            session.sessid in self.output_backlogs:
+                        self.data_out(session, **{cmdname: [cmdargs, _copy_kwargs(cmdkwargs)]})
+                        continue
+                    try:
+                        profile = (session.__class__, session.render_profile())
+                        if profile not in rendered:
+                            rendered[profile] = session.render_text(*cmdargs, **renderkwargs)
+                        session.send_rendered_text(rendered[profile], **renderkwargs)
+                    except Exception:
+                        log_trace()
+            else:
+                for session in sessions:
+                    self.data_out(session, **{cmdname: [cmdargs, _copy_kwargs(cmdkwargs)]})
+
 PORTAL_SESSIONS = PortalSessionHandler()
@@ -8,6 +8,7 @@ sessions etc.
 """
 
 import re
+from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
 from twisted.conch.telnet import Telnet, StatefulTelnetProtocol
 from twisted.conch.telnet import IAC, NOP, LINEMODE, GA, WILL, WONT, ECHO, NULL
@@ -24,6 +25,7 @@ _RE_LEND = re.compile(r"\n$|\r$|\r\n$|\r\x00$|", re.MULTILINE)
 _RE_LINEBREAK = re.compile(r"\n\r|\r\n|\n|\r", re.DOTALL + re.MULTILINE)
 _RE_SCREENREADER_REGEX = re.compile(r"%s" % settings.SCREENREADER_REGEX_STRIP, re.DOTALL + re.MULTILINE)
 _IDLE_COMMAND = settings.IDLE_COMMAND + "\n"
+_OUTPUT_BUFFER_SIZE = settings.TELNET_OUTPUT_BUFFER_SIZE
 
 class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
     """
@@ -42,6 +44,10 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         """
         # initialize the session
         self.line_buffer = ""
+        # outgoing data waiting to be written at the end of the tick
+        self.output_buffer = []
+        self.output_buffer_size = 0
+        self.output_task = None
         client_address = self.transport.client
         client_address = client_address[0] if client_address else None
         # this number is counted down for every handshake that completes.
@@ -153,6 +159,8 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         if option == ECHO:
             return True
         if option == MCCP:
+            # data queued so far must go out compressed
+            self.flush_output()
             self.mccp.no_mccp(option)
             return True
         else:
@@ -168,6 +176,11 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
             reason (str): Motivation for losing connection.
 
         """
+        if self.output_task and self.output_task.active():
+            self.output_task.cancel()
+        self.output_task = None
+        self.output_buffer = []
+        self.output_buffer_size = 0
         self.sessionhandler.disconnect(self)
         self.transport.loseConnection()
 
@@ -206,9 +219,45 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
 
     def _write(self, data):
         "hook overloading the one used in plain telnet"
+        # telnet negotiations are not buffered, but must not overtake
+        # text sent before them
+        self.flush_output()
         data = data.replace('\n', '\r\n').replace('\r\r\n', '\r\n')
         super(TelnetProtocol, self)._write(mccp_compress(self, data))
 
+    def write_buffered(self, data):
+        """
+        Queue data to be written to the transport at the end of the
+        current reactor tick, together with all other data queued
+        during the tick. This means only one MCCP compression flush
+        and one write per tick.
+
+        Args:
+            data (str): Data to write, ready to go on the wire (but
+                not yet MCCP-compressed).
+
+        """
+        self.output_buffer.append(data)
+        self.output_buffer_size += len(data)
+        if self.output_buffer_size >= _OUTPUT_BUFFER_SIZE:
+            self.flush_output()
+        elif not self.output_task:
+            self.output_task = reactor.callLater(0, self.flush_output)
+
+    def flush_output(self):
+        """
+        Write all data queued by `write_buffered` to the transport.
+
+        """
+        if self.output_task and self.output_task.active():
+            self.output_task.cancel()
+        self.output_task = None
+        if self.output_buffer:
+            data = "".join(self.output_buffer)
+            self.output_buffer = []
+            self.output_buffer_size = 0
+            self.transport.write(mccp_compress(self, data))
+
     def sendLine(self, line):
         """
         Hook overloading the one used by linereceiver.
@@ -220,7 +269,7 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         #escape IAC in line mode, and correctly add \r\n
         line += self.delimiter
         line = line.replace(IAC, IAC + IAC).replace('\n', '\r\n')
-        return self.transport.write(mccp_compress(self, line))
+        self.write_buffered(line)
 
 
     # Session hooks
@@ -235,6 +284,7 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
 
         """
         self.data_out(text=((reason or "",), {}))
+        self.flush_output()
         self.connectionLost(reason)
 
     def data_in(self, **kwargs):
@@ -282,10 +332,39 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
                         off line echo for client, for example for password.
                         Note that it must be actively turned back on again!
 
+        """
+        self.send_rendered_text(self.render_text(*args, **kwargs), **kwargs)
+
+    def render_profile(self):
+        """
+        Get the protocol flags affecting how text is rendered for this
+        session. Sessions with the same profile render the same text
+        identically (given the same options).
+
+        Returns:
+            profile (tuple): A hashable rendering profile.
+
+        """
+        flags = self.protocol_flags
+        return (bool(flags.get("TTYPE")), flags.get("XTERM256", False), flags.get("ANSI", False),
+                flags.get("RAW", False), flags.get("NOMARKUP"), flags.get("MXP", False),
+                flags.get("SCREENREADER", False))
+
+    def render_text(self, *args, **kwargs):
+        """
+        Process outgoing text for this protocol without sending it.
+        This is the (potentially expensive) ANSI/MXP parsing part of
+        `send_text`. Takes the same arguments as `send_text`.
+
+        Returns:
+            rendered (tuple or None): A tuple `(data, prompt)` to pass
+                to `send_rendered_text`, or `None` if there is nothing
+                to send.
+
         """
         text = args[0] if args else ""
         if text is None:
-            return
+            return None
         text = to_str(text, force_string=True)
 
         # handle arguments
@@ -295,7 +374,6 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         useansi = options.get("ansi", flags.get('ANSI', False) if flags["TTYPE"] else True)
         raw = options.get("raw", flags.get("RAW", False))
         nomarkup = options.get("nomarkup", flags.get("NOMARKUP", not (xterm256 or useansi)))
-        echo = options.get("echo", None)
         mxp = options.get("mxp", flags.get("MXP", False))
         screenreader =  options.get("screenreader", flags.get("SCREENREADER", False))
 
@@ -306,6 +384,7 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
 
         if options.get("send_prompt"):
             # send a prompt instead.
+            prompt = text
             if not raw:
                 # processing
                 prompt = ansi.parse_ansi(_RE_N.sub("", text) + "{n", strip_ansi=nomarkup, xterm256=xterm256)
@@ -313,32 +392,53 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
                     prompt = mxp_parse(prompt)
             prompt = prompt.replace(IAC, IAC + IAC).replace('\n', '\r\n')
             prompt += IAC + GA
-            self.transport.write(mccp_compress(self, prompt))
+            return prompt, True
+        elif raw:
+            # no processing
+            return text, False
         else:
-            if echo is not None:
-                # turn on/off echo. Note that this is a bit turned around since we use
-                # echo as if we are "turning off the client's echo" when telnet really
-                # handles it the other way around.
-                if echo:
-                    # by telling the client that WE WON'T echo, the client knows
-                    # that IT should echo. This is the expected behavior from
-                    # our perspective.
-                    self.transport.write(mccp_compress(self, IAC+WONT+ECHO))
-                else:
-                    # by telling the client that WE WILL echo, the client can
-                    # safely turn OFF its OWN echo.
-                    self.transport.write(mccp_compress(self, IAC+WILL+ECHO))
-            if raw:
-                # no processing
-                self.sendLine(text)
-                return
+            # we need to make sure to kill the color at the end in order
+            # to match the webclient output.
+            linetosend = ansi.parse_ansi(_RE_N.sub("", text) + "{n", strip_ansi=nomarkup, xterm256=xterm256, mxp=mxp)
+            if mxp:
+                linetosend = mxp_parse(linetosend)
+            return linetosend, False
+
+    def send_rendered_text(self, rendered, **kwargs):
+        """
+        Send text already processed by `render_text`. This allows the
+        same rendering to be sent to many sessions with the same
+        `render_profile`.
+
+        Args:
+            rendered (tuple or None): The output of `render_text`.
+
+        Kwargs:
+            options (dict): Send-options, as for `send_text`. Only
+                `echo` is used here.
+
+        """
+        if rendered is None:
+            return
+        data, prompt = rendered
+        if prompt:
+            self.write_buffered(data)
+            return
+        echo = kwargs.get("options", {}).get("echo", None)
+        if echo is not None:
+            # turn on/off echo. Note that this is a bit turned around since we use
+            # echo as if we are "turning off the client's echo" when telnet really
+            # handles it the other way around.
+            if echo:
+                # by telling the client that WE WON'T echo, the client knows
+                # that IT should echo. This is the expected behavior from
+                # our perspective.
+                self.write_buffered(IAC+WONT+ECHO)
             else:
-                # we need to make sure to kill the color at the end in order
-                # to match the webclient output.
-                linetosend = ansi.parse_ansi(_RE_N.sub("", text) + "{n", strip_ansi=nomarkup, xterm256=xterm256, mxp=mxp)
-                if mxp:
-                    linetosend = mxp_parse(linetosend)
-                self.sendLine(linetosend)
+                # by telling the client that WE WILL echo, the client can
+                # safely turn OFF its OWN echo.
+                self.write_buffered(IAC+WILL+ECHO)
+        self.sendLine(data)
 
     def send_prompt(self, *args, **kwargs):
         """
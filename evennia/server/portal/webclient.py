@@ -168,18 +168,46 @@ class WebSocketClient(Protocol, Session):
                 - screenreader (bool): Use Screenreader mode.
                 - send_prompt (bool): Send a prompt with parsed html
 
+        """
+        self.send_rendered_text(self.render_text(*args, **kwargs))
+
+    def render_profile(self):
+        """
+        Get the protocol flags affecting how text is rendered for this
+        session. Sessions with the same profile render the same text
+        identically (given the same options).
+
+        Returns:
+            profile (tuple): A hashable rendering profile.
+
+        """
+        flags = self.protocol_flags
+        return (flags.get("RAW", False), flags.get("NOMARKUP", False),
+                flags.get("SCREENREADER", False))
+
+    def render_text(self, *args, **kwargs):
+        """
+        Process outgoing text into the json string to send, without
+        sending it. Takes the same arguments as `send_text`.
+
+        Returns:
+            rendered (str or None): The line to pass to
+                `send_rendered_text`, or `None` if there is nothing to
+                send.
+
         """
         if args:
             args = list(args)
             text = args[0]
             if text is None:
-                return
+                return None
         else:
-            return
+            return None
 
         flags = self.protocol_flags
         text = to_str(text, force_string=True)
 
+        kwargs = dict(kwargs)
         options = kwargs.pop("options", {})
         raw = options.get("raw", flags.get("RAW", False))
         nomarkup = options.get("nomarkup", flags.get("NOMARKUP", False))
@@ -197,8 +225,20 @@ class WebSocketClient(Protocol, Session):
             args[0] = parse_html(text, strip_ansi=nomarkup)
 
         # send to client on required form [cmdname, args, kwargs]
-        self.sendLine(json.dumps([cmd, args, kwargs]))
+        return json.dumps([cmd, args, kwargs])
+
+    def send_rendered_text(self, rendered, **kwargs):
+        """
+        Send text already processed by `render_text`. This allows the
+        same rendering to be sent to many sessions with the same
+        `render_profile`.
+
+        Args:
+            rendered (str or None): The output of `render_text`.
 
+        """
+        if rendered is not None:
+            self.sendLine(rendered)
 
     def send_prompt(self, *args, **kwargs):
         kwargs["options"].update({"send_prompt": True})
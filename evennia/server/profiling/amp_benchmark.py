@@ -0,0 +1,122 @@
+"""
+Benchmark of the encoding and compression of data sent over AMP.
+
+This times the message codecs (see `settings.AMP_CODEC`) and the
+`Compressed` AMP argument on payloads like those seen when running
+the dummyrunner (short command input, room descriptions, help and
+examine output, as well as batches of these). For compression, the
+old behaviour (always compressing at zlib level 9) is compared with
+the current `AMP_COMPRESS_THRESHOLD`/`AMP_COMPRESS_LEVEL` settings.
+Run it from the command line with
+
+    python -m evennia.server.profiling.amp_benchmark
+
+or call `run()` from `evennia shell`.
+
+"""
+from __future__ import print_function
+import os
+from timeit import timeit
+
+NUMBER = 2000
+
+_ROOM = ("{cA Dark Cellar{n\nThis is a dark cellar, with moss growing on "
+         "the damp stone walls. A narrow staircase leads up.\n"
+         "{wExits:{n up, north, dummyexit-1234\n"
+         "{wYou see:{n a rusty sword, dummyobj-4321, Dummy-5678")
+
+
+def _get_messages():
+    """
+    Build the messages to benchmark, as they would come out of
+    clean_senddata.
+
+    """
+    help_text = "\n".join("  %-20s %s" % ("command%i" % i, "help on command %i" % i)
+                          for i in range(60))
+    examine = "\n".join("{wAttribute{n attr%i = %r" % (i, range(i % 5)) for i in range(30))
+    return (
+        ("command input", (12, {"text": [["look dummyobj-4321"], {}]})),
+        ("say output", (12, {"text": [["Dummy-5678 says, \"Hello there.\""],
+                                      {"options": {}}]})),
+        ("room look", (12, {"text": [[_ROOM], {"options": {}}]})),
+        ("examine output", (12, {"text": [[examine], {"options": {}}]})),
+        ("help output", (12, {"text": [[help_text], {"options": {}}]})),
+        ("batch of 50", [(i, {"text": [[_ROOM], {"options": {}}]})
+                         for i in range(50)]))
+
+
+def run_codecs(number=NUMBER):
+    """
+    Time the round-trip of messages through each available codec.
+
+    Args:
+        number (int, optional): How many times to process each message.
+
+    """
+    from evennia.server import amp
+    codecs = [amp.PickleCodec(), amp.BinaryCodec()]
+    if amp.msgpack:
+        codecs.append(amp.MsgpackCodec())
+    print("%-16s %-14s %10s %12s %12s" % ("message", "codec", "bytes",
+          "encode ms/op", "decode ms/op"))
+    for name, message in _get_messages():
+        for codec in codecs:
+            string = codec.encode(message)
+            times = (timeit(lambda: codec.encode(message), number=number),
+                     timeit(lambda: codec.decode(string), number=number))
+            print("%-16s %-14s %10i %12.4f %12.4f" % ((name, type(codec).__name__,
+                  len(string)) + tuple(1000.0 * tim / number for tim in times)))
+
+
+def run_compression(number=NUMBER):
+    """
+    Time the compression of encoded messages with the old and
+    current settings. The messages are sent through the AMP
+    command's argument boxing, as on the wire.
+
+    Args:
+        number (int, optional): How many times to process each message.
+
+    """
+    from evennia.server import amp
+    command = amp.MsgServer2Portal
+    old_settings = (amp._AMP_COMPRESS_THRESHOLD, amp._AMP_COMPRESS_LEVEL)
+    configs = (("old (level 9)", 0, 9), ("current", ) + old_settings)
+    try:
+        print("%-16s %8s  %-15s %10s %10s %10s" % ("payload", "bytes", "config",
+              "wire bytes", "send ms/op", "recv ms/op"))
+        for name, message in _get_messages():
+            payload = amp.encode_msg(message)
+            for configname, threshold, level in configs:
+                amp._AMP_COMPRESS_THRESHOLD, amp._AMP_COMPRESS_LEVEL = threshold, level
+                objects = {"packed_data": payload}
+                box = command.makeArguments(objects, None)
+                times = (timeit(lambda: command.makeArguments(objects, None), number=number),
+                         timeit(lambda: command.parseArguments(box, None), number=number))
+                wirelen = sum(len(value) for value in box.values())
+                print("%-16s %8i  %-15s %10i %10.4f %10.4f" % ((name, len(payload),
+                      configname, wirelen) + tuple(1000.0 * tim / number for tim in times)))
+    finally:
+        amp._AMP_COMPRESS_THRESHOLD, amp._AMP_COMPRESS_LEVEL = old_settings
+        amp.get_compression_stats(reset=True)
+
+
+def run(number=NUMBER):
+    """
+    Run the benchmarks and print the results.
+
+    Args:
+        number (int, optional): How many times to process each message.
+
+    """
+    run_codecs(number=number)
+    print()
+    run_compression(number=number)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "evennia.settings_default")
+    import django
+    django.setup()
+    run()
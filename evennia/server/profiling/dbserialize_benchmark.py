@@ -0,0 +1,99 @@
+"""
+Benchmark of the serialization used for Attribute values.
+
+This times `to_pickle`/`from_pickle` (and the full `dbserialize`/
+`dbunserialize` round-trip) on a few payloads typical for Attributes.
+Run it from the command line with
+
+    python -m evennia.server.profiling.dbserialize_benchmark
+
+or call `run()` from `evennia shell`. Database objects are replaced by
+stand-ins, so no database access is needed.
+
+"""
+from __future__ import print_function
+import os
+from collections import defaultdict
+from datetime import datetime
+from timeit import timeit
+
+NUMBER = 2000
+
+
+class _BenchDbObj(object):
+    "Stand-in for a database object"
+
+    class __dbclass__(object):
+        pass
+
+    class objects(object):
+        "Stand-in for the model manager"
+        @staticmethod
+        def get(id):
+            return _DBOBJS[id - 1]
+
+    db_date_created = datetime(2016, 1, 1)
+
+    def __init__(self, id):
+        self.id = id
+
+    def save(self):
+        pass
+
+_DBOBJS = [_BenchDbObj(i + 1) for i in range(100)]
+_NATURAL_KEY = ("bench", "benchdbobj")
+
+
+def _get_payloads():
+    """
+    Build the payloads to benchmark.
+
+    """
+    return (
+        ("flat stats dict", dict(("stat%i" % i, i) for i in range(20))),
+        ("nested stats dict", dict(("skill%i" % i, {"level": i, "xp": i * 100.0,
+                                                    "tags": ["a", "b"]})
+                                   for i in range(20))),
+        ("list of 1000 strings", ["line %i" % i for i in range(1000)]),
+        ("list of 100 dbobjs", list(_DBOBJS)),
+        ("dict of dbobj lists", dict(("slot%i" % i, _DBOBJS[i * 10:i * 10 + 10])
+                                     for i in range(10))))
+
+
+def run(number=NUMBER):
+    """
+    Run the benchmark and print the results.
+
+    Args:
+        number (int, optional): How many times to process each payload.
+
+    """
+    from evennia.utils import dbserialize
+    # use stand-ins instead of the ContentType/session lookups
+    old_globals = (dbserialize._FROM_MODEL_MAP, dbserialize._TO_MODEL_MAP,
+                   dbserialize._SESSION_HANDLER)
+    dbserialize._FROM_MODEL_MAP = defaultdict(str, {"__dbclass__": _NATURAL_KEY})
+    dbserialize._TO_MODEL_MAP = defaultdict(str, {_NATURAL_KEY: _BenchDbObj})
+    dbserialize._SESSION_HANDLER = {}
+    try:
+        print("%-25s %12s %12s %12s %12s" % ("payload (ms/op)", "to_pickle",
+              "from_pickle", "dbserialize", "dbunserialize"))
+        for name, payload in _get_payloads():
+            pickled = dbserialize.to_pickle(payload)
+            serialized = dbserialize.dbserialize(payload)
+            times = (timeit(lambda: dbserialize.to_pickle(payload), number=number),
+                     timeit(lambda: dbserialize.from_pickle(pickled), number=number),
+                     timeit(lambda: dbserialize.dbserialize(payload), number=number),
+                     timeit(lambda: dbserialize.dbunserialize(serialized), number=number))
+            print("%-25s %12.4f %12.4f %12.4f %12.4f" % ((name, ) + tuple(
+                  1000.0 * tim / number for tim in times)))
+    finally:
+        (dbserialize._FROM_MODEL_MAP, dbserialize._TO_MODEL_MAP,
+         dbserialize._SESSION_HANDLER) = old_globals
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "evennia.settings_default")
+    import django
+    django.setup()
+    run()
@@ -0,0 +1,87 @@
+"""
+Benchmark of lock checks.
+
+This compares the compiled locks used by the LockHandler with the
+previous approach of calling every lock function and eval():ing the
+combined True/False string. Run it from the command line with
+
+    python -m evennia.server.profiling.lock_benchmark
+
+or call `run()` from `evennia shell`. No database access is needed.
+
+"""
+from __future__ import print_function
+import os
+from timeit import timeit
+
+# the lockstrings to benchmark, using only functions not needing the database
+LOCKSTRINGS = ("test:all()",
+               "test:false() or all()",
+               "test:all() or false() or false() or false()",
+               "test:not false() and all() and not none()",
+               "test:false() and all() and all() and all() and all()")
+NUMBER = 100000
+
+
+class _BenchObj(object):
+    "Stand-in for a typeclassed object"
+    lock_storage = ""
+
+    def __init__(self):
+        from evennia.locks.lockhandler import LockHandler
+        self.locks = LockHandler(self)
+        self.locks.lock_bypass = False
+
+
+def _get_evalstring(lockstring):
+    """
+    Build the eval-string the previous LockHandler stored for a lock.
+
+    """
+    from evennia.locks.lockhandler import _RE_FUNCS, _RE_OK
+    evalstring = lockstring.split(":", 1)[1]
+    for funcstring in _RE_FUNCS.findall(evalstring):
+        evalstring = evalstring.replace(funcstring, "%s")
+    for pattern in ("AND", "OR", "NOT"):
+        evalstring = evalstring.replace(pattern, pattern.lower())
+    return " ".join(_RE_OK.findall(evalstring))
+
+
+def _eval_check(evalstring, func_tup, accessing_obj, accessed_obj):
+    """
+    Re-implementation of the previous eval-based check, for comparison.
+
+    """
+    true_false = tuple(bool(tup[0](accessing_obj, accessed_obj, *tup[1], **tup[2]))
+                       for tup in func_tup)
+    return eval(evalstring % true_false)
+
+
+def run(number=NUMBER):
+    """
+    Run the benchmark and print the results.
+
+    Args:
+        number (int, optional): How many checks to run per lockstring.
+
+    """
+    accessed_obj, accessing_obj = _BenchObj(), _BenchObj()
+    handler = accessed_obj.locks
+
+    print("%-60s %10s %10s %8s" % ("lockstring", "eval (s)", "compiled", "speedup"))
+    for lockstring in LOCKSTRINGS:
+        handler.replace(lockstring)
+        evalstring, func_tup = _get_evalstring(lockstring), handler.locks["test"][1]
+        assert _eval_check(evalstring, func_tup, accessing_obj, accessed_obj) == \
+                handler.check(accessing_obj, "test")
+        t_eval = timeit(lambda: _eval_check(evalstring, func_tup, accessing_obj, accessed_obj),
+                        number=number)
+        t_compiled = timeit(lambda: handler.check(accessing_obj, "test"), number=number)
+        print("%-60s %10.4f %10.4f %7.1fx" % (lockstring, t_eval, t_compiled, t_eval / t_compiled))
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "evennia.settings_default")
+    import django
+    django.setup()
+    run()
@@ -12,13 +12,13 @@ import time
 #TODO!
 #sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
 #os.environ['DJANGO_SETTINGS_MODULE'] = 'game.settings'
-import ev
-from evennia.utils.idmapper import base as _idmapper
+from evennia.scripts.scripts import DefaultScript
+from evennia.utils.idmapper import models as _idmapper
 
 LOGFILE = "logs/memoryusage.log"
 INTERVAL = 30 # log every 30 seconds
 
-class Memplot(ev.Script):
+class Memplot(DefaultScript):
     """
     Describes a memory plotting action.
 
@@ -34,14 +34,18 @@ class Memplot(ev.Script):
 
     def at_repeat(self):
         "Regularly save memory statistics."
-        pid = os.getpid()
-        rmem = float(os.popen('ps -p %d -o %s | tail -1' % (pid, "rss")).read()) / 1000.0  # resident memory
-        vmem = float(os.popen('ps -p %d -o %s | tail -1' % (pid, "vsz")).read()) / 1000.0  # virtual memory
+        rmem, vmem = _idmapper.process_memory()
+        peak_rmem = _idmapper.peak_memory()
         total_num, cachedict = _idmapper.cache_size()
+        cache_mem, _ = _idmapper.cache_memory()
         t0 = (time.time() - self.db.starttime) / 60.0 # save in minutes
 
+        # unknown values are logged as nan
+        nan = float("nan")
         with open(LOGFILE, "a") as f:
-            f.write("%s, %s, %s, %s\n" % (t0, rmem, vmem, int(total_num)))
+            f.write("%s, %s, %s, %s, %s, %s\n" % (t0, nan if rmem is None else rmem,
+                    nan if vmem is None else vmem, int(total_num), cache_mem,
+                    nan if peak_rmem is None else peak_rmem))
 
 if __name__ == "__main__":
 
@@ -55,6 +59,8 @@ if __name__ == "__main__":
     rmem = data[:,1]
     vmem = data[:,2]
     nobj = data[:,3]
+    cmem = data[:,4]
+    peak = data[:,5]
 
     # calculate derivative of obj creation
     #oderiv = (0.5*(nobj[2:] - nobj[:-2]) / (secs[2:] - secs[:-2])).copy()
@@ -67,6 +73,8 @@ if __name__ == "__main__":
     ax1.set_ylabel("Memory usage (MB)")
     ax1.plot(secs, rmem, "r", label="RMEM", lw=2)
     ax1.plot(secs, vmem, "b", label="VMEM", lw=2)
+    ax1.plot(secs, cmem, "m", label="cache (est.)", lw=2)
+    ax1.plot(secs, peak, "r--", label="peak RMEM", lw=1)
     ax1.legend(loc="upper left")
 
     ax2 = ax1.twinx()
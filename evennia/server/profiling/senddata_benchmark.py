@@ -0,0 +1,72 @@
+"""
+Benchmark of the cleaning of outgoing data.
+
+This times `clean_senddata`, which makes all outgoing data safe to
+send to the Portal (and applies inlinefuncs), on a few typical text
+and OOB payloads. Run it from the command line with
+
+    python -m evennia.server.profiling.senddata_benchmark
+
+or call `run()` from `evennia shell`. A stand-in session is used, so
+no server needs to be running.
+
+"""
+from __future__ import print_function
+import os
+from timeit import timeit
+
+NUMBER = 5000
+
+
+class _BenchSession(object):
+    "Stand-in for a session"
+    sessid = 1
+
+    def __init__(self, encoding):
+        self.protocol_flags = {"ENCODING": encoding}
+
+
+def _get_payloads():
+    """
+    Build the payloads to benchmark.
+
+    """
+    room = ("{cA Dark Cellar{n\nThis is a dark cellar, with moss growing on "
+            "the damp stone walls. A narrow staircase leads up.\n"
+            "{wExits:{n up, north\n{wYou see:{n a rusty sword, Dummy-5678")
+    return (
+        ("short text", {"text": "You say, \"Hello there.\""}),
+        ("room text", {"text": (room, {"type": "look"})}),
+        ("non-ascii text", {"text": u"Dummy-5678 s\xe4ger, \"H\xe4lsningar.\""}),
+        ("inlinefunc text", {"text": "$pad(Score, 20, c, -)\n$crop(%s, 60)" % room}),
+        ("oob vitals", {"vitals": {"hp": 100, "hpmax": 120, "mana": 40, "manamax": 50,
+                                   "status": ["poisoned", "hasted"]}}),
+        ("oob room info", {"room_info": ([], {"name": "A Dark Cellar", "id": 1234,
+                                              "exits": {"up": 1235, "north": 1236},
+                                              "contents": ["a rusty sword", "Dummy-5678"]})}))
+
+
+def run(number=NUMBER):
+    """
+    Run the benchmark and print the results.
+
+    Args:
+        number (int, optional): How many times to process each payload.
+
+    """
+    from evennia.server.sessionhandler import SESSION_HANDLER
+    print("%-18s %14s %14s" % ("payload (ms/op)", "utf-8", "latin-1"))
+    for name, payload in _get_payloads():
+        times = []
+        for encoding in ("utf-8", "latin-1"):
+            session = _BenchSession(encoding)
+            times.append(timeit(lambda: SESSION_HANDLER.clean_senddata(session, dict(payload)),
+                                number=number))
+        print("%-18s %14.4f %14.4f" % ((name, ) + tuple(1000.0 * tim / number for tim in times)))
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "evennia.settings_default")
+    import django
+    django.setup()
+    run()
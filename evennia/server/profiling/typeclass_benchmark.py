@@ -0,0 +1,98 @@
+"""
+Benchmark of instantiating typeclassed entities.
+
+This times bulk-loading of objects the way a queryset missing the
+idmapper cache does it (`ObjectDB.from_db` for every row), with the
+typeclass of each row resolved by `class_from_module` (the old
+behaviour) and by the cached `typeclass_from_path`. The rows are
+built in memory, so no database access is needed. Run it from the
+command line with
+
+    python -m evennia.server.profiling.typeclass_benchmark
+
+or call `run()` from `evennia shell`.
+
+"""
+from __future__ import print_function
+import os
+from time import time
+
+NUMBER = 100000
+# pks well above any used by a real game, so no real objects are touched
+_FIRST_ID = 10 ** 9
+
+
+def _get_rows(number, typeclass_path):
+    """
+    Build database rows for `number` objects.
+
+    """
+    from evennia.objects.models import ObjectDB
+    template = ObjectDB(db_key="bench", db_typeclass_path=typeclass_path)
+    fields = ObjectDB._meta.concrete_fields
+    field_names = [field.attname for field in fields]
+    values = [getattr(template, name) for name in field_names]
+    idpos = field_names.index("id")
+    rows = []
+    for num in range(number):
+        row = list(values)
+        row[idpos] = _FIRST_ID + num
+        rows.append(row)
+    return field_names, rows
+
+
+def _bulk_load(field_names, rows):
+    """
+    Instantiate all rows, then remove them from the idmapper cache.
+
+    Returns:
+        time (float): The time it took to instantiate the rows.
+
+    """
+    from evennia.objects.models import ObjectDB
+    t0 = time()
+    for row in rows:
+        ObjectDB.from_db(None, field_names, row)
+    timing = time() - t0
+    idpos = field_names.index("id")
+    for row in rows:
+        ObjectDB.__instance_cache__.pop(row[idpos], None)
+    return timing
+
+
+def run(number=NUMBER):
+    """
+    Run the benchmark and print the results.
+
+    Args:
+        number (int, optional): How many objects to load.
+
+    """
+    from django.conf import settings
+    from evennia.typeclasses import models
+    from evennia.utils.utils import class_from_module
+
+    typeclass_path = settings.BASE_OBJECT_TYPECLASS
+    field_names, rows = _get_rows(number, typeclass_path)
+
+    print("%-32s %12s %12s" % ("typeclass resolution", "total s", "us/object"))
+    cached = models.typeclass_from_path
+    uncached = lambda path, defaultpaths=None: class_from_module(path, defaultpaths=defaultpaths)
+    try:
+        for name, resolver, clear in (("class_from_module (old)", uncached, False),
+                                      ("typeclass_from_path (cold)", cached, True),
+                                      ("typeclass_from_path (warm)", cached, False)):
+            if clear:
+                models.clear_typeclass_cache()
+            models.typeclass_from_path = resolver
+            timing = _bulk_load(field_names, rows)
+            print("%-32s %12.3f %12.2f" % (name, timing, 1e6 * timing / number))
+    finally:
+        models.typeclass_from_path = cached
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "evennia.settings_default")
+    import django
+    django.setup()
+    run()
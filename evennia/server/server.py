@@ -377,6 +377,12 @@ class Evennia(object):
             ServerConfig.objects.conf("server_restart_mode", "reset")
             self.at_server_cold_stop()
 
+        # make sure no in-situ Attribute updates or field changes are lost
+        from evennia.utils.dbserialize import flush_pending_saves
+        flush_pending_saves()
+        from evennia.utils.idmapper.models import flush_field_saves
+        flush_field_saves()
+
         # tickerhandler state should always be saved.
         from evennia.scripts.tickerhandler import TICKER_HANDLER
         TICKER_HANDLER.save()
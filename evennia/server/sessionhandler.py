@@ -15,6 +15,8 @@ There are two similar but separate stores of sessions:
 from builtins import object
 from future.utils import listvalues
 
+import re
+import codecs
 from time import time
 from django.conf import settings
 from evennia.commands.cmdhandler import CMD_LOGINSTART
@@ -31,6 +33,8 @@ except ImportError:
     import pickle
 
 _INLINEFUNC_ENABLED = settings.INLINEFUNC_ENABLED
+# the marker starting all inlinefunc calls
+_INLINEFUNC_MARKER = "$"
 
 # delayed imports
 _PlayerDB = None
@@ -43,6 +47,45 @@ class DummySession(object):
     sessid = 0
 DUMMYSESSION = DummySession()
 
+# encodings in which plain ascii strings need no conversion
+_ASCII_COMPATIBLE = ("utf-8", "ascii", "iso8859-1", "iso8859-15", "cp1252", "cp437")
+_RE_NONASCII = re.compile(r"[^\x00-\x7f]")
+_ENCODERS = {}
+
+
+def _get_encoder(encoding):
+    """
+    Get a function for converting strings to an encoding, created
+    once per encoding.
+
+    Args:
+        encoding (str): The encoding.
+
+    Returns:
+        encoder (callable or None): A function taking a string and
+            returning it in `encoding`, or `None` if `encoding` is not
+            a valid encoding.
+
+    """
+    try:
+        return _ENCODERS[encoding]
+    except KeyError:
+        pass
+    try:
+        ascii_compatible = codecs.lookup(encoding).name in _ASCII_COMPATIBLE
+    except LookupError:
+        return None
+
+    def encoder(data):
+        if ascii_compatible and type(data) == str and not _RE_NONASCII.search(data):
+            # already valid in this encoding
+            return data
+        return data and to_str(to_unicode(data), encoding=encoding)
+
+    _ENCODERS[encoding] = encoder
+    return encoder
+
+
 # AMP signals
 PCONN = chr(1)        # portal session connect
 PDISCONN = chr(2)     # portal session disconnect
@@ -55,6 +98,7 @@ SSYNC = chr(8)        # server session sync
 SCONN = chr(11)        # server portal connection (for bots)
 PCONNSYNC = chr(12)   # portal post-syncing session
 PDISCONNALL = chr(13) # portal session discnnect all
+PCONNBATCH = chr(14)  # portal session connect, many sessions at once
 
 # i18n
 from django.utils.translation import ugettext as _
@@ -62,8 +106,6 @@ from django.utils.translation import ugettext as _
 _SERVERNAME = settings.SERVERNAME
 _MULTISESSION_MODE = settings.MULTISESSION_MODE
 _IDLE_TIMEOUT = settings.IDLE_TIMEOUT
-_MAX_SERVER_COMMANDS_PER_SECOND = 100.0
-_MAX_SESSION_COMMANDS_PER_SECOND = 5.0
 _MODEL_MAP = None
 
 # input handlers
@@ -155,28 +197,29 @@ class SessionHandler(dict):
         options = kwargs.pop("options", None) or {}
         raw = options.get("raw", False)
         strip_inlinefunc = options.get("strip_inlinefunc", False)
+        # only parse inlinefuncs on the outgoing path (sessionhandler->)
+        inlinefuncs = _INLINEFUNC_ENABLED and not raw and isinstance(self, ServerSessionHandler)
+        encode = _get_encoder(session.protocol_flags.get("ENCODING", "utf-8"))
+        if not encode:
+            # wrong encoding set on the session. Set it to a safe one
+            session.protocol_flags["ENCODING"] = "utf-8"
+            encode = _get_encoder("utf-8")
 
         def _validate(data):
             "Helper function to convert data to AMP-safe (picketable) values"
-            if isinstance(data, dict):
+            if isinstance(data, basestring):
+                # make sure strings are in a valid encoding
+                data = encode(data)
+                if inlinefuncs and _INLINEFUNC_MARKER in data:
+                    data = parse_inlinefunc(data, strip=strip_inlinefunc, session=session)
+                return data
+            elif isinstance(data, dict):
                 newdict = {}
                 for key, part in data.items():
                     newdict[key] = _validate(part)
                 return newdict
             elif hasattr(data, "__iter__"):
                 return [_validate(part) for part in data]
-            elif isinstance(data, basestring):
-                # make sure strings are in a valid encoding
-                try:
-                    data = data and to_str(to_unicode(data), encoding=session.protocol_flags["ENCODING"])
-                except LookupError:
-                    # wrong encoding set on the session. Set it to a safe one
-                    session.protocol_flags["ENCODING"] = "utf-8"
-                    data = to_str(to_unicode(data), encoding=session.protocol_flags["ENCODING"])
-                if _INLINEFUNC_ENABLED and not raw and isinstance(self, ServerSessionHandler):
-                    # only parse inlinefuncs on the outgoing path (sessionhandler->)
-                    data = parse_inlinefunc(data, strip=strip_inlinefunc, session=session)
-                return data
             elif hasattr(data, "id") and hasattr(data, "db_date_created") \
                     and hasattr(data, '__dbclass__'):
                 # convert database-object to their string representation.
@@ -250,33 +293,55 @@ class ServerSessionHandler(SessionHandler):
                 keys defining the session and which is marked to be
                 synced.
 
+        """
+        self.portal_connect_batch([portalsessiondata])
+
+    def portal_connect_batch(self, portalsessionsdata):
+        """
+        Called by Portal when many new sessions have connected, such
+        as when many clients reconnect at once. Creates new, unlogged-in
+        game sessions for all of them.
+
+        Args:
+            portalsessionsdata (list): A list of dicts of all
+                property:value keys defining each session and which are
+                marked to be synced.
+
         """
         delayed_import()
         global _ServerSession, _PlayerDB, _ScriptDB
 
-        sess = _ServerSession()
-        sess.sessionhandler = self
-        sess.load_sync_data(portalsessiondata)
-        sess.at_sync()
+        sessions = []
+        for portalsessiondata in portalsessionsdata:
+            sess = _ServerSession()
+            sess.sessionhandler = self
+            sess.load_sync_data(portalsessiondata)
+            sess.at_sync()
+            sessions.append(sess)
         # validate all scripts
         _ScriptDB.objects.validate()
-        self[sess.sessid] = sess
-
-        if sess.logged_in and sess.uid:
-            # Session is already logged in. This can happen in the
-            # case of auto-authenticating protocols like SSH or
-            # webclient's session sharing
-            player = _PlayerDB.objects.get_player_from_uid(sess.uid)
-            if player:
-                # this will set player.is_connected too
-                self.login(sess, player, force=True)
-                return
-            else:
-                sess.logged_in = False
-                sess.uid = None
 
-        # show the first login command
-        self.data_in(sess, text=[[CMD_LOGINSTART],{}])
+        # Sessions may already be logged in. This can happen in the
+        # case of auto-authenticating protocols like SSH or
+        # webclient's session sharing
+        uids = [sess.uid for sess in sessions if sess.logged_in and sess.uid]
+        players = dict((player.id, player) for player in
+                       _PlayerDB.objects.filter(id__in=uids)) if uids else {}
+
+        for sess in sessions:
+            self[sess.sessid] = sess
+            if sess.logged_in and sess.uid:
+                player = players.get(sess.uid)
+                if player:
+                    # this will set player.is_connected too
+                    self.login(sess, player, force=True)
+                    continue
+                else:
+                    sess.logged_in = False
+                    sess.uid = None
+
+            # show the first login command
+            self.data_in(sess, text=[[CMD_LOGINSTART],{}])
 
     def portal_session_sync(self, portalsessiondata):
         """
@@ -658,8 +723,7 @@ class ServerSessionHandler(SessionHandler):
             message (str): Message to send.
 
         """
-        for session in self.values():
-            self.data_out(session, text=message)
+        self.data_out_multi(self.values(), text=message)
 
     def data_out(self, session, **kwargs):
         """
@@ -680,6 +744,37 @@ class ServerSessionHandler(SessionHandler):
         self.server.amp_protocol.send_MsgServer2Portal(session,
                                                        **kwargs)
 
+    def data_out_multi(self, sessions, **kwargs):
+        """
+        Sending the same data Server -> Portal to many sessions, such
+        as for a broadcast.
+
+        Args:
+            sessions (list): Sessions to relay to.
+            text (str, optional): text data to return
+
+        Notes:
+            The outdata is scrubbed for each session (since encoding
+            and inlinefuncs may differ between them), but sessions
+            ending up with the same outdata share a single
+            multi-session message across the wire.
+
+        """
+        groups = []
+        for session in sessions:
+            # clean_senddata pops options, so each session needs its own copy
+            outdata = self.clean_senddata(session, dict(kwargs))
+            for group in groups:
+                if group[0] == outdata:
+                    group[1].append(session)
+                    break
+            else:
+                groups.append((outdata, [session]))
+
+        # send across AMP
+        for outdata, group in groups:
+            self.server.amp_protocol.send_MsgServer2PortalMulti(group, **outdata)
+
     def get_inputfuncs(self):
         """
         Get all registered inputfuncs (access function)
@@ -45,3 +45,307 @@ class EvenniaTestSuiteRunner(DiscoverRunner):
         import evennia
         evennia._init()
         return super(EvenniaTestSuiteRunner, self).build_suite(test_labels, extra_tests=extra_tests, **kwargs)
+
+
+from mock import Mock, patch
+from evennia.server import amp
+
+
+@patch.object(amp, "_AMP_BATCH_SEND", True)
+class TestAMPBatch(TestCase):
+    def setUp(self):
+        self.proto = amp.AMPProtocol()
+        self.proto.callRemote = Mock()
+        self.proto.factory = Mock()
+        self.session = Mock(sessid=1)
+
+    def tearDown(self):
+        amp._MSGBUFFER.clear()
+
+    def test_batch(self):
+        with patch.object(amp.reactor, "callLater") as mockcall:
+            self.proto.send_MsgServer2Portal(self.session, text="one")
+            self.proto.send_MsgServer2Portal(self.session, text="two")
+            self.assertEqual(mockcall.call_count, 1)
+        self.assertFalse(self.proto.callRemote.called)
+        self.proto.send_batch()
+        self.proto.callRemote.assert_called_once_with(
+            amp.MsgServer2PortalBatch,
+            packed_data=amp.encode_msg([(1, {"text": "one"}), (1, {"text": "two"})]))
+        # the receiving side gets them in order
+        self.proto.portal_receive_server2portal_batch(self.proto.callRemote.call_args[1]["packed_data"])
+        data_out = self.proto.factory.portal.sessions.data_out
+        self.assertEqual([call[1]["text"] for call in data_out.call_args_list], ["one", "two"])
+
+    def test_flush_before_admin(self):
+        self.proto.send_task = Mock()
+        self.proto.send_MsgServer2Portal(self.session, text="bye")
+        self.proto.send_AdminServer2Portal(self.session, operation=amp.SDISCONN)
+        self.assertEqual([call[0][0] for call in self.proto.callRemote.call_args_list],
+                         [amp.MsgServer2PortalBatch, amp.AdminServer2Portal])
+
+    def test_multi(self):
+        session2 = Mock(sessid=2)
+        self.proto.send_MsgServer2PortalMulti([self.session], text="all")
+        self.proto.send_MsgServer2Portal(session2, text="all")
+        self.proto.send_MsgServer2Portal(self.session, text="one")
+        self.proto.send_batch()
+        self.proto.callRemote.assert_called_once_with(
+            amp.MsgServer2PortalBatch,
+            packed_data=amp.encode_msg([([1, 2], {"text": "all"}), (1, {"text": "one"})]))
+        self.proto.portal_receive_server2portal_batch(self.proto.callRemote.call_args[1]["packed_data"])
+        sessions = self.proto.factory.portal.sessions
+        self.assertEqual(sessions.data_out_multi.call_count, 1)
+        self.assertEqual(sessions.data_out.call_count, 1)
+
+
+class TestAMPCompressed(TestCase):
+    def tearDown(self):
+        amp.get_compression_stats(reset=True)
+
+    def _send(self, data):
+        "Send data through an AMP command, returning the box and the received data"
+        with patch.object(amp, "_AMP_COMPRESS_THRESHOLD", 512):
+            box = amp.MsgServer2Portal.makeArguments({"packed_data": data}, None)
+        return box, amp.MsgServer2Portal.parseArguments(box, None)["packed_data"]
+
+    def test_short_not_compressed(self):
+        box, received = self._send("look")
+        self.assertEqual(box["packed_data"], amp._RAW + "look")
+        self.assertEqual(received, "look")
+
+    def test_long_compressed(self):
+        data = "Lorem ipsum " * 100
+        box, received = self._send(data)
+        wire = box["packed_data"]
+        self.assertEqual(wire[0], amp._ZLIB)
+        self.assertTrue(len(wire) < len(data))
+        self.assertEqual(received, data)
+        stats = amp.get_compression_stats()
+        self.assertEqual(stats["bytes_out"], len(data))
+        self.assertEqual(stats["bytes_out_wire"], len(wire))
+        self.assertEqual(stats["bytes_in"], len(data))
+        self.assertEqual(stats["compressed"], 1)
+
+    def test_too_long_split(self):
+        # random data doesn't compress, so has to be split in chunks
+        data = os.urandom(amp.AMP_MAXLEN + 100)
+        box, received = self._send(data)
+        self.assertEqual(box["packed_data"][0], amp._RAW)
+        self.assertTrue("packed_data.2" in box)
+        self.assertEqual(received, data)
+
+
+class TestAMPCodec(TestCase):
+    data = [(12, {"text": [["Hello", u"w\xf6rld"], {"options": {"raw": True, "n": None}}],
+                  "stats": [[1, -2 ** 40, 2 ** 70, 1.5, False], {}]}),
+            ([1, 2], {})]
+    result = [[12, {"text": [["Hello", u"w\xf6rld"], {"options": {"raw": True, "n": None}}],
+                    "stats": [[1, -2 ** 40, 2 ** 70, 1.5, False], {}]}],
+              [[1, 2], {}]]
+
+    def test_binary(self):
+        codec = amp.BinaryCodec()
+        self.assertEqual(codec.decode(codec.encode(self.data)), self.result)
+
+    def test_encode_msg(self):
+        string = amp.encode_msg(self.data[1:])
+        self.assertEqual(string[0], amp._get_codec().tag)
+        self.assertEqual(amp.decode_msg(string), self.result[1:])
+        self.assertEqual(amp.decode_msg(amp.encode_msg(self.data)), self.result)
+
+    @unittest.skipIf(not amp.msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        codec = amp.MsgpackCodec()
+        data, result = self.data[1:], self.result[1:]
+        self.assertEqual(codec.decode(codec.encode(data)), result)
+        self.assertRaises(OverflowError, codec.encode, self.data)
+
+    @unittest.skipIf(not amp.msgpack, "msgpack is not installed")
+    def test_msgpack_fallback(self):
+        amp._get_codec()
+        with patch.object(amp, "_CODEC", amp.MsgpackCodec()):
+            self.assertEqual(amp.encode_msg(self.data[1:])[0], amp.MsgpackCodec.tag)
+            string = amp.encode_msg(self.data)
+        self.assertEqual(string[0], amp.BinaryCodec.tag)
+        self.assertEqual(amp.decode_msg(string), self.result)
+
+    def test_no_pickle(self):
+        if amp._get_codec().tag != amp.PickleCodec.tag:
+            self.assertRaises(ValueError, amp.decode_msg, "P" + amp.dumps(self.data))
+
+
+class TestTelnetOutputBuffer(TestCase):
+    def setUp(self):
+        from evennia.server.portal import telnet
+        self.telnet = telnet
+        self.proto = telnet.TelnetProtocol()
+        self.proto.transport = Mock()
+        self.proto.output_buffer = []
+        self.proto.output_buffer_size = 0
+        self.proto.output_task = None
+
+    def test_one_write_per_tick(self):
+        with patch.object(self.telnet.reactor, "callLater") as mockcall:
+            self.proto.sendLine("one")
+            self.proto.sendLine("two")
+            self.assertEqual(mockcall.call_count, 1)
+        self.assertFalse(self.proto.transport.write.called)
+        self.proto.flush_output()
+        self.proto.transport.write.assert_called_once_with("one\r\ntwo\r\n")
+
+    def test_bounded(self):
+        with patch.object(self.telnet, "_OUTPUT_BUFFER_SIZE", 5):
+            self.proto.sendLine("a long line")
+        self.proto.transport.write.assert_called_once_with("a long line\r\n")
+        self.assertEqual(self.proto.output_buffer, [])
+
+
+class TestPortalOutputBacklog(TestCase):
+    def setUp(self):
+        from evennia.server.portal import portalsessionhandler
+        self.psh = portalsessionhandler
+        self.handler = portalsessionhandler.PortalSessionHandler()
+        self.handler.portal = Mock()
+        self.session = Mock(sessid=1, protocol_flags={}, server_connected=True)
+
+    def test_pause_resume(self):
+        self.handler.output_paused(self.session)
+        self.assertTrue(self.session.protocol_flags["OUTPUT_PAUSED"])
+        self.handler.data_out(self.session, text=[["one"], {}])
+        self.handler.data_out(self.session, text=[["two"], {}])
+        self.assertFalse(self.session.send_text.called)
+        self.handler.output_resumed(self.session)
+        self.assertEqual([call[0][0] for call in self.session.send_text.call_args_list],
+                         ["one", "two"])
+        self.assertFalse(self.session.protocol_flags["OUTPUT_PAUSED"])
+        self.assertEqual(self.handler.portal.amp_protocol.send_MsgPortal2Server.call_count, 2)
+
+    def test_overflow_policies(self):
+        with patch.object(self.psh, "_OUTPUT_BACKLOG_SIZE", 5):
+            with patch.object(self.psh, "_OUTPUT_OVERFLOW_POLICY", "drop"):
+                self.handler.output_paused(self.session)
+                self.handler.data_out(self.session, text=[["one"], {}])
+                self.handler.data_out(self.session, text=[["two"], {}])
+                self.assertEqual(list(self.handler.output_backlogs[1][0]), [{"text": [["two"], {}]}])
+            with patch.object(self.psh, "_OUTPUT_OVERFLOW_POLICY", "truncate"):
+                self.handler.data_out(self.session, text=[["three"], {}])
+                self.assertEqual(list(self.handler.output_backlogs[1][0]),
+                                 [{"text": [[self.psh._OUTPUT_TRUNCATED], {}]}])
+            with patch.object(self.psh, "_OUTPUT_OVERFLOW_POLICY", "disconnect"):
+                self.handler.data_out(self.session, text=[["four"], {}])
+                self.assertTrue(self.session.disconnect.called)
+                self.assertFalse(self.handler.output_backlogs)
+
+
+class TestPortalInputThrottle(TestCase):
+    def setUp(self):
+        from evennia.server.portal import portalsessionhandler
+        self.psh = portalsessionhandler
+        self.handler = portalsessionhandler.PortalSessionHandler()
+        self.handler._relay_data_in = Mock()
+        self.flooder = Mock(sessid=1)
+        self.player = Mock(sessid=2)
+
+    def test_per_session(self):
+        with patch.object(self.psh, "_MAX_SESSION_COMMAND_RATE", 1.0), \
+                patch.object(self.psh, "_MAX_SESSION_COMMAND_BURST", 2.0), \
+                patch.object(self.psh, "_MAX_SESSION_COMMAND_QUEUE", 1), \
+                patch.object(self.psh.reactor, "callLater") as mockcall, \
+                patch.object(self.psh, "time", return_value=100.0) as mocktime:
+            for inp in range(4):
+                self.handler.data_in(self.flooder, text=[[inp], {}])
+            self.handler.data_in(self.player, text=[["look"], {}])
+            # two relayed, one queued and one dropped for the flooder
+            self.assertEqual([call[0][1]["text"][0][0] for call in self.handler._relay_data_in.call_args_list],
+                             [0, 1, "look"])
+            self.assertEqual(mockcall.call_count, 1)
+            self.assertEqual(mockcall.call_args[0][0], 1.0)
+            mocktime.return_value = 101.0
+            self.handler._process_command_queues()
+            self.assertEqual(self.handler._relay_data_in.call_args[0][1]["text"][0][0], 2)
+            self.assertFalse(self.handler.command_queues)
+
+    def test_no_queue(self):
+        with patch.object(self.psh, "_MAX_SESSION_COMMAND_RATE", 1.0), \
+                patch.object(self.psh, "_MAX_SESSION_COMMAND_BURST", 1.0), \
+                patch.object(self.psh, "_MAX_SESSION_COMMAND_QUEUE", 0), \
+                patch.object(self.psh.reactor, "callLater") as mockcall, \
+                patch.object(self.psh, "time", return_value=100.0) as mocktime:
+            self.handler.data_out = Mock()
+            for inp in range(3):
+                self.handler.data_in(self.flooder, text=[[inp], {}])
+            self.assertEqual(self.handler._relay_data_in.call_count, 1)
+            self.assertEqual(self.handler.data_out.call_count, 2)
+            self.assertFalse(self.handler.command_queues)
+            self.assertFalse(self.handler.command_queue_order)
+            self.assertFalse(mockcall.called)
+            # the session is not locked out once it has a token again
+            mocktime.return_value = 101.0
+            self.handler.data_in(self.flooder, text=[[3], {}])
+            self.assertEqual(self.handler._relay_data_in.call_count, 2)
+
+    def test_burst_below_one(self):
+        bucket = self.psh.TokenBucket(1.0, 0.5)
+        self.assertTrue(bucket.ready())
+
+
+class TestCleanSenddata(TestCase):
+    def setUp(self):
+        from evennia.server import sessionhandler
+        self.sessionhandler = sessionhandler
+        self.session = Mock(protocol_flags={"ENCODING": "utf-8"})
+
+    def test_inlinefunc_marker(self):
+        with patch.object(self.sessionhandler, "_INLINEFUNC_ENABLED", True), \
+                patch.object(self.sessionhandler, "parse_inlinefunc", return_value="parsed") as mockparse:
+            result = self.sessionhandler.SESSION_HANDLER.clean_senddata(
+                self.session, {"text": "hello", "prompt": "$pad(x)"})
+        self.assertEqual(mockparse.call_count, 1)
+        self.assertEqual(result["text"], [["hello"], {"options": {}}])
+        self.assertEqual(result["prompt"], [["parsed"], {"options": {}}])
+
+    def test_encoding(self):
+        encode = self.sessionhandler._get_encoder("latin-1")
+        self.assertEqual(encode("plain"), "plain")
+        self.assertEqual(encode("\xc3\xb6"), "\xf6")
+        self.assertEqual(encode(u"\xf6"), "\xf6")
+        self.session.protocol_flags["ENCODING"] = "nonexistent"
+        self.sessionhandler.SESSION_HANDLER.clean_senddata(self.session, {"text": "hello"})
+        self.assertEqual(self.session.protocol_flags["ENCODING"], "utf-8")
+
+
+class TestPortalConnectBatch(TestCase):
+    def setUp(self):
+        from evennia.server.portal import portalsessionhandler
+        self.psh = portalsessionhandler
+        self.handler = portalsessionhandler.PortalSessionHandler()
+        self.handler.portal = Mock()
+        self.send = self.handler.portal.amp_protocol.send_AdminPortal2Server
+
+    def tearDown(self):
+        self.psh._CONNECTION_QUEUE.clear()
+
+    def _session(self):
+        return Mock(transport=None, protocol_flags={})
+
+    def test_batch(self):
+        with patch.object(self.psh.reactor, "callLater") as mockcall:
+            self.handler.connect(self._session())
+            self.assertEqual(self.send.call_args[1]["operation"], self.psh.PCONN)
+            # the next ones are queued until the Server has answered
+            for _ in range(3):
+                self.handler.connect(self._session())
+            self.assertEqual(self.send.call_count, 1)
+            # fast answer; batch size is doubled
+            self.handler._connections_admitted(None, self.psh.time(), 1)
+            self.assertEqual(self.handler.connection_batch_size, 2)
+            self.assertTrue(mockcall.called)
+            self.handler.connection_task = None
+            self.handler._admit_connections()
+            self.assertEqual(self.send.call_args[1]["operation"], self.psh.PCONNBATCH)
+            self.assertEqual(len(self.send.call_args[1]["sessiondata"]), 2)
+            self.assertEqual(len(self.psh._CONNECTION_QUEUE), 1)
+            # slow answer; batch size is halved
+            self.handler._connections_admitted(None, 0, 2)
+            self.assertEqual(self.handler.connection_batch_size, 1)
@@ -39,6 +39,11 @@ TELNET_INTERFACES = ['0.0.0.0']
 # server-side (see INPUT_FUNC_MODULES). TELNET_ENABLED is required for this
 # to work.
 TELNET_OOB_ENABLED = False
+# Text sent to a telnet session during the same reactor tick is buffered
+# and written (and MCCP-compressed) together at the end of the tick. If
+# the buffer grows past this many bytes it is written at once instead.
+# Set to 0 to write all text immediately.
+TELNET_OUTPUT_BUFFER_SIZE = 65536
 # Start the evennia django+twisted webserver so you can
 # browse the evennia website and the admin interface
 # (Obs - further web configuration can be found below
@@ -156,6 +161,11 @@ ENCODINGS = ["utf-8", "latin-1", "ISO-8859-1"]
 # of users with screen readers. Note that ANSI/MXP doesn't need to
 # be stripped this way, that is handled automatically.
 SCREENREADER_REGEX_STRIP = r"\+-+|\+$|\+~|--+|~~+|==+"
+# Text parsed for ANSI colors and for the webclient's html is cached,
+# so the same text sent to many sessions (like a channel message) is
+# only parsed once for every set of client capabilities. This is the
+# max size of the cache in bytes of text (in each of Server and Portal).
+TEXT_PARSE_CACHE_SIZE = 4 * 1024 * 1024
 # The game server opens an AMP port so that the portal can
 # communicate with it. This is an internal functionality of Evennia, usually
 # operating between two processes on the same machine. You usually don't need to
@@ -164,43 +174,103 @@ SCREENREADER_REGEX_STRIP = r"\+-+|\+$|\+~|--+|~~+|==+"
 AMP_HOST = 'localhost'
 AMP_PORT = 5000
 AMP_INTERFACE = '127.0.0.1'
+# If True, all messages sent between Server and Portal during the same
+# reactor tick are sent over AMP together as one batch instead of one
+# by one. This makes for much less overhead when sending text to many
+# sessions at once.
+AMP_BATCH_SEND = True
+# Data sent over AMP smaller than this many bytes is sent uncompressed,
+# since compressing short text lines costs more time than it saves on
+# a local connection. Set to 0 to always try to compress.
+AMP_COMPRESS_THRESHOLD = 512
+# The zlib compression level (1-9) to use for data above the threshold.
+# Higher levels compress better but are slower.
+AMP_COMPRESS_LEVEL = 6
+# The codec used to encode the messages sent between Server and Portal.
+# The default uses the msgpack package if it is installed, otherwise
+# the pure-Python "evennia.server.amp.BinaryCodec". The older
+# "evennia.server.amp.PickleCodec" can send any picklable data, but
+# means unpickling whatever arrives over the AMP port.
+AMP_CODEC = "evennia.server.amp.MsgpackCodec"
 # Database objects are cached in what is known as the idmapper. The idmapper
 # caching results in a massive speedup of the server (since it dramatically
 # limits the number of database accesses needed) and also allows for
 # storing temporary data on objects. It is however also the main memory
-# consumer of Evennia. With this setting the cache can be capped and
-# flushed when it reaches a certain size. Minimum is 50 MB but it is
+# consumer of Evennia. With this setting the cache can be capped: when
+# the resident memory of the Server gets within 10% of this value, the
+# least recently used objects are evicted from the cache until the
+# estimated memory use is down to 80% of it. The memory use of the
+# cache is estimated by measuring a sample of the cached objects. The
+# resident memory is read from /proc (Linux) or with the psutil package
+# if installed; without either, the cap is not used. It is
 # not recommended to set this to less than 100 MB for a distribution
 # system.
-# Empirically, N_objects_in_cache ~ ((RMEM - 35) / 0.0157):
-#  mem(MB)   |  objs in cache   ||   mem(MB)   |   objs in cache
-#      50    |       ~1000      ||      800    |     ~49 000
-#     100    |       ~4000      ||     1200    |     ~75 000
-#     200    |      ~10 000     ||     1600    |    ~100 000
-#     500    |      ~30 000     ||     2000    |    ~125 000
-# Note that the estimated memory usage is not exact (and the cap is only
-# checked every 5 minutes), so err on the side of caution if
-# running on a server with limited memory. Also note that Python
-# will not necessarily return the memory to the OS when the idmapper
-# flashes (the memory will be freed and made available to the Python
-# process only). How many objects need to be in memory at any given
-# time depends very much on your game so some experimentation may
-# be necessary (use @server to see how many objects are in the idmapper
-# cache at any time). Setting this to None disables the cache cap.
+# Note that the cap is only checked every 5 minutes, so err on the side
+# of caution if running on a server with limited memory. Also note that
+# Python will not necessarily return the memory to the OS when the
+# idmapper flushes (the memory will be freed and made available to the
+# Python process only). How many objects need to be in memory at any
+# given time depends very much on your game so some experimentation may
+# be necessary (use @server and @idmapper to see how many objects are in
+# the idmapper cache at any time and how much memory they use). Setting
+# this to None disables the cache cap.
 IDMAPPER_CACHE_MAXSIZE = 200      # (MB)
-# This determines how many connections per second the Portal should
-# accept, as a DoS countermeasure. If the rate exceeds this number, incoming
-# connections will be queued to this rate, so none will be lost.
+# Max number of instances to keep in the idmapper cache of each database
+# model (like ObjectDB or PlayerDB). When a cache grows past this, the
+# least recently used instances are evicted from it a few at a time.
+# Objects whose at_idmapper_flush hook returns False (such as objects
+# with NAttributes) are never evicted. Either an integer used for all
+# models or a dict {"ObjectDB": 20000, ...} (models not in the dict are
+# not capped). Set to 0 or None to only use IDMAPPER_CACHE_MAXSIZE
+# above. Use @idmapper to see how the caches perform.
+IDMAPPER_CACHE_MAXENTRIES = 0
+# This determines how many times per second the Portal should pass
+# new connections on to the Server, as a DoS countermeasure. If
+# connections come in faster than this, they are queued, so none will
+# be lost. Queued connections are passed on in batches, and the next
+# batch is only sent when the Server has handled the previous one.
 # Must be set to a value > 0.
 MAX_CONNECTION_RATE = 2
-# Determine how many commands per second a given Session is allowed
-# to send to the Portal via a connected protocol. Too high rate will
-# drop the command and echo a warning. Note that this will also cap
-# OOB messages so don't set it too low if you expect a lot of events
-# from the client! To turn the limiter off, set to <= 0.
+# The max number of queued connections passed on in one batch. The
+# batch size starts at 1 and is doubled every time the Server handles
+# a full batch faster than CONNECTION_LATENCY_TARGET seconds, and
+# halved when it is slower. This means many clients reconnecting
+# at once (such as after a Portal restart) are let in quickly without
+# overloading the Server.
+MAX_CONNECTION_BATCH = 50
+CONNECTION_LATENCY_TARGET = 0.25
+# Determine how many commands per second all Sessions together are
+# allowed to send to the Server via the Portal. Commands coming in faster
+# than this are queued. Note that this will also cap OOB messages so
+# don't set it too low if you expect a lot of events from the client!
+# To turn the limiter off, set to <= 0.
 MAX_COMMAND_RATE = 80
+# How many commands per second a given Session is allowed to send on
+# average, and how many it may send in a quick burst. Commands coming in
+# faster than this are queued, so a flooding client only slows down
+# itself. Sessions with queued commands take turns sending them. To turn
+# the per-session limiter off, set the rate to <= 0. The burst is at
+# least 1 (lower values are raised to 1).
+MAX_SESSION_COMMAND_RATE = 10
+MAX_SESSION_COMMAND_BURST = 20
+# The max number of commands queued for a Session. Commands beyond
+# this are dropped with a warning. If <= 0, commands are never queued,
+# only dropped.
+MAX_SESSION_COMMAND_QUEUE = 50
 # The warning to echo back to users if they send commands too fast
 COMMAND_RATE_WARNING ="You entered commands too fast. Wait a moment and try again."
+# If a client doesn't receive data as fast as it is sent, the Portal
+# stops writing to it once this many bytes are waiting in its connection's
+# write buffer, and resumes when the buffer has been written. Output sent
+# meanwhile is kept in a backlog. Pausing and resuming is reported to the
+# Server as an `output_paused` inputfunc call. Set to 0 to turn this off.
+PORTAL_OUTPUT_HIGH_WATERMARK = 65536
+# The max size (in bytes of text) of a paused session's output backlog.
+PORTAL_OUTPUT_BACKLOG_SIZE = 262144
+# What to do when a backlog grows past PORTAL_OUTPUT_BACKLOG_SIZE. One of
+# "drop" (drop the oldest output), "truncate" (replace the whole backlog
+# with an "[output truncated]" line) or "disconnect" (disconnect the client).
+PORTAL_OUTPUT_OVERFLOW_POLICY = "drop"
 # If this is true, errors and tracebacks from the engine will be
 # echoed as text in-game as well as to the log. This can speed up
 # debugging. Showing full tracebacks to regular users could be a
@@ -301,6 +371,38 @@ WEB_PLUGINS_MODULE = "server.conf.web_plugins"
 # Tuple of modules implementing lock functions. All callable functions
 # inside these modules will be available as lock functions.
 LOCK_FUNC_MODULES = ("evennia.locks.lockfuncs", "server.conf.lockfuncs",)
+# If > 0, the result of a lock check will be cached for this many seconds
+# (it is also always cleared after every command and whenever the
+# permissions, tags or Attributes the lock depends on change). Only locks
+# using lock functions that declare their dependencies (with the
+# evennia.locks.lockhandler.lock_depends decorator) are cached. Lock
+# functions reading other data (like an object's location) are never
+# cached. Set to 0 to turn off the lock cache.
+LOCK_CACHE_TIMEOUT = 0
+# The class used to serialize Attribute values for storage in the
+# database. The default stores them as pickles. The alternative
+# "evennia.utils.picklefield.MsgpackSerializer" is faster to load and
+# more compact, but requires the msgpack package to be installed. Values
+# stored with a previous serializer can still be read after changing
+# this; to convert them all to the new format, stop the server and run
+# `evennia reencode_attributes`. Until then, searching for Attributes by
+# value (like attributes.get(value=...)) will not find values stored
+# with the previous serializer.
+ATTRIBUTE_SERIALIZER = "evennia.utils.picklefield.PickleSerializer"
+# If True, in-situ updates of mutables stored in Attributes (like
+# obj.db.mylist.append(1)) will not re-save the Attribute at once.
+# Instead all updates done during the same command/reactor tick are
+# saved together once the command/tick finishes. This greatly speeds
+# up repeated updates of large lists/dicts, at the cost of the database
+# lagging behind for the (very short) time until the tick ends.
+ATTRIBUTE_SAVE_COALESCE = False
+# If True, changing a database field through its property (like
+# obj.key = "foo") will not save it at once. Instead all fields changed
+# on an object during the same command/reactor tick are saved with one
+# database UPDATE once the command/tick finishes, all objects in one
+# transaction. Database queries done before then (like searching for
+# an object by its new key) will not see the change.
+FIELD_SAVE_COALESCE = False
 # Module holding handlers for managing incoming data from the client. These
 # will be loaded in order, meaning functions in later modules may overload
 # previous ones if having the same name.
@@ -338,6 +440,17 @@ COMMAND_DEFAULT_CLASS = "evennia.commands.default.muxcommand.MuxCommand"
 # default class logs channel messages to a file and allows for /history.
 # This setting allows to override the command class used with your own.
 CHANNEL_COMMAND_CLASS = "evennia.comms.channelhandler.ChannelCommand"
+# The command handler caches the result of merging the cmdsets available
+# to a caller, so the merge does not have to be redone every command.
+# This sets how many such mergers are kept (least recently used ones are
+# dropped first). Each unique combination of cmdsets (such as every room
+# with a different set of exits) needs its own entry, so a busy game
+# may want to raise this. Use @server to see how well the cache
+# performs. Note that a cached merger references the objects its commands
+# are defined on, so objects deleted or evicted from the idmapper cache
+# may be kept in memory until their mergers are dropped from this cache.
+# Set to 0 to disable the cache.
+CMDSET_MERGE_CACHE_SIZE = 1000
 
 ######################################################################
 # Typeclasses and other paths
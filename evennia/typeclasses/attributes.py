@@ -17,9 +17,9 @@ from django.db import models
 from django.conf import settings
 from django.utils.encoding import smart_str
 
-from evennia.locks.lockhandler import LockHandler
+from evennia.locks.lockhandler import LockHandler, invalidate_lock_cache
 from evennia.utils.idmapper.models import SharedMemoryModel
-from evennia.utils.dbserialize import to_pickle, from_pickle
+from evennia.utils.dbserialize import to_pickle, from_pickle, get_pending_save, discard_pending_save
 from evennia.utils.picklefield import PickledObjectField
 from evennia.utils.utils import lazy_property, to_str, make_iter
 
@@ -136,6 +136,10 @@ class Attribute(SharedMemoryModel):
         as storing a dbobj which is then deleted elsewhere) out-of-sync.
         The overhead of unpickling seems hard to avoid.
         """
+        # in-situ changes may still be waiting to be saved
+        pending = get_pending_save(self)
+        if pending is not None:
+            return pending
         return from_pickle(self.db_value, db_obj=self)
 
     #@value.setter
@@ -144,9 +148,12 @@ class Attribute(SharedMemoryModel):
         Setter. Allows for self.value = value. We cannot cache here,
         see self.__value_get.
         """
+        # a new value replaces any in-situ changes waiting to be saved
+        discard_pending_save(self)
         self.db_value = to_pickle(new_value)
         #print "value_set, self.db_value:", repr(self.db_value)
         self.save(update_fields=["db_value"])
+        invalidate_lock_cache("attributes")
 
     #@value.deleter
     def __value_del(self):
@@ -197,6 +204,7 @@ class AttributeHandler(object):
     Handler for adding Attributes to the object.
     """
     _m2m_fieldname = "db_attributes"
+    _handlername = "attributes"
     _attrcreate = "attrcreate"
     _attredit = "attredit"
     _attrread = "attrread"
@@ -207,20 +215,107 @@ class AttributeHandler(object):
         self.obj = obj
         self._objid = obj.id
         self._model = to_str(obj.__dbclass__.__name__.lower())
+        # cached Attributes, stored as {category: {key: attr}}
         self._cache = {}
         # store category names fully cached
-        self._catcache = {}
+        self._catcache = set()
+        # (key, category) known to have no Attribute (from prefetch)
+        self._cache_missing = set()
         # full cache was run on all attributes
         self._cache_complete = False
 
+    @classmethod
+    def prefetch(cls, objs, keys=None, category=None):
+        """
+        Load Attributes of many objects into their handlers' caches at
+        once. This avoids one database query per object when
+        reading Attributes from many objects in a row (like all
+        objects in a room).
+
+        Args:
+            objs (list or queryset): The typeclassed objects to load
+                Attributes for. These may be of different types.
+            keys (str or list, optional): Only load Attributes with these
+                keys. If not given, load all Attributes of `category`,
+                or all Attributes if `category` is also not given.
+            category (str, optional): The category of the Attributes to
+                load. Only used if `keys` or `category` is given.
+
+        Notes:
+            Objects whose caches are already complete are skipped. This
+            does nothing if `TYPECLASS_AGGRESSIVE_CACHE` is `False`.
+
+        """
+        if not _TYPECLASS_AGGRESSIVE_CACHE:
+            return
+        keys = [to_str(key).strip().lower() for key in make_iter(keys)] if keys else None
+        category = category.strip().lower() if category else None
+        full = not (keys or category)
+        # group the handlers by their database model
+        handlers = defaultdict(dict)
+        for obj in make_iter(objs):
+            handler = getattr(obj, cls._handlername, None) if obj else None
+            if handler and not handler._cache_complete:
+                handlers[handler._model][handler._objid] = handler
+        for model, modelhandlers in handlers.items():
+            handler = next(iter(modelhandlers.values()))
+            query = {"%s__id__in" % model: list(modelhandlers),
+                     "attribute__db_attrtype": cls._attrtype}
+            if keys:
+                query["attribute__db_key__in"] = keys
+            if not full:
+                query["attribute__db_category"] = category
+            conns = getattr(handler.obj, cls._m2m_fieldname).through.objects.filter(
+                **query).select_related("attribute")
+            attrs = defaultdict(list)
+            for conn in conns:
+                attrs[getattr(conn, "%s_id" % model)].append(conn.attribute)
+            for objid, handler in modelhandlers.items():
+                if full:
+                    handler._cache = {}
+                    handler._cache_attrs(attrs[objid])
+                    handler._cache_missing = set()
+                    handler._cache_complete = True
+                elif keys:
+                    handler._cache_attrs(attrs[objid])
+                    catcache = handler._cache.get(category, {})
+                    handler._cache_missing.update((key, category) for key in keys
+                                                  if key not in catcache)
+                else:
+                    handler._cache[category] = {}
+                    handler._cache_attrs(attrs[objid])
+                    handler._catcache.add(category)
+
+    def _cache_attrs(self, attrs):
+        """
+        Store Attributes in the cache.
+
+        Args:
+            attrs (list): Attributes to cache.
+
+        """
+        for attr in attrs:
+            category = attr.db_category.lower() if attr.db_category else None
+            self._cache.setdefault(category, {})[to_str(attr.db_key).lower()] = attr
+
+    def _cache_values(self):
+        """
+        Get all cached Attributes.
+
+        Returns:
+            attrs (list): All Attributes in the cache.
+
+        """
+        return [attr for catcache in self._cache.values() for attr in catcache.values()]
+
     def _fullcache(self):
         "Cache all attributes of this object"
         query = {"%s__id" % self._model : self._objid,
                  "attribute__db_attrtype" : self._attrtype}
         attrs = [conn.attribute for conn in getattr(self.obj, self._m2m_fieldname).through.objects.filter(**query)]
-        self._cache = dict(("%s-%s" % (to_str(attr.db_key).lower(),
-                                       attr.db_category.lower() if attr.db_category else None),
-                            attr) for attr in attrs)
+        self._cache = {}
+        self._cache_attrs(attrs)
+        self._cache_missing = set()
         self._cache_complete = True
 
     def _getcache(self, key=None, category=None):
@@ -249,14 +344,18 @@ class AttributeHandler(object):
         key = key.strip().lower() if key else None
         category = category.strip().lower() if category else None
         if key:
-            cachekey = "%s-%s" % (key, category)
-            attr = _TYPECLASS_AGGRESSIVE_CACHE and self._cache.get(cachekey, None)
+            catcache = self._cache.get(category, {})
+            attr = _TYPECLASS_AGGRESSIVE_CACHE and catcache.get(key, None)
             if attr and (not hasattr(attr, "pk") and attr.pk is None):
                 # clear out Attributes deleted from elsewhere. We must search this anew.
                 attr = None
-                del self._cache[cachekey]
+                del catcache[key]
             if attr:
                 return [attr]  # return cached entity
+            elif _TYPECLASS_AGGRESSIVE_CACHE and (self._cache_complete or
+                                                  (key, category) in self._cache_missing):
+                # we know there is no such Attribute
+                return []
             else:
                 query = {"%s__id" % self._model : self._objid,
                          "attribute__db_attrtype" : self._attrtype,
@@ -265,15 +364,14 @@ class AttributeHandler(object):
                 conn = getattr(self.obj, self._m2m_fieldname).through.objects.filter(**query)
                 if conn:
                     attr = conn[0].attribute
-                    self._cache[cachekey] = attr
+                    self._cache.setdefault(category, {})[key] = attr
                     return [attr] if attr.pk else []
         else:
             # only category given (even if it's None) - we can't
             # assume the cache to be complete unless we have queried
             # for this category before
-            catkey = "-%s" % category
-            if _TYPECLASS_AGGRESSIVE_CACHE and catkey in self._catcache:
-                return [attr for key, attr in self._cache.items() if key.endswith(catkey)]
+            if _TYPECLASS_AGGRESSIVE_CACHE and (self._cache_complete or category in self._catcache):
+                return list(self._cache.get(category, {}).values())
             else:
                 # we have to query to make this category up-date in the cache
                 query = {"%s__id" % self._model : self._objid,
@@ -281,12 +379,10 @@ class AttributeHandler(object):
                          "attribute__db_category__iexact" : category.lower() if category else None}
                 attrs = [conn.attribute for conn in getattr(self.obj,
                             self._m2m_fieldname).through.objects.filter(**query)]
-                for attr in attrs:
-                    if attr.pk:
-                        cachekey = "%s-%s" % (attr.db_key, category)
-                        self._cache[cachekey] = attr
+                self._cache[category] = dict((to_str(attr.db_key).lower(), attr)
+                                             for attr in attrs if attr.pk)
                 # mark category cache as up-to-date
-                self._catcache[catkey] = True
+                self._catcache.add(category)
                 return attrs
         return []
 
@@ -302,12 +398,8 @@ class AttributeHandler(object):
         """
         if not key: # don't allow an empty key in cache
             return
-        cachekey = "%s-%s" % (key, category)
-        catkey = "-%s" % category
-        self._cache[cachekey] = attr_obj
-        # mark that the category cache is no longer up-to-date
-        self._catcache.pop(catkey, None)
-        self._cache_complete = False
+        self._cache.setdefault(category, {})[key] = attr_obj
+        self._cache_missing.discard((key, category))
 
     def _delcache(self, key, category):
         """
@@ -318,16 +410,10 @@ class AttributeHandler(object):
             category (str or None): A cleaned category name
 
         """
-        catkey = "-%s" % category
         if key:
-            cachekey = "%s-%s" % (key, category)
-            self._cache.pop(cachekey, None)
+            self._cache.get(category, {}).pop(key, None)
         else:
-            self._cache = {key: attrobj for key, attrobj in
-                        self._cache.items() if not key.endswith(catkey)}
-        # mark that the category cache is no longer up-to-date
-        self._catcache.pop(catkey, None)
-        self._cache_complete = False
+            self._cache.pop(category, None)
 
     def reset_cache(self):
         """
@@ -335,7 +421,8 @@ class AttributeHandler(object):
         """
         self._cache_complete = False
         self._cache = {}
-        self._catcache = {}
+        self._catcache = set()
+        self._cache_missing = set()
 
     def has(self, key=None, category=None):
         """
@@ -460,6 +547,7 @@ class AttributeHandler(object):
         if not key:
             return
 
+        invalidate_lock_cache("attributes")
         category = category.strip().lower() if category is not None else None
         keystr = key.strip().lower()
         attr_obj = self._getcache(key, category)
@@ -520,6 +608,7 @@ class AttributeHandler(object):
             # check create access
             return
 
+        invalidate_lock_cache("attributes")
         keys, values = make_iter(key), make_iter(value)
 
         if len(keys) != len(values):
@@ -581,6 +670,7 @@ class AttributeHandler(object):
                 was found matching `key`.
 
         """
+        invalidate_lock_cache("attributes")
         for keystr in make_iter(key):
             attr_objs = self._getcache(keystr, category)
             for attr_obj in attr_objs:
@@ -592,7 +682,8 @@ class AttributeHandler(object):
                         # this happens if the attr was already deleted
                         pass
                     finally:
-                        self._delcache(key, category)
+                        self._delcache(to_str(attr_obj.db_key).lower(),
+                                       attr_obj.db_category.lower() if attr_obj.db_category else None)
             if not attr_objs and raise_exception:
                 raise AttributeError
 
@@ -610,14 +701,13 @@ class AttributeHandler(object):
                 type `attredit` on the Attribute in question.
 
         """
+        invalidate_lock_cache("attributes")
         if accessing_obj:
-            [attr.delete() for attr in self._cache.values()
+            [attr.delete() for attr in self._cache_values()
              if attr.access(accessing_obj, self._attredit, default=default_access)]
         else:
-            [attr.delete() for attr in self._cache.values()]
-        self._cache = {}
-        self._catcache = {}
-        self._cache_complete = False
+            [attr.delete() for attr in self._cache_values()]
+        self.reset_cache()
 
     def all(self, accessing_obj=None, default_access=True):
         """
@@ -638,7 +728,7 @@ class AttributeHandler(object):
         """
         if not self._cache_complete:
             self._fullcache()
-        attrs = sorted(self._cache.values(), key=lambda o: o.id)
+        attrs = sorted(self._cache_values(), key=lambda o: o.id)
         if accessing_obj:
             return [attr for attr in attrs
                 if attr.access(accessing_obj, self._attredit, default=default_access)]
@@ -753,6 +843,7 @@ class NickHandler(AttributeHandler):
 
     """
     _attrtype = "nick"
+    _handlername = "nicks"
 
     def __init__(self, *args, **kwargs):
         super(NickHandler, self).__init__(*args, **kwargs)
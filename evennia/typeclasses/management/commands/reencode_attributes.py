@@ -0,0 +1,46 @@
+"""
+Re-encode all stored Attribute values with the serializer currently set
+by `settings.ATTRIBUTE_SERIALIZER`. Run with the server stopped:
+
+    evennia reencode_attributes
+
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from evennia.typeclasses.attributes import Attribute
+from evennia.utils.picklefield import (dbsafe_encode, dbsafe_decode,
+                                       get_value_tag, _get_serializer)
+
+
+class Command(BaseCommand):
+    help = "Re-encode all Attribute values with the current ATTRIBUTE_SERIALIZER."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of Attributes to convert per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        tag = _get_serializer().tag
+        table = connection.ops.quote_name(Attribute._meta.db_table)
+        # we read the raw values so as to only touch the ones needing it
+        query = "SELECT id, db_value FROM %s WHERE db_value IS NOT NULL " \
+                "AND id > %%s ORDER BY id LIMIT %%s" % table
+        cursor = connection.cursor()
+        total, converted, last_id = 0, 0, 0
+        while True:
+            cursor.execute(query, [last_id, batch_size])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            total += len(rows)
+            last_id = rows[-1][0]
+            with transaction.atomic():
+                for pk, value in rows:
+                    if get_value_tag(value) == tag:
+                        continue
+                    Attribute.objects.filter(id=pk).update(
+                        db_value=dbsafe_encode(dbsafe_decode(value)))
+                    converted += 1
+        self.stdout.write("Re-encoded %i of %i Attribute values (serializer tag: '%s')."
+                          % (converted, total, tag))
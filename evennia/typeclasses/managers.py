@@ -12,6 +12,7 @@ from evennia.utils.utils import make_iter, variable_from_module
 __all__ = ("TypedObjectManager", )
 _GA = object.__getattribute__
 _Tag = None
+_AttributeHandler = None
 
 #
 # Decorators
@@ -177,6 +178,27 @@ class TypedObjectManager(idmapper.manager.SharedMemoryManager):
         """
         return self.get_by_attribute(key=key, category=category, strvalue=nick, attrtype="nick")
 
+    def prefetch_attributes(self, objs, keys=None, category=None):
+        """
+        Load the Attributes of many objects in one go, so that reading
+        them afterwards does not need one database query per object.
+
+        Args:
+            objs (list or queryset): The objects to load Attributes for.
+            keys (str or list, optional): Only load Attributes with these keys.
+            category (str, optional): Only load Attributes of this category.
+
+        Returns:
+            objs (list): The objects, with their Attributes cached.
+
+        """
+        global _AttributeHandler
+        if not _AttributeHandler:
+            from evennia.typeclasses.attributes import AttributeHandler as _AttributeHandler
+        objs = list(objs)
+        _AttributeHandler.prefetch(objs, keys=keys, category=category)
+        return objs
+
     # Tag manager methods
 
     def get_tag(self, key=None, category=None, obj=None, tagtype=None, global_search=False):
@@ -37,7 +37,7 @@ from django.utils.encoding import smart_str
 from evennia.typeclasses.attributes import Attribute, AttributeHandler, NAttributeHandler
 from evennia.typeclasses.tags import Tag, TagHandler, AliasHandler, PermissionHandler
 
-from evennia.utils.idmapper.models import SharedMemoryModel, SharedMemoryModelBase
+from evennia.utils.idmapper.models import SharedMemoryModel, SharedMemoryModelBase, get_postsave_hooks
 
 from evennia.typeclasses import managers
 from evennia.locks.lockhandler import LockHandler
@@ -56,6 +56,52 @@ _TYPECLASS_AGGRESSIVE_CACHE = settings.TYPECLASS_AGGRESSIVE_CACHE
 _GA = object.__getattribute__
 _SA = object.__setattr__
 
+# typeclass path -> class, see typeclass_from_path
+_TYPECLASS_CLASSES = {}
+
+
+def typeclass_from_path(path, defaultpaths=None):
+    """
+    Get the class for a typeclass path. This caches the class found
+    by `class_from_module`, which would otherwise import its way
+    through the possible paths every time a typeclassed entity is
+    instantiated (such as for every object loaded from the database).
+
+    Args:
+        path (str): The python path to the typeclass.
+        defaultpaths (iterable, optional): Paths to prepend to `path`
+            if it can't be imported directly. This should always be
+            `settings.TYPECLASS_PATHS`, since the result is cached
+            by `path` only.
+
+    Returns:
+        typeclass (Class): The typeclass.
+
+    Raises:
+        ImportError: If the typeclass could not be loaded. Failed
+            lookups are not cached.
+
+    Notes:
+        Since the Server process restarts on a @reload, changed
+        typeclass modules are picked up then. Use
+        `clear_typeclass_cache` if reloading modules in-process.
+
+    """
+    try:
+        return _TYPECLASS_CLASSES[path]
+    except KeyError:
+        typeclass = class_from_module(path, defaultpaths=defaultpaths)
+        _TYPECLASS_CLASSES[path] = typeclass
+        return typeclass
+
+
+def clear_typeclass_cache():
+    """
+    Empty the cache used by `typeclass_from_path`.
+
+    """
+    _TYPECLASS_CLASSES.clear()
+
 #------------------------------------------------------------
 #
 # Typed Objects
@@ -106,6 +152,8 @@ class TypeclassBase(SharedMemoryModelBase):
         # with a few lines changed as per
         # https://code.djangoproject.com/ticket/11560
         new_class = patched_new(cls, name, bases, attrs)
+        # patched_new bypasses SharedMemoryModelBase.__new__
+        new_class._postsave_hooks = get_postsave_hooks(new_class)
 
         # attach signal
         signals.post_save.connect(post_save, sender=new_class)
@@ -230,15 +278,15 @@ class TypedObject(SharedMemoryModel):
         super(TypedObject, self).__init__(*args, **kwargs)
         if typeclass_path:
             try:
-                self.__class__ = class_from_module(typeclass_path, defaultpaths=settings.TYPECLASS_PATHS)
+                self.__class__ = typeclass_from_path(typeclass_path, defaultpaths=settings.TYPECLASS_PATHS)
             except Exception:
                 log_trace()
                 try:
-                    self.__class__ = class_from_module(self.__settingsclasspath__)
+                    self.__class__ = typeclass_from_path(self.__settingsclasspath__)
                 except Exception:
                     log_trace()
                     try:
-                        self.__class__ = class_from_module(self.__defaultclasspath__)
+                        self.__class__ = typeclass_from_path(self.__defaultclasspath__)
                     except Exception:
                         log_trace()
                         self.__class__ = self._meta.proxy_for_model or self.__class__
@@ -246,11 +294,11 @@ class TypedObject(SharedMemoryModel):
                 self.db_typeclass_path = typeclass_path
         elif self.db_typeclass_path:
             try:
-                self.__class__ = class_from_module(self.db_typeclass_path)
+                self.__class__ = typeclass_from_path(self.db_typeclass_path)
             except Exception:
                 log_trace()
                 try:
-                    self.__class__ = class_from_module(self.__defaultclasspath__)
+                    self.__class__ = typeclass_from_path(self.__defaultclasspath__)
                 except Exception:
                     log_trace()
                     self.__dbclass__ = self._meta.proxy_for_model or self.__class__
@@ -329,7 +377,7 @@ class TypedObject(SharedMemoryModel):
     def key(self, value):
         oldname = str(self.db_key)
         self.db_key = value
-        self.save(update_fields=["db_key"])
+        self._save_field("db_key")
         self.at_rename(oldname, value)
 
     #
@@ -491,7 +539,7 @@ class TypedObject(SharedMemoryModel):
 
         if not callable(new_typeclass):
             # this is an actual class object - build the path
-            new_typeclass = class_from_module(new_typeclass, defaultpaths=settings.TYPECLASS_PATHS)
+            new_typeclass = typeclass_from_path(new_typeclass, defaultpaths=settings.TYPECLASS_PATHS)
 
         # if we get to this point, the class is ok.
 
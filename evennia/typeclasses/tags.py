@@ -13,6 +13,7 @@ from builtins import object
 
 from django.conf import settings
 from django.db import models
+from evennia.locks.lockhandler import invalidate_lock_cache
 from evennia.utils.utils import to_str, make_iter
 
 
@@ -82,6 +83,8 @@ class TagHandler(object):
     """
     _m2m_fieldname = "db_tags"
     _tagtype = None
+    # the lock dependency invalidated when the tags change
+    _lockdependency = "tags"
 
     def __init__(self, obj):
         """
@@ -96,20 +99,32 @@ class TagHandler(object):
         self.obj = obj
         self._objid = obj.id
         self._model = obj.__dbclass__.__name__.lower()
+        # cached Tags, stored as {category: {key: tag}}
         self._cache = {}
         # store category names fully cached
-        self._catcache = {}
+        self._catcache = set()
         # full cache was run on all tags
         self._cache_complete = False
 
+    def _cache_tags(self, tags):
+        """
+        Store Tags in the cache.
+
+        Args:
+            tags (list): Tags to cache.
+
+        """
+        for tag in tags:
+            category = tag.db_category.lower() if tag.db_category else None
+            self._cache.setdefault(category, {})[to_str(tag.db_key).lower()] = tag
+
     def _fullcache(self):
         "Cache all tags of this object"
         query = {"%s__id" % self._model : self._objid,
                  "tag__db_tagtype" : self._tagtype}
         tags = [conn.tag for conn in getattr(self.obj, self._m2m_fieldname).through.objects.filter(**query)]
-        self._cache = dict(("%s-%s" % (to_str(tag.db_key).lower(),
-                                       tag.db_category.lower() if tag.db_category else None),
-                            tag) for tag in tags)
+        self._cache = {}
+        self._cache_tags(tags)
         self._cache_complete = True
 
     def _getcache(self, key=None, category=None):
@@ -138,14 +153,17 @@ class TagHandler(object):
         key = key.strip().lower() if key else None
         category = category.strip().lower() if category else None
         if key:
-            cachekey = "%s-%s" % (key, category)
-            tag = _TYPECLASS_AGGRESSIVE_CACHE and self._cache.get(cachekey, None)
+            catcache = self._cache.get(category, {})
+            tag = _TYPECLASS_AGGRESSIVE_CACHE and catcache.get(key, None)
             if tag and (not hasattr(tag, "pk") and tag.pk is None):
                 # clear out Tags deleted from elsewhere. We must search this anew.
                 tag = None
-                del self._cache[cachekey]
+                del catcache[key]
             if tag:
                 return [tag]  # return cached entity
+            elif _TYPECLASS_AGGRESSIVE_CACHE and self._cache_complete:
+                # we know there is no such Tag
+                return []
             else:
                 query = {"%s__id" % self._model : self._objid,
                          "tag__db_tagtype" : self._tagtype,
@@ -154,15 +172,14 @@ class TagHandler(object):
                 conn = getattr(self.obj, self._m2m_fieldname).through.objects.filter(**query)
                 if conn:
                     tag = conn[0].tag
-                    self._cache[cachekey] = tag
+                    self._cache.setdefault(category, {})[key] = tag
                     return [tag]
         else:
             # only category given (even if it's None) - we can't
             # assume the cache to be complete unless we have queried
             # for this category before
-            catkey = "-%s" % category
-            if _TYPECLASS_AGGRESSIVE_CACHE and catkey in self._catcache:
-                return [tag for key, tag in self._cache.items() if key.endswith(catkey)]
+            if _TYPECLASS_AGGRESSIVE_CACHE and (self._cache_complete or category in self._catcache):
+                return list(self._cache.get(category, {}).values())
             else:
                 # we have to query to make this category up-date in the cache
                 query = {"%s__id" % self._model : self._objid,
@@ -170,11 +187,9 @@ class TagHandler(object):
                          "tag__db_category__iexact" : category.lower() if category else None}
                 tags = [conn.tag for conn in getattr(self.obj,
                             self._m2m_fieldname).through.objects.filter(**query)]
-                for tag in tags:
-                    cachekey = "%s-%s" % (tag.db_key, category)
-                    self._cache[cachekey] = tag
+                self._cache[category] = dict((to_str(tag.db_key).lower(), tag) for tag in tags)
                 # mark category cache as up-to-date
-                self._catcache[catkey] = True
+                self._catcache.add(category)
                 return tags
         return []
 
@@ -190,12 +205,7 @@ class TagHandler(object):
         """
         if not key: # don't allow an empty key in cache
             return
-        cachekey = "%s-%s" % (key, category)
-        catkey = "-%s" % category
-        self._cache[cachekey] = tag_obj
-        # mark that the category cache is no longer up-to-date
-        self._catcache.pop(catkey, None)
-        self._cache_complete = False
+        self._cache.setdefault(category, {})[key] = tag_obj
 
     def _delcache(self, key, category):
         """
@@ -206,15 +216,10 @@ class TagHandler(object):
             category (str or None): A cleaned category name
 
         """
-        catkey = "-%s" % category
         if key:
-            cachekey = "%s-%s" % (key, category)
-            self._cache.pop(cachekey, None)
+            self._cache.get(category, {}).pop(key, None)
         else:
-            [self._cache.pop(key, None) for key in self._cache if key.endswith(catkey)]
-        # mark that the category cache is no longer up-to-date
-        self._catcache.pop(catkey, None)
-        self._cache_complete = False
+            self._cache.pop(category, None)
 
     def reset_cache(self):
         """
@@ -222,7 +227,7 @@ class TagHandler(object):
         """
         self._cache_complete = False
         self._cache = {}
-        self._catcache = {}
+        self._catcache = set()
 
     def add(self, tag=None, category=None, data=None):
         """
@@ -244,6 +249,7 @@ class TagHandler(object):
         """
         if not tag:
             return
+        invalidate_lock_cache(self._lockdependency)
         for tagstr in make_iter(tag):
             if not tagstr:
                 continue
@@ -294,6 +300,7 @@ class TagHandler(object):
                 category.
 
         """
+        invalidate_lock_cache(self._lockdependency)
         for key in make_iter(key):
             if not (key or key.strip()):  # we don't allow empty tags
                 continue
@@ -305,7 +312,7 @@ class TagHandler(object):
             tagobj = self.obj.db_tags.filter(db_key=tagstr, db_category=category)
             if tagobj:
                 getattr(self.obj, self._m2m_fieldname).remove(tagobj[0])
-            self._delcache(key, category)
+            self._delcache(tagstr, category)
 
     def clear(self, category=None):
         """
@@ -317,13 +324,12 @@ class TagHandler(object):
                 category.
 
         """
+        invalidate_lock_cache(self._lockdependency)
         if not category:
             getattr(self.obj, self._m2m_fieldname).clear()
         else:
             getattr(self.obj, self._m2m_fieldname).filter(db_category=category).delete()
-        self._cache = {}
-        self._catcache = {}
-        self._cache_complete = False
+        self.reset_cache()
 
     def all(self, return_key_and_category=False):
         """
@@ -341,7 +347,7 @@ class TagHandler(object):
         """
         if not self._cache_complete:
             self._fullcache()
-        tags = sorted(self._cache.values())
+        tags = sorted(tag for catcache in self._cache.values() for tag in catcache.values())
         if return_key_and_category:
                 # return tuple (key, category)
             return [(to_str(tag.db_key), to_str(tag.db_category)) for tag in tags]
@@ -362,6 +368,7 @@ class AliasHandler(TagHandler):
 
     """
     _tagtype = "alias"
+    _lockdependency = "aliases"
 
 
 class PermissionHandler(TagHandler):
@@ -370,4 +377,5 @@ class PermissionHandler(TagHandler):
 
     """
     _tagtype = "permission"
+    _lockdependency = "permissions"
 
@@ -0,0 +1,99 @@
+"""
+Unit tests for typeclass base system
+
+"""
+
+from mock import patch
+from evennia.objects.models import ObjectDB
+from evennia.typeclasses.attributes import AttributeHandler
+from evennia.utils.test_resources import EvenniaTest
+
+# ------------------------------------------------------------
+# Manager tests
+# ------------------------------------------------------------
+
+
+class TestAttributePrefetch(EvenniaTest):
+    def setUp(self):
+        super(TestAttributePrefetch, self).setUp()
+        self.obj1.db.hp = 10
+        self.obj2.db.hp = 20
+        self.obj2.attributes.add("skill", 5, category="stats")
+        self.objs = [self.obj1, self.obj2, self.char1]
+        for obj in self.objs:
+            obj.attributes.reset_cache()
+
+    def test_prefetch_all(self):
+        with self.assertNumQueries(1):
+            AttributeHandler.prefetch(self.objs)
+        with self.assertNumQueries(0):
+            self.assertEqual([obj.db.hp for obj in self.objs], [10, 20, None])
+            self.assertEqual(self.obj2.attributes.get("skill", category="stats"), 5)
+            self.assertEqual(len(self.obj2.attributes.all()), 2)
+            # already complete, so nothing is loaded again
+            AttributeHandler.prefetch(self.objs)
+        self.obj1.db.mp = 1
+        self.assertEqual(self.obj1.db.mp, 1)
+
+    def test_prefetch_keys(self):
+        with self.assertNumQueries(1):
+            objs = ObjectDB.objects.prefetch_attributes(self.objs, keys="hp")
+        self.assertEqual(objs, self.objs)
+        with self.assertNumQueries(0):
+            self.assertEqual([obj.db.hp for obj in self.objs], [10, 20, None])
+        # not prefetched, so loaded as usual
+        self.assertEqual(self.obj2.attributes.get("skill", category="stats"), 5)
+        self.char1.db.hp = 30
+        self.assertEqual(self.char1.db.hp, 30)
+
+    def test_prefetch_category(self):
+        with self.assertNumQueries(1):
+            AttributeHandler.prefetch(self.objs, category="stats")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.obj2.attributes.get(category="stats", return_obj=True).value, 5)
+            self.assertEqual(self.obj1.attributes.get(category="stats"), None)
+
+
+class TestHandlerCaches(EvenniaTest):
+    def test_attribute_categories(self):
+        self.obj1.attributes.add("Test1", 1, category="Cat")
+        self.obj1.attributes.add("test2", 2, category="cat")
+        self.obj1.attributes.add("test1", 3)
+        self.assertEqual(set(self.obj1.attributes._cache["cat"]), set(["test1", "test2"]))
+        self.obj1.attributes.reset_cache()
+        # category lookups are cached under the normalized key
+        self.assertEqual(sorted(attr.value for attr in
+                                self.obj1.attributes.get(category="CAT", return_obj=True)), [1, 2])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.obj1.attributes.get("TEST1", category="cat"), 1)
+        self.obj1.attributes.remove("Test1", category="Cat")
+        self.assertEqual(self.obj1.attributes.get(category="cat"), 2)
+        self.assertEqual(self.obj1.attributes.get("test1"), 3)
+
+    def test_tag_categories(self):
+        self.obj1.tags.add("Tag1", category="Cat")
+        self.obj1.tags.add("tag2", category="cat")
+        self.obj1.tags.add("tag3")
+        self.obj1.tags.reset_cache()
+        self.assertEqual(sorted(self.obj1.tags.get(category="cat")), ["tag1", "tag2"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.obj1.tags.get("TAG2", category="cat"), "tag2")
+        self.obj1.tags.remove("Tag1", category="cat")
+        self.assertEqual(self.obj1.tags.get(category="cat"), "tag2")
+        self.assertEqual(sorted(self.obj1.tags.all()), ["tag2", "tag3"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.obj1.tags.get("tag4"), None)
+
+
+class TestTypeclassFromPath(EvenniaTest):
+    def test_cached(self):
+        from evennia.typeclasses import models
+        path = self.obj1.typeclass_path
+        models.clear_typeclass_cache()
+        with patch("evennia.typeclasses.models.class_from_module",
+                   wraps=models.class_from_module) as mock_class_from_module:
+            self.assertEqual(models.typeclass_from_path(path), type(self.obj1))
+            self.assertEqual(models.typeclass_from_path(path), type(self.obj1))
+            self.assertEqual(mock_class_from_module.call_count, 1)
+        self.assertRaises(ImportError, models.typeclass_from_path, "evennia.objects.objects.NoSuchClass")
+        self.assertFalse("evennia.objects.objects.NoSuchClass" in models._TYPECLASS_CLASSES)
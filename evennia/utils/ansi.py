@@ -16,6 +16,7 @@ user.
 from builtins import object, range
 
 import re
+from django.conf import settings
 from evennia.utils import utils
 from evennia.utils.utils import to_str, to_unicode
 from future.utils import with_metaclass
@@ -64,9 +65,8 @@ ANSI_SPACE = " "
 # Escapes
 ANSI_ESCAPES = ("{{", "\\\\", "\|\|")
 
-from collections import OrderedDict
-_PARSE_CACHE = OrderedDict()
-_PARSE_CACHE_SIZE = 10000
+# parsed strings, shared by all parsers (and the text2html parser)
+_PARSE_CACHE = utils.StringCache(settings.TEXT_PARSE_CACHE_SIZE)
 
 
 class ANSIParser(object):
@@ -252,10 +252,10 @@ class ANSIParser(object):
             return ''
 
         # check cached parsings
-        global _PARSE_CACHE
-        cachekey = "%s-%s-%s-%s" % (string, strip_ansi, xterm256, mxp)
-        if cachekey in _PARSE_CACHE:
-            return _PARSE_CACHE[cachekey]
+        cachekey = (string, type(self), strip_ansi, xterm256, mxp)
+        parsed_string = _PARSE_CACHE.get(cachekey)
+        if parsed_string is not None:
+            return parsed_string
 
         # pre-convert bright colors to xterm256 color tags
         string = self.brightbg_sub.sub(self.sub_brightbg, string)
@@ -279,13 +279,9 @@ class ANSIParser(object):
         if strip_ansi:
             # remove all ansi codes (including those manually
             # inserted in string)
-            return self.strip_raw_codes(parsed_string)
-
-        # cache and crop old cache
-        _PARSE_CACHE[cachekey] = parsed_string
-        if len(_PARSE_CACHE) > _PARSE_CACHE_SIZE:
-           _PARSE_CACHE.popitem(last=False)
+            parsed_string = self.strip_raw_codes(parsed_string)
 
+        _PARSE_CACHE.set(cachekey, parsed_string)
         return parsed_string
 
     # Mapping using {r {n etc
@@ -464,6 +460,21 @@ ANSI_PARSER = ANSIParser()
 # Access function
 #
 
+def get_parse_cache_stats():
+    """
+    Get statistics for the cache of parsed strings in this process,
+    used by `parse_ansi` and `text2html.parse_html`.
+
+    Returns:
+        stats (dict): A dict with keys `size` (bytes), `maxsize`
+            (bytes), `items`, `hits`, `misses` and `evictions`.
+
+    """
+    return {"size": _PARSE_CACHE.size, "maxsize": _PARSE_CACHE.max_bytes,
+            "items": len(_PARSE_CACHE), "hits": _PARSE_CACHE.hits,
+            "misses": _PARSE_CACHE.misses, "evictions": _PARSE_CACHE.evictions}
+
+
 def parse_ansi(string, strip_ansi=False, parser=ANSI_PARSER, xterm256=False, mxp=False):
     """
     Parses a string, subbing color codes as needed.
@@ -17,8 +17,16 @@ used by Attributes - without it, one would not be able to update mutables
 in-situ, e.g `obj.db.mynestedlist[3][5] = 3` would never be saved and
 be out of sync with the database.
 
+By default every such in-situ update re-serializes and saves the full
+Attribute value. If `settings.ATTRIBUTE_SAVE_COALESCE` is set, an update
+instead marks the root as dirty and all dirty roots are saved in one go
+at the end of the current reactor tick (or command, whichever comes
+first). Reading the Attribute back before then returns the pending
+mutable itself. Use `flush_pending_saves` to force this save manually.
+
 """
 from builtins import object, int
+from future.utils import listvalues
 
 from functools import update_wrapper
 from collections import defaultdict, MutableSequence, MutableSet, MutableMapping
@@ -27,13 +35,17 @@ try:
     from cPickle import dumps, loads
 except ImportError:
     from pickle import dumps, loads
+from twisted.internet import reactor
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.contenttypes.models import ContentType
 from evennia.utils.utils import to_str, uses_database
 from evennia.utils import logger
 
 __all__ = ("to_pickle", "from_pickle", "do_pickle", "do_unpickle",
-            "dbserialize", "dbunserialize")
+            "dbserialize", "dbunserialize", "flush_pending_saves",
+            "get_pending_save", "discard_pending_save",
+            "register_pickle_type")
 
 PICKLE_PROTOCOL = 2
 
@@ -60,6 +72,10 @@ _SA = object.__setattr__
 _FROM_MODEL_MAP = None
 _TO_MODEL_MAP = None
 _SESSION_HANDLER = None
+_SAVE_COALESCE = settings.ATTRIBUTE_SAVE_COALESCE
+# {id(db_obj): (db_obj, root)} for roots waiting to be saved
+_PENDING_SAVES = {}
+_PENDING_FLUSH = None
 _IS_PACKED_DBOBJ = lambda o: type(o) == tuple and len(o) == 4 and o[0] == '__packed_dbobj__'
 _IS_PACKED_SESSION = lambda o: type(o) == tuple and len(o) == 3 and o[0] == '__packed_session__'
 if uses_database("mysql") and _get_mysql_db_version() < '5.6.4':
@@ -109,6 +125,86 @@ def _init_globals():
 #
 
 
+def _queue_save(db_obj, root):
+    """
+    Mark a root mutable as dirty, to be saved to `db_obj` at the end
+    of this reactor tick.
+
+    Args:
+        db_obj (Attribute): The object to save to.
+        root (_SaverMutable): The root of the mutable tree.
+
+    """
+    global _PENDING_FLUSH
+    # a later root for the same db_obj replaces an earlier one, like
+    # it would if it was saved directly
+    _PENDING_SAVES[id(db_obj)] = (db_obj, root)
+    if not _PENDING_FLUSH:
+        _PENDING_FLUSH = reactor.callLater(0, flush_pending_saves)
+
+
+def get_pending_save(db_obj):
+    """
+    Get the mutable waiting to be saved to an Attribute, if any. This
+    is returned when reading the Attribute, so repeated in-situ
+    updates don't each force a save.
+
+    Args:
+        db_obj (Attribute): The Attribute to check.
+
+    Returns:
+        root (_SaverMutable or None): The pending root mutable, or
+            `None` if no save is pending for `db_obj`.
+
+    """
+    pending = _PENDING_SAVES.get(id(db_obj))
+    return pending[1] if pending else None
+
+
+def discard_pending_save(db_obj):
+    """
+    Forget the save pending for an Attribute. This is used when the
+    Attribute is given a new value, which replaces the pending one.
+
+    Args:
+        db_obj (Attribute): The Attribute.
+
+    """
+    _PENDING_SAVES.pop(id(db_obj), None)
+
+
+def flush_pending_saves(db_obj=None):
+    """
+    Save mutables that were updated in-situ but not yet written to
+    the database. This is only relevant when
+    `settings.ATTRIBUTE_SAVE_COALESCE` is active. It is called
+    automatically at the end of every reactor tick and command.
+
+    Args:
+        db_obj (Attribute, optional): Only flush the save pending for
+            this object. If not given, flush all pending saves.
+
+    """
+    global _PENDING_FLUSH
+    if db_obj is not None:
+        pending = _PENDING_SAVES.pop(id(db_obj), None)
+        pending = [pending] if pending else []
+    else:
+        pending = listvalues(_PENDING_SAVES)
+        _PENDING_SAVES.clear()
+        if _PENDING_FLUSH and _PENDING_FLUSH.active():
+            _PENDING_FLUSH.cancel()
+        _PENDING_FLUSH = None
+    for db_obj, root in pending:
+        if getattr(db_obj, "pk", True) is None:
+            # the Attribute was deleted before we got to save it
+            continue
+        try:
+            db_obj.value = root
+        except Exception:
+            logger.log_trace("Could not save %s to %s." % (root, db_obj))
+
+
 def _save(method):
     "method decorator that saves data to Attribute"
     def save_wrapper(self, *args, **kwargs):
@@ -141,7 +237,10 @@ class _SaverMutable(object):
         if self._parent:
             self._parent._save_tree()
         elif self._db_obj:
-            self._db_obj.value = self
+            if _SAVE_COALESCE:
+                _queue_save(self._db_obj, self)
+            else:
+                self._db_obj.value = self
         else:
             logger.log_err("_SaverMutable %s has no root Attribute to save to." % self)
 
@@ -411,6 +510,269 @@ def unpack_session(item):
         return session
     return None
 
+#
+# Type dispatch
+#
+# to_pickle/from_pickle look up the handler for each item in these
+# tables, keyed by type. A type not found directly is resolved via its
+# mro (so subclasses of str, int etc are handled like their parents)
+# and the result is cached. Subclasses of the container types are not
+# resolved to their parent, since its handler would build the parent
+# type; they use the generic fallback like all types without a handler
+# (iterables are rebuilt with their own class, database objects are
+# packed).
+#
+
+_ATOMIC_TYPES = (type(""), type(u""), type(0), type(2 ** 64), float, complex,
+                 bool, type(None))
+# only used by their exact type, see _resolve_handler
+_CONTAINER_TYPES = (tuple, list, dict, set, OrderedDict, deque)
+_IS_PACKED_CUSTOM = lambda o: type(o) == tuple and len(o) == 3 and o[0] == '__packed_custom__'
+
+# {type: handler(item)}, converting to the pickle-safe form
+_TO_PICKLE = {}
+# {type: handler(item)}, converting back from the pickle-safe form
+_FROM_PICKLE = {}
+# {type: handler(item, parent, db_obj=None)}, converting back while
+# creating _Saver* mutables tracking their parent
+_FROM_PICKLE_TREE = {}
+# {name: unpack} for custom types
+_CUSTOM_UNPACKERS = {}
+# caches of mro-resolved handlers, reset when a new type is registered
+_TO_PICKLE_RESOLVED = {}
+_FROM_PICKLE_RESOLVED = {}
+_FROM_PICKLE_TREE_RESOLVED = {}
+
+
+def _resolve_handler(table, resolved, dtype):
+    """
+    Find the handler for a type not yet resolved, via the type's mro.
+
+    Args:
+        table (dict): One of the dispatch tables.
+        resolved (dict): The resolve-cache for this table.
+        dtype (type): The type to look up.
+
+    Returns:
+        handler (callable or None): The handler, or None if the type
+            should be processed by the fallback.
+
+    """
+    handler = None
+    for cls in getattr(dtype, "__mro__", (dtype, )):
+        if cls in table and (cls is dtype or cls not in _CONTAINER_TYPES):
+            handler = table[cls]
+            break
+    resolved[dtype] = handler
+    return handler
+
+
+def register_pickle_type(cls, pack, unpack, name=None):
+    """
+    Register a custom type to be stored by to_pickle/from_pickle (and
+    thus in Attributes). This must be called before any data of this
+    type is loaded, so do it in a module imported at server startup
+    (like the one defining the type).
+
+    Args:
+        cls (type): The type to register. Subclasses are also handled,
+            unless registered separately.
+        pack (callable): Called as `pack(item)`, should return data
+            representing `item`. This is then itself passed through
+            to_pickle, so it may contain database objects.
+        unpack (callable): Called as `unpack(data)` with the data
+            returned by `pack`. Should return the restored item.
+        name (str, optional): Unique name to store with the data, used to
+            find `unpack` again. Defaults to the python path of `cls`.
+            Changing it will make stored data unreadable.
+
+    """
+    name = name or "%s.%s" % (cls.__module__, cls.__name__)
+
+    def to_handler(item):
+        return ('__packed_custom__', name, _to_pickle_item(pack(item)))
+
+    _TO_PICKLE[cls] = to_handler
+    _CUSTOM_UNPACKERS[name] = unpack
+    _TO_PICKLE_RESOLVED.clear()
+
+
+def _unpack_custom(item):
+    """
+    Unpack a type registered with `register_pickle_type`.
+
+    """
+    try:
+        unpack = _CUSTOM_UNPACKERS[item[1]]
+    except KeyError:
+        # return as-is so the data is not lost if re-saved
+        logger.log_err("dbserialize: No type registered with name '%s'." % item[1])
+        return item
+    return unpack(_from_pickle_item(item[2]))
+
+
+def _to_pickle_item(item):
+    "Recursive processor and identification of data"
+    dtype = type(item)
+    try:
+        handler = _TO_PICKLE_RESOLVED[dtype]
+    except KeyError:
+        handler = _resolve_handler(_TO_PICKLE, _TO_PICKLE_RESOLVED, dtype)
+    if handler:
+        return handler(item)
+    # fallback
+    if hasattr(item, '__iter__'):
+        # we try to conserve the iterable class, if not convert to list
+        try:
+            return item.__class__([_to_pickle_item(val) for val in item])
+        except (AttributeError, TypeError):
+            return [_to_pickle_item(val) for val in item]
+    elif hasattr(item, "sessid") and hasattr(item, "conn_time") and item.sessid in _SESSION_HANDLER:
+        return pack_session(item)
+    return pack_dbobj(item)
+
+
+def _from_pickle_item(item):
+    "Recursive processor and identification of data"
+    dtype = type(item)
+    try:
+        handler = _FROM_PICKLE_RESOLVED[dtype]
+    except KeyError:
+        handler = _resolve_handler(_FROM_PICKLE, _FROM_PICKLE_RESOLVED, dtype)
+    if handler:
+        return handler(item)
+    # fallback
+    if hasattr(item, '__iter__'):
+        try:
+            # we try to conserve the iterable class if
+            # it accepts an iterator
+            return item.__class__([_from_pickle_item(val) for val in item])
+        except (AttributeError, TypeError):
+            return [_from_pickle_item(val) for val in item]
+    return item
+
+
+def _from_pickle_tree(item, parent):
+    "Recursive processor, building a parent-tree from iterable data"
+    dtype = type(item)
+    try:
+        handler = _FROM_PICKLE_TREE_RESOLVED[dtype]
+    except KeyError:
+        handler = _resolve_handler(_FROM_PICKLE_TREE, _FROM_PICKLE_TREE_RESOLVED, dtype)
+    if handler:
+        return handler(item, parent)
+    # fallback
+    if hasattr(item, '__iter__'):
+        try:
+            # we try to conserve the iterable class if it
+            # accepts an iterator
+            return item.__class__([_from_pickle_tree(val, parent) for val in item])
+        except (AttributeError, TypeError):
+            dat = _SaverList(_parent=parent)
+            dat._data.extend([_from_pickle_tree(val, dat) for val in item])
+            return dat
+    return item
+
+
+def _atomic(item, *args):
+    return item
+
+
+def _from_tuple(item):
+    # packed entities must be checked before normal tuples
+    if _IS_PACKED_DBOBJ(item):
+        return unpack_dbobj(item)
+    elif _IS_PACKED_SESSION(item):
+        return unpack_session(item)
+    elif _IS_PACKED_CUSTOM(item):
+        return _unpack_custom(item)
+    return tuple([_from_pickle_item(val) for val in item])
+
+
+def _from_tuple_tree(item, parent, db_obj=None):
+    if _IS_PACKED_DBOBJ(item) or _IS_PACKED_SESSION(item) or _IS_PACKED_CUSTOM(item):
+        return _from_tuple(item)
+    return tuple([_from_pickle_tree(val, parent) for val in item])
+
+
+def _from_list_tree(item, parent, db_obj=None):
+    dat = _SaverList(_parent=parent, _db_obj=db_obj)
+    dat._data.extend([_from_pickle_tree(val, dat) for val in item])
+    return dat
+
+
+def _from_dict_tree(item, parent, db_obj=None):
+    dat = _SaverDict(_parent=parent, _db_obj=db_obj)
+    dat._data.update([(_from_pickle_item(key), _from_pickle_tree(val, dat))
+                      for key, val in item.items()])
+    return dat
+
+
+def _from_set_tree(item, parent, db_obj=None):
+    dat = _SaverSet(_parent=parent, _db_obj=db_obj)
+    dat._data.update([_from_pickle_tree(val, dat) for val in item])
+    return dat
+
+
+def _from_ordereddict_tree(item, parent, db_obj=None):
+    dat = _SaverOrderedDict(_parent=parent, _db_obj=db_obj)
+    dat._data.update([(_from_pickle_item(key), _from_pickle_tree(val, dat))
+                      for key, val in item.items()])
+    return dat
+
+
+def _from_deque_tree(item, parent, db_obj=None):
+    dat = _SaverDeque(_parent=parent, _db_obj=db_obj)
+    dat._data.extend([_from_pickle_item(val) for val in item])
+    return dat
+
+
+_TO_PICKLE.update(dict((dtype, _atomic) for dtype in _ATOMIC_TYPES))
+_TO_PICKLE.update({
+    tuple: lambda item: tuple([_to_pickle_item(val) for val in item]),
+    list: lambda item: [_to_pickle_item(val) for val in item],
+    dict: lambda item: dict([(_to_pickle_item(key), _to_pickle_item(val))
+                             for key, val in item.items()]),
+    set: lambda item: set([_to_pickle_item(val) for val in item]),
+    OrderedDict: lambda item: OrderedDict([(_to_pickle_item(key), _to_pickle_item(val))
+                                           for key, val in item.items()]),
+    deque: lambda item: deque([_to_pickle_item(val) for val in item])})
+_TO_PICKLE.update({
+    _SaverList: _TO_PICKLE[list],
+    _SaverDict: _TO_PICKLE[dict],
+    _SaverSet: _TO_PICKLE[set],
+    _SaverOrderedDict: _TO_PICKLE[OrderedDict],
+    _SaverDeque: _TO_PICKLE[deque]})
+
+_FROM_PICKLE.update(dict((dtype, _atomic) for dtype in _ATOMIC_TYPES))
+_FROM_PICKLE.update({
+    tuple: _from_tuple,
+    list: lambda item: [_from_pickle_item(val) for val in item],
+    dict: lambda item: dict([(_from_pickle_item(key), _from_pickle_item(val))
+                             for key, val in item.items()]),
+    set: lambda item: set([_from_pickle_item(val) for val in item]),
+    OrderedDict: lambda item: OrderedDict([(_from_pickle_item(key), _from_pickle_item(val))
+                                           for key, val in item.items()]),
+    deque: lambda item: deque([_from_pickle_item(val) for val in item])})
+
+_FROM_PICKLE_TREE.update(dict((dtype, _atomic) for dtype in _ATOMIC_TYPES))
+_FROM_PICKLE_TREE.update({
+    tuple: _from_tuple_tree,
+    list: _from_list_tree,
+    dict: _from_dict_tree,
+    set: _from_set_tree,
+    OrderedDict: _from_ordereddict_tree,
+    deque: _from_deque_tree})
+
+# the root types that are converted to _Saver* mutables
+_SAVER_ROOTS = {
+    list: _from_list_tree,
+    dict: _from_dict_tree,
+    set: _from_set_tree,
+    OrderedDict: _from_ordereddict_tree,
+    deque: _from_deque_tree}
+
+
 #
 # Access methods
 #
@@ -430,34 +792,7 @@ def to_pickle(data):
         data (any): Pickled data.
 
     """
-    def process_item(item):
-        "Recursive processor and identification of data"
-        dtype = type(item)
-        if dtype in (basestring, int, float, bool):
-            return item
-        elif dtype == tuple:
-            return tuple(process_item(val) for val in item)
-        elif dtype in (list, _SaverList):
-            return [process_item(val) for val in item]
-        elif dtype in (dict, _SaverDict):
-            return dict((process_item(key), process_item(val)) for key, val in item.items())
-        elif dtype in (set, _SaverSet):
-            return set(process_item(val) for val in item)
-        elif dtype in (OrderedDict, _SaverOrderedDict):
-            return OrderedDict((process_item(key), process_item(val)) for key, val in item.items())
-        elif dtype in (deque, _SaverDeque):
-            return deque(process_item(val) for val in item)
-
-        elif hasattr(item, '__iter__'):
-            # we try to conserve the iterable class, if not convert to list
-            try:
-                return item.__class__([process_item(val) for val in item])
-            except (AttributeError, TypeError):
-                return [process_item(val) for val in item]
-        elif hasattr(item, "sessid") and hasattr(item, "conn_time") and item.sessid in _SESSION_HANDLER:
-            return pack_session(item)
-        return pack_dbobj(item)
-    return process_item(data)
+    return _to_pickle_item(data)
 
 
 #@transaction.autocommit
@@ -482,105 +817,13 @@ def from_pickle(data, db_obj=None):
         data (any): Unpickled data.
 
     """
-    def process_item(item):
-        "Recursive processor and identification of data"
-        dtype = type(item)
-        if dtype in (basestring, int, float, bool):
-            return item
-        elif _IS_PACKED_DBOBJ(item):
-            # this must be checked before tuple
-            return unpack_dbobj(item)
-        elif _IS_PACKED_SESSION(item):
-            return unpack_session(item)
-        elif dtype == tuple:
-            return tuple(process_item(val) for val in item)
-        elif dtype == dict:
-            return dict((process_item(key), process_item(val)) for key, val in item.items())
-        elif dtype == set:
-            return set(process_item(val) for val in item)
-        elif dtype == OrderedDict:
-            return OrderedDict((process_item(key), process_item(val)) for key, val in item.items())
-        elif dtype == deque:
-            return deque(process_item(val) for val in item)
-        elif hasattr(item, '__iter__'):
-            try:
-                # we try to conserve the iterable class if
-                # it accepts an iterator
-                return item.__class__(process_item(val) for val in item)
-            except (AttributeError, TypeError):
-                return [process_item(val) for val in item]
-        return item
-
-    def process_tree(item, parent):
-        "Recursive processor, building a parent-tree from iterable data"
-        dtype = type(item)
-        if dtype in (basestring, int, float, bool):
-            return item
-        elif _IS_PACKED_DBOBJ(item):
-            # this must be checked before tuple
-            return unpack_dbobj(item)
-        elif dtype == tuple:
-            return tuple(process_tree(val, item) for val in item)
-        elif dtype == list:
-            dat = _SaverList(_parent=parent)
-            dat._data.extend(process_tree(val, dat) for val in item)
-            return dat
-        elif dtype == dict:
-            dat = _SaverDict(_parent=parent)
-            dat._data.update((process_item(key), process_tree(val, dat))
-                                   for key, val in item.items())
-            return dat
-        elif dtype == set:
-            dat = _SaverSet(_parent=parent)
-            dat._data.update(set(process_tree(val, dat) for val in item))
-            return dat
-        elif dtype == OrderedDict:
-            dat = _SaverOrderedDict(_parent=parent)
-            dat._data.update((process_item(key), process_tree(val, dat))
-                                for key, val in item.items())
-            return dat
-        elif dtype == deque:
-            dat = _SaverDeque(_parent=parent)
-            dat._data.extend(process_item(val) for val in item)
-            return dat
-        elif hasattr(item, '__iter__'):
-            try:
-                # we try to conserve the iterable class if it
-                # accepts an iterator
-                return item.__class__(process_tree(val, parent) for val in item)
-            except (AttributeError, TypeError):
-                dat = _SaverList(_parent=parent)
-                dat._data.extend(process_tree(val, dat) for val in item)
-                return dat
-        return item
-
     if db_obj:
         # convert lists, dicts and sets to their Saved* counterparts. It
         # is only relevant if the "root" is an iterable of the right type.
-        dtype = type(data)
-        if dtype == list:
-            dat = _SaverList(_db_obj=db_obj)
-            dat._data.extend(process_tree(val, dat) for val in data)
-            return dat
-        elif dtype == dict:
-            dat = _SaverDict(_db_obj=db_obj)
-            dat._data.update((process_item(key), process_tree(val, dat))
-                              for key, val in data.items())
-            return dat
-        elif dtype == set:
-            dat = _SaverSet(_db_obj=db_obj)
-            dat._data.update(process_tree(val, dat) for val in data)
-            return dat
-        elif dtype == OrderedDict:
-            dat = _SaverOrderedDict(_db_obj=db_obj)
-            dat._data.update((process_item(key), process_tree(val, dat))
-                              for key, val in data.items())
-            return dat
-        elif dtype == deque:
-            dat = _SaverDeque(_db_obj=db_obj)
-            dat._data.extend(process_item(val) for val in data)
-            return dat
-    return process_item(data)
+        handler = _SAVER_ROOTS.get(type(data))
+        if handler:
+            return handler(data, None, db_obj=db_obj)
+    return _from_pickle_item(data)
 
 
 def do_pickle(data):
@@ -4,31 +4,63 @@ Django ID mapper
 Modified for Evennia by making sure that no model references
 leave caching unexpectedly (no use of WeakRefs).
 
-Also adds `cache_size()` for monitoring the size of the cache.
+Also adds `cache_size()` for monitoring the size of the cache and
+an `InstanceCache` which can cap the number of instances cached per
+database model (see `settings.IDMAPPER_CACHE_MAXENTRIES`).
 """
 from __future__ import absolute_import, division
 from builtins import object
 from future.utils import listitems, listvalues, with_metaclass
 
-import os, threading, gc, time
+import os, sys, threading, gc, time, random, datetime
+from decimal import Decimal
+from collections import deque
 from weakref import WeakValueDictionary
-from twisted.internet.reactor import callFromThread
+from twisted.internet.reactor import callFromThread, callLater
+from django.conf import settings
+from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist, FieldError
 from django.db.models.signals import post_save
 from django.db.models.base import Model, ModelBase
 from django.db.models.signals import pre_delete, post_migrate
 from evennia.utils import logger
-from evennia.utils.utils import dbref, get_evennia_pids, to_str
+from evennia.utils.utils import dbref, get_evennia_pids, to_str, deepsize
+
+try:
+    import resource as _RESOURCE
+    _PAGESIZE = _RESOURCE.getpagesize()
+except ImportError:
+    # Windows
+    _RESOURCE = None
+    _PAGESIZE = 4096
+try:
+    # optional; only used where /proc is not available
+    import psutil as _PSUTIL
+except ImportError:
+    _PSUTIL = None
 
 from .manager import SharedMemoryManager
 
 AUTO_FLUSH_MIN_INTERVAL = 60.0 * 5 # at least 5 mins between cache flushes
+MEMORY_SAMPLE_SIZE = 5 # instances per model measured to estimate cache memory
 
 _GA = object.__getattribute__
 _SA = object.__setattr__
 _DA = object.__delattr__
 _MONITOR_HANDLER = None
 
+# Instances with field changes not yet saved (see FIELD_SAVE_COALESCE)
+_FIELD_SAVE_COALESCE = settings.FIELD_SAVE_COALESCE
+_PENDING_FIELD_SAVES = {}
+_PENDING_FIELD_FLUSH = None
+
+# field values of these types can't change in-place, so comparing them
+# to the last saved value shows if they need saving. Fields with other
+# values (like a pickled list) are always saved.
+_IMMUTABLE_TYPES = (type(None), bool, int, long, float, Decimal, str, unicode,
+                    datetime.datetime, datetime.date, datetime.time, datetime.timedelta)
+_NOVALUE = object()
+
 # References to db-updated objects are stored here so the
 # main process can be informed to re-cache itself.
 PROC_MODIFIED_COUNT = 0
@@ -42,6 +74,208 @@ _SERVER_PID, _PORTAL_PID = get_evennia_pids()
 _IS_SUBPROCESS = (_SERVER_PID and _PORTAL_PID) and not _SELF_PID in (_SERVER_PID, _PORTAL_PID)
 _IS_MAIN_THREAD = threading.currentThread().getName() == "MainThread"
 
+
+def get_postsave_hooks(model):
+    """
+    Map the fields of a model to their `at_<fieldname>_postsave`
+    hooks, so `save()` doesn't have to look for the hooks of every
+    field it saves. Only hooks named after actual fields are used.
+
+    Args:
+        model (Model): The model class.
+
+    Returns:
+        hooks (dict): Maps fieldname to hook name, for the fields
+            having a hook.
+
+    """
+    hooks = {}
+    for field in model._meta.fields:
+        hookname = "at_%s_postsave" % field.name
+        if callable(getattr(model, hookname, None)):
+            hooks[field.name] = hookname
+    return hooks
+
+
+class InstanceCache(dict):
+    """
+    The per-model instance cache. This is a dict mapping pk to
+    instance which also keeps track of the order in which its
+    entries were used, so the least recently used instances can be
+    evicted a few at a time instead of flushing the whole cache at
+    once.
+
+    The usage order is kept with the CLOCK algorithm: new keys are
+    queued at the end of a ring and a lookup only marks its key as
+    referenced, which keeps lookups cheap. When evicting, referenced
+    keys get a second chance and are moved to the back of the ring.
+    Instances whose `at_idmapper_flush` returns `False` are pinned
+    and never evicted. Pinned keys are taken out of the ring, so
+    evicting doesn't call their hook over and over; they are put
+    back in when they are next used or re-cached.
+
+    """
+    def __init__(self, maxsize=0):
+        """
+        Args:
+            maxsize (int, optional): The max number of instances to
+                cache. If 0, there is no limit and instances are only
+                evicted by `evict` (such as by `conditional_flush`).
+
+        """
+        dict.__init__(self)
+        self.maxsize = maxsize or 0
+        self.hits = self.misses = self.evictions = 0
+        self._clock = deque()
+        self._referenced = set()
+        self._pinned = set()
+
+    def get(self, key, default=None):
+        """
+        Get an instance from the cache, marking it as used.
+
+        Args:
+            key (any): The pk of the instance.
+            default (any, optional): Returned if the key is not cached.
+
+        Returns:
+            instance (SharedMemoryModel or any): The cached instance
+                or `default`.
+
+        """
+        try:
+            instance = dict.__getitem__(self, key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._referenced.add(key)
+        if key in self._pinned:
+            self._unpin(key)
+        return instance
+
+    def __getitem__(self, key):
+        try:
+            instance = dict.__getitem__(self, key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._referenced.add(key)
+        if key in self._pinned:
+            self._unpin(key)
+        return instance
+
+    def __setitem__(self, key, instance):
+        if key in self._pinned:
+            self._unpin(key)
+        elif key not in self:
+            self._clock.append(key)
+            if len(self._clock) > 2 * len(self) + 100:
+                # keys popped from the cache are left in the
+                # ring; weed them out now and then.
+                self._compact()
+        dict.__setitem__(self, key, instance)
+        if self.maxsize and len(self) > self.maxsize:
+            self.evict(len(self) - self.maxsize)
+
+    def _unpin(self, key):
+        """
+        Put a pinned key back in the ring, so it is checked by the
+        next eviction.
+
+        """
+        self._pinned.discard(key)
+        self._clock.append(key)
+
+    def _compact(self):
+        """
+        Remove keys no longer in the cache from the ring.
+
+        """
+        seen = set()
+        self._clock = deque(key for key in self._clock
+                            if key in self and not (key in seen or seen.add(key)))
+        self._referenced.intersection_update(seen)
+        self._pinned.intersection_update(self)
+
+    def evict(self, num):
+        """
+        Evict the least recently used instances from the cache.
+
+        Args:
+            num (int): The max number of instances to evict.
+
+        Returns:
+            nevicted (int): The number of instances actually evicted.
+                This may be lower than `num` if too many instances
+                are pinned by their `at_idmapper_flush` hook.
+
+        """
+        clock, referenced = self._clock, self._referenced
+        nevicted = 0
+        # every key gets at most one second chance per sweep
+        nsteps = 2 * len(clock)
+        while nevicted < num and nsteps > 0 and clock:
+            nsteps -= 1
+            key = clock.popleft()
+            instance = dict.get(self, key)
+            if instance is None:
+                # already removed from the cache
+                continue
+            if key in referenced:
+                referenced.discard(key)
+                clock.append(key)
+            elif instance.at_idmapper_flush():
+                dict.__delitem__(self, key)
+                nevicted += 1
+            else:
+                # pinned; left out of the ring until used again
+                self._pinned.add(key)
+        self.evictions += nevicted
+        return nevicted
+
+    def clear(self):
+        """
+        Empty the cache (the statistics are kept).
+
+        """
+        dict.clear(self)
+        self._clock.clear()
+        self._referenced.clear()
+        self._pinned.clear()
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            stats (dict): Contains `size`, `maxsize`, `hits`, `misses`
+                and `evictions`.
+
+        """
+        return {"size": len(self), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+
+def _get_cache_maxentries(modelname):
+    """
+    Get the max number of instances to cache for a database model.
+
+    Args:
+        modelname (str): Name of the database model, like `ObjectDB`.
+
+    Returns:
+        maxentries (int): The max size of the cache, 0 if unlimited.
+
+    """
+    maxentries = settings.IDMAPPER_CACHE_MAXENTRIES
+    if isinstance(maxentries, dict):
+        maxentries = maxentries.get(modelname)
+    return maxentries or 0
+
+
 class SharedMemoryModelBase(ModelBase):
     # CL: upstream had a __new__ method that skipped ModelBase's __new__ if
     # SharedMemoryModelBase was not in the model class's ancestors. It's not
@@ -81,7 +315,7 @@ class SharedMemoryModelBase(ModelBase):
         cls.__dbclass__ = dbmodel
         if not hasattr(dbmodel, "__instance_cache__"):
             # we store __instance_cache__ only on the dbmodel base
-            dbmodel.__instance_cache__ = {}
+            dbmodel.__instance_cache__ = InstanceCache(_get_cache_maxentries(dbmodel.__name__))
         super(SharedMemoryModelBase, cls)._prepare()
 
     def __new__(cls, name, bases, attrs):
@@ -126,10 +360,7 @@ class SharedMemoryModelBase(ModelBase):
                 if _GA(cls, "_is_deleted"):
                     raise ObjectDoesNotExist("Cannot set %s to %s: Hosting object was already deleted!" % (fname, value))
                 _SA(cls, fname, value)
-                # only use explicit update_fields in save if we actually have a
-                # primary key assigned already (won't be set when first creating object)
-                update_fields = [fname] if _GA(cls, "_get_pk_val")(_GA(cls, "_meta")) is not None else None
-                _GA(cls, "save")(update_fields=update_fields)
+                _GA(cls, "_save_field")(fname)
             def _set_foreign(cls, fname, value):
                 "Setter only used on foreign key relations, allows setting with #dbref"
                 if _GA(cls, "_is_deleted"):
@@ -153,18 +384,14 @@ class SharedMemoryModelBase(ModelBase):
                                 # maybe it is just a name that happens to look like a dbid
                                 pass
                 _SA(cls, fname, value)
-                # only use explicit update_fields in save if we actually have a
-                # primary key assigned already (won't be set when first creating object)
-                update_fields = [fname] if _GA(cls, "_get_pk_val")(_GA(cls, "_meta")) is not None else None
-                _GA(cls, "save")(update_fields=update_fields)
+                _GA(cls, "_save_field")(fname)
             def _del_nonedit(cls, fname):
                 "wrapper for not allowing deletion"
                 raise FieldError("Field %s cannot be edited." % fname)
             def _del(cls, fname):
                 "Wrapper for clearing database field - sets it to None"
                 _SA(cls, fname, None)
-                update_fields = [fname] if _GA(cls, "_get_pk_val")(_GA(cls, "_meta")) is not None else None
-                _GA(cls, "save")(update_fields=update_fields)
+                _GA(cls, "_save_field")(fname)
 
             # wrapper factories
             fget = lambda cls: _get(cls, fieldname)
@@ -196,7 +423,9 @@ class SharedMemoryModelBase(ModelBase):
                 # makes sure not to overload manually created wrappers on the model
                 create_wrapper(cls, fieldname, wrappername, editable=field.editable, foreignkey=foreignkey)
 
-        return super(SharedMemoryModelBase, cls).__new__(cls, name, bases, attrs)
+        new_class = super(SharedMemoryModelBase, cls).__new__(cls, name, bases, attrs)
+        new_class._postsave_hooks = get_postsave_hooks(new_class)
+        return new_class
 
 
 class SharedMemoryModel(with_metaclass(SharedMemoryModelBase, Model)):
@@ -315,12 +544,17 @@ class SharedMemoryModel(with_metaclass(SharedMemoryModelBase, Model)):
         This will clean safe objects from the cache. Use `force`
         keyword to remove all objects, safe or not.
 
+        Notes:
+            The cache is emptied in-place since handlers (like the
+            contents cache) keep references to it.
+
         """
+        cache = cls.__dbclass__.__instance_cache__
         if force:
-            cls.__dbclass__.__instance_cache__ = {}
+            cache.clear()
         else:
-            cls.__dbclass__.__instance_cache__ = dict((key, obj) for key, obj in cls.__dbclass__.__instance_cache__.items()
-                                                      if not obj.at_idmapper_flush())
+            for key in [key for key, obj in cache.items() if obj.at_idmapper_flush()]:
+                del cache[key]
     #flush_instance_cache = classmethod(flush_instance_cache)
 
     # per-instance methods
@@ -348,11 +582,93 @@ class SharedMemoryModel(with_metaclass(SharedMemoryModelBase, Model)):
             if force or self.at_idmapper_flush():
                 self.__class__.__dbclass__.__instance_cache__.pop(pk, None)
 
+    def _save_field(self, fieldname):
+        """
+        Save a field changed through its property wrapper. The field
+        is marked as dirty and saved with all other dirty fields of
+        this instance in one UPDATE. With `settings.FIELD_SAVE_COALESCE`
+        this save is delayed to the end of the current command or
+        reactor tick, so that many changes become one UPDATE.
+
+        Args:
+            fieldname (str): The name of the changed field.
+
+        """
+        if self._get_pk_val() is None:
+            # not yet in the database; this creates it with all fields
+            self.save()
+            return
+        dirty = self.__dict__.get("_dirty_fields")
+        if dirty is None:
+            dirty = self.__dict__["_dirty_fields"] = set()
+        dirty.add(fieldname)
+        if _FIELD_SAVE_COALESCE and _IS_MAIN_THREAD and not _IS_SUBPROCESS:
+            _queue_field_save(self)
+        else:
+            self.save(update_fields=list(dirty))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Create an instance from database values, recording them so
+        `save()` can tell which fields were changed.
+
+        """
+        instance = super(SharedMemoryModel, cls).from_db(db, field_names, values)
+        if "_saved_values" not in instance.__dict__:
+            # a new instance, not one from the cache (which may have
+            # unsaved changes)
+            instance._record_saved_values()
+        return instance
+
+    def _record_saved_values(self, fieldnames=None):
+        """
+        Remember the current values of fields, as they are in the
+        database.
+
+        Args:
+            fieldnames (list, optional): The names of the fields to
+                record. If not given, record all fields.
+
+        """
+        saved = self.__dict__.get("_saved_values")
+        if saved is None or fieldnames is None:
+            saved = self.__dict__["_saved_values"] = {}
+        else:
+            fieldnames = set(fieldnames)
+        for field in self._meta.concrete_fields:
+            if fieldnames is None or field.name in fieldnames or field.attname in fieldnames:
+                saved[field.name] = self.__dict__.get(field.attname, _NOVALUE)
+
+    def _get_changed_fields(self):
+        """
+        Get the fields changed since they were loaded or last saved.
+
+        Returns:
+            fieldnames (list): The names of the changed fields.
+
+        """
+        saved = self.__dict__["_saved_values"]
+        fieldnames = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            value = self.__dict__.get(field.attname, _NOVALUE)
+            if value is _NOVALUE:
+                # a deferred field that was never loaded
+                continue
+            if type(value) not in _IMMUTABLE_TYPES or saved.get(field.name, _NOVALUE) != value:
+                fieldnames.append(field.name)
+        return fieldnames
+
     def delete(self, *args, **kwargs):
         """
         Delete the object, clearing cache.
 
         """
+        _PENDING_FIELD_SAVES.pop(id(self), None)
+        self.__dict__.pop("_dirty_fields", None)
+        self.__dict__.pop("_saved_values", None)
         self.flush_from_cache()
         self._is_deleted = True
         super(SharedMemoryModel, self).delete(*args, **kwargs)
@@ -362,15 +678,39 @@ class SharedMemoryModel(with_metaclass(SharedMemoryModelBase, Model)):
         Central database save operation.
 
         Notes:
-            Arguments as per Django documentation.
-            Calls `self.at_<fieldname>_postsave(new)`
-            (this is a wrapper set by oobhandler:
-            self._oob_at_<fieldname>_postsave())
+            Arguments as per Django documentation. If `update_fields`
+            is not given for an instance already in the database,
+            only the fields changed since it was loaded or last saved
+            are written.
+            Calls `self.at_<fieldname>_postsave(new)` for the saved
+            fields (this is a wrapper set by oobhandler:
+            self._oob_at_<fieldname>_postsave()). Such hooks
+            must be defined on the class; they are looked up
+            once, when the class is created.
 
         """
         global _MONITOR_HANDLER
         if not _MONITOR_HANDLER:
-            from evennia.scripts.monitorhandler import MONITOR_HANDLER as _MONITORHANDLER
+            from evennia.scripts.monitorhandler import MONITOR_HANDLER as _MONITOR_HANDLER
+
+        dirty = self.__dict__.pop("_dirty_fields", None)
+        if dirty:
+            # this save will also write the fields marked as dirty
+            _PENDING_FIELD_SAVES.pop(id(self), None)
+
+        update_fields = kwargs.get("update_fields")
+        if (update_fields is None and not args and not kwargs.get("force_insert")
+                and "_saved_values" in self.__dict__ and not self._state.adding
+                and self._get_pk_val() is not None):
+            # only write what changed
+            update_fields = self._get_changed_fields()
+        if update_fields is not None:
+            if dirty:
+                update_fields = list(dirty.union(update_fields))
+            if not update_fields:
+                # nothing to save
+                return
+            kwargs["update_fields"] = update_fields
 
         if _IS_SUBPROCESS:
             # we keep a store of objects modified in subprocesses so
@@ -387,24 +727,21 @@ class SharedMemoryModel(with_metaclass(SharedMemoryModelBase, Model)):
             def _save_callback(cls, *args, **kwargs):
                 super(SharedMemoryModel, cls).save(*args, **kwargs)
             callFromThread(_save_callback, self, *args, **kwargs)
+        self._record_saved_values(update_fields)
 
         # update field-update hooks and eventual OOB watchers
-        new = False
-        if "update_fields" in kwargs and kwargs["update_fields"]:
-            # get field objects from their names
-            update_fields = (self._meta.get_field(fieldname)
-                             for fieldname in kwargs.get("update_fields"))
-        else:
-            # meta.fields are already field objects; get them all
-            new =True
-            update_fields = self._meta.fields
-        for field in update_fields:
-            fieldname = field.name
+        new = not update_fields
+        if _MONITOR_HANDLER.has_monitors(self):
             # trigger eventual monitors
-            _MONITORHANDLER.at_update(self, fieldname)
-            # if a hook is defined it must be named exactly on this form
-            hookname = "at_%s_postsave" % fieldname
-            if hasattr(self, hookname) and callable(_GA(self, hookname)):
+            for fieldname in update_fields or (field.name for field in self._meta.fields):
+                _MONITOR_HANDLER.at_update(self, fieldname)
+        hooks = self._postsave_hooks
+        if hooks:
+            if update_fields:
+                hooknames = [hooks[fieldname] for fieldname in update_fields if fieldname in hooks]
+            else:
+                hooknames = listvalues(hooks)
+            for hookname in hooknames:
                 _GA(self, hookname)(new)
 
 #            # if a trackerhandler is set on this object, update it with the
@@ -460,6 +797,97 @@ def flush_cache(**kwargs):
 post_migrate.connect(flush_cache)
 
 
+def _get_instance_caches():
+    """
+    Get the instance caches of all database models.
+
+    Returns:
+        caches (dict): Maps each database model name to its cache.
+
+    """
+    caches = {}
+    def get_recurse(submodels):
+        for submodel in submodels:
+            dbmodel = getattr(submodel, "__dbclass__", None)
+            if dbmodel is not None:
+                caches[dbmodel.__name__] = dbmodel.__instance_cache__
+            get_recurse(submodel.__subclasses__())
+    get_recurse(SharedMemoryModel.__subclasses__())
+    return caches
+
+
+def trim_cache(fraction):
+    """
+    Evict the least recently used instances from the idmapper
+    caches. Unlike `flush_cache` this keeps the instances most
+    likely to be needed again, avoiding a burst of re-loading from
+    the database. Instances pinned by their `at_idmapper_flush` hook
+    are not evicted.
+
+    Args:
+        fraction (float): How much of each cache to evict, between
+            0 and 1.
+
+    Returns:
+        nevicted (int): The total number of instances evicted.
+
+    """
+    nevicted = 0
+    for cache in _get_instance_caches().values():
+        if hasattr(cache, "evict"):
+            nevicted += cache.evict(int(len(cache) * fraction))
+    return nevicted
+
+
+def _queue_field_save(instance):
+    """
+    Queue an instance with dirty fields to be saved at the end of
+    this reactor tick.
+
+    Args:
+        instance (SharedMemoryModel): The instance to save.
+
+    """
+    global _PENDING_FIELD_FLUSH
+    _PENDING_FIELD_SAVES[id(instance)] = instance
+    if not _PENDING_FIELD_FLUSH:
+        _PENDING_FIELD_FLUSH = callLater(0, flush_field_saves)
+
+
+def flush_field_saves():
+    """
+    Save all fields changed through their property wrappers but not
+    yet written to the database, in one transaction. This is only
+    relevant when `settings.FIELD_SAVE_COALESCE` is active. It is
+    called automatically at the end of every reactor tick and
+    command.
+
+    """
+    global _PENDING_FIELD_FLUSH
+    pending = [(instance, list(instance.__dict__.get("_dirty_fields") or ()))
+               for instance in listvalues(_PENDING_FIELD_SAVES)]
+    _PENDING_FIELD_SAVES.clear()
+    if _PENDING_FIELD_FLUSH and _PENDING_FIELD_FLUSH.active():
+        _PENDING_FIELD_FLUSH.cancel()
+    _PENDING_FIELD_FLUSH = None
+    pending = [(instance, fieldnames) for instance, fieldnames in pending
+               if fieldnames and not instance._is_deleted]
+    if not pending:
+        return
+    try:
+        with transaction.atomic():
+            for instance, fieldnames in pending:
+                instance.save(update_fields=fieldnames)
+    except Exception:
+        # retry one by one so one bad save doesn't lose the others
+        logger.log_trace("Could not save changed fields in one transaction.")
+        for instance, fieldnames in pending:
+            try:
+                instance.save(update_fields=fieldnames)
+            except Exception:
+                logger.log_trace("Could not save fields %s of %s." % (fieldnames, instance))
+
+
 def flush_cached_instance(sender, instance, **kwargs):
     """
     Flush the idmapper cache only for a given instance.
@@ -484,9 +912,18 @@ post_save.connect(update_cached_instance)
 
 
 LAST_FLUSH = None
+_LAST_CACHE_MEM = 0.0
 def conditional_flush(max_rmem, force=False):
     """
-    Flush the cache if the estimated memory usage exceeds `max_rmem`.
+    Trim the cache if the memory usage exceeds `max_rmem`.
+
+    When the resident memory of the process is within 10% of
+    `max_rmem`, enough of the least recently used cached instances
+    are evicted to bring it down to 80% of `max_rmem`, going by the
+    estimated memory use of the cache (see `cache_memory`). Since
+    Python does not necessarily return freed memory to the OS, the
+    cache is only trimmed again once it has grown past its size after
+    the last trim.
 
     The flusher has a timeout to avoid flushing over and over
     in particular situations (this means that for some setups
@@ -494,31 +931,14 @@ def conditional_flush(max_rmem, force=False):
     more memory is probably required for the given game).
 
     Args:
-        max_rmem (int): memory-usage estimation-treshold after which
-            cache is flushed.
-        force (bool, optional): forces a flush, regardless of timeout.
+        max_rmem (int): memory-usage treshold (in MB) after which
+            cache is trimmed.
+        force (bool, optional): forces a trim, regardless of timeout
+            and of how much the cache has grown since the last trim.
             Defaults to `False`.
 
     """
-    global LAST_FLUSH
-
-    def mem2cachesize(desired_rmem):
-        """
-        Estimate the size of the idmapper cache based on the memory
-        desired. This is used to optionally cap the cache size.
-
-        desired_rmem - memory in MB (minimum 50MB)
-
-        The formula is empirically estimated from usage tests (Linux)
-        and is
-            Ncache = RMEM - 35.0 / 0.0157
-        where RMEM is given in MB and Ncache is the size of the cache
-        for this memory usage. VMEM tends to be about 100MB higher
-        than RMEM for large memory usage.
-        """
-        vmem = max(desired_rmem, 50.0)
-        Ncache = int(abs(float(vmem) - 35.0) / 0.0157)
-        return Ncache
+    global LAST_FLUSH, _LAST_CACHE_MEM
 
     if not max_rmem:
         # auto-flush is disabled
@@ -536,22 +956,103 @@ def conditional_flush(max_rmem, force=False):
                         "once in %s min interval. Check memory usage." % (AUTO_FLUSH_MIN_INTERVAL/60.0))
         return
 
-    if os.name == "nt":
-        # we can't look for mem info in Windows at the moment
+    # check actual memory usage
+    rmem, _ = process_memory()
+    if rmem is None or rmem < max_rmem * 0.9:
+        # memory use unknown or not within 10% of our set max
+        return
+    cache_mem, _ = cache_memory()
+    if not cache_mem or (cache_mem <= _LAST_CACHE_MEM and not force):
+        # the memory is used by something else than the cache
         return
 
-    # check actual memory usage
-    Ncache_max = mem2cachesize(max_rmem)
-    Ncache, _ = cache_size()
-    actual_rmem = float(os.popen('ps -p %d -o %s | tail -1' % (os.getpid(), "rss")).read()) / 1000.0  # resident memory
-
-    if Ncache >= Ncache_max and actual_rmem > max_rmem * 0.9:
-        # flush cache when number of objects in cache is big enough and our
-        # actual memory use is within 10% of our set max
-        flush_cache()
-        LAST_FLUSH = now
+    # evict enough of the least recently used part of the cache to
+    # get the memory use down to 80% of our set max.
+    fraction = min(1.0, (rmem - max_rmem * 0.8) / cache_mem)
+    trim_cache(fraction)
+    gc.collect()
+    _LAST_CACHE_MEM = cache_mem * (1.0 - fraction)
+    LAST_FLUSH = now
+
+
+def process_memory():
+    """
+    Get the memory currently used by this process. This is read from
+    `/proc/self/statm` where available (Linux), otherwise from the
+    `psutil` package if it is installed.
+
+    Returns:
+        rmem, vmem (tuple): Resident and virtual memory in MB. Both
+            are `None` if they cannot be determined on this system.
 
-def cache_size(mb=True):
+    Notes:
+        The peak memory use (see `peak_memory`) is available on more
+        systems, but is not used here since it never goes down.
+
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            vsize, rss = statm.read().split()[:2]
+        return int(rss) * _PAGESIZE / 1.0e6, int(vsize) * _PAGESIZE / 1.0e6
+    except (IOError, ValueError):
+        pass
+    if _PSUTIL:
+        meminfo = _PSUTIL.Process(os.getpid()).memory_info()
+        return meminfo.rss / 1.0e6, meminfo.vms / 1.0e6
+    return None, None
+
+
+def peak_memory():
+    """
+    Get the peak resident memory used by this process so far, from
+    the `resource` module.
+
+    Returns:
+        peak_rmem (float or None): The peak resident memory in MB, or
+            `None` if it cannot be determined on this system.
+
+    """
+    if _RESOURCE:
+        # ru_maxrss is in bytes on OSX and in kilobytes elsewhere
+        maxrss = _RESOURCE.getrusage(_RESOURCE.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1.0e6 if sys.platform == "darwin" else 1.0e3)
+    return None
+
+
+def cache_memory(nsamples=MEMORY_SAMPLE_SIZE):
+    """
+    Estimate the memory used by the instances in the idmapper cache.
+
+    The size of an instance is estimated with `deepsize` for a random
+    sample of the instances cached for each database model.
+
+    Args:
+        nsamples (int, optional): How many instances of each model to
+            measure.
+
+    Returns:
+        total_mem, {dbmodel: {"size":int, "instance_size":int,
+                              "mem":float}, ...}
+        where `total_mem` and `mem` are in MB, `size` is the number
+        of cached instances and `instance_size` the estimated size
+        of one instance in bytes.
+
+    """
+    total_mem = 0.0
+    modeldict = {}
+    for name, cache in _get_instance_caches().items():
+        num = len(cache)
+        instance_size = 0
+        if num:
+            sample = random.sample(listvalues(cache), min(nsamples, num))
+            instance_size = sum(deepsize(instance) for instance in sample) // len(sample)
+        mem = num * instance_size / 1.0e6
+        total_mem += mem
+        modeldict[name] = {"size": num, "instance_size": instance_size, "mem": mem}
+    return total_mem, modeldict
+
+
+def cache_size(mb=True, stats=False):
     """
     Calculate statistics about the cache.
 
@@ -562,10 +1063,28 @@ def cache_size(mb=True):
     Python is clearly reusing memory behind the scenes that we cannot
     catch in an easy way here.  Ideas are appreciated. /Griatch
 
+    Args:
+        mb (bool, optional): Unused.
+        stats (bool, optional): Return statistics for the cache of
+            each database model instead of the number of cached
+            instances per typeclass.
+
     Returns:
       total_num, {objclass:total_num, ...}
+      or, if `stats` is set,
+      total_num, {dbmodel: {"size":int, "maxsize":int, "hits":int,
+                            "misses":int, "evictions":int}, ...}
 
     """
+    if stats:
+        classdict = {}
+        for name, cache in _get_instance_caches().items():
+            if hasattr(cache, "stats"):
+                classdict[name] = cache.stats()
+            else:
+                classdict[name] = {"size": len(cache), "maxsize": 0,
+                                   "hits": 0, "misses": 0, "evictions": 0}
+        return sum(stat["size"] for stat in classdict.values()), classdict
     numtotal = [0] # use mutable to keep reference through recursion
     classdict = {}
     def get_recurse(submodels):
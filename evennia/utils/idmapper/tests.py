@@ -1,14 +1,24 @@
 from __future__ import absolute_import
 from builtins import range
 
+from mock import patch
 from django.test import TestCase
 
-from .models import SharedMemoryModel
+from . import models as idmapper
+from .models import SharedMemoryModel, InstanceCache
 from django.db import models
 
 class Category(SharedMemoryModel):
     name = models.CharField(max_length=32)
 
+class HookedCategory(Category):
+    class Meta:
+        proxy = True
+    def at_name_postsave(self, new):
+        pass
+    def at_notafield_postsave(self, new):
+        pass
+
 class RegularCategory(models.Model):
     name = models.CharField(max_length=32)
 
@@ -71,4 +81,108 @@ class SharedMemorysTest(TestCase):
         article.delete()
         self.assertEquals(pk not in Article.__instance_cache__, True)
 
-
+    def testFlushInPlace(self):
+        list(Article.objects.all())
+        cache = Article.__instance_cache__
+        self.assertTrue(len(cache) > 0)
+        Article.flush_instance_cache()
+        self.assertTrue(Article.__instance_cache__ is cache)
+        self.assertEqual(len(cache), 0)
+
+    def testPostsaveHooks(self):
+        from evennia.objects.models import ObjectDB
+        self.assertEqual(ObjectDB._postsave_hooks.get("db_location"), "at_db_location_postsave")
+        self.assertEqual(Article._postsave_hooks, {})
+        self.assertEqual(HookedCategory._postsave_hooks, {"name": "at_name_postsave"})
+        from evennia.objects.objects import DefaultObject
+        self.assertEqual(DefaultObject._postsave_hooks.get("db_location"), "at_db_location_postsave")
+
+    def testCacheMemory(self):
+        list(Article.objects.all())
+        total_mem, modeldict = idmapper.cache_memory()
+        self.assertEqual(modeldict["Article"]["size"], 10)
+        self.assertTrue(modeldict["Article"]["instance_size"] > 0)
+        self.assertTrue(total_mem >= modeldict["Article"]["mem"] > 0)
+
+    @patch("evennia.utils.idmapper.models.LAST_FLUSH", 1.0)
+    @patch("evennia.utils.idmapper.models._LAST_CACHE_MEM", 0.0)
+    def testConditionalFlush(self):
+        list(Article.objects.all())
+        cache_mem, _ = idmapper.cache_memory()
+        with patch("evennia.utils.idmapper.models.process_memory") as process_memory:
+            # well below the cap
+            process_memory.return_value = (50.0, 100.0)
+            idmapper.conditional_flush(100)
+            self.assertEqual(len(Article.__instance_cache__), 10)
+            # over the cap by much more than the cache uses
+            process_memory.return_value = (100.0 + 1000 * cache_mem, 200.0)
+            idmapper.conditional_flush(100)
+            self.assertEqual(len(Article.__instance_cache__), 0)
+
+    @patch("evennia.utils.idmapper.models._PSUTIL", None)
+    def testProcessMemoryUnknown(self):
+        # only the peak is known without /proc or psutil; it is not
+        # used as the current memory, since it never goes down
+        with patch("evennia.utils.idmapper.models.open", side_effect=IOError, create=True):
+            self.assertEqual(idmapper.process_memory(), (None, None))
+        if idmapper._RESOURCE:
+            self.assertTrue(idmapper.peak_memory() > 0)
+
+
+
+
+class _CachedInstance(object):
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.nflushes = 0
+    def at_idmapper_flush(self):
+        self.nflushes += 1
+        return not self.pinned
+
+class TestInstanceCache(TestCase):
+
+    def test_lookup(self):
+        cache = InstanceCache()
+        instance = _CachedInstance()
+        cache[1] = instance
+        self.assertEqual(cache.get(1), instance)
+        self.assertEqual(cache[1], instance)
+        self.assertEqual(cache.get(2), None)
+        self.assertRaises(KeyError, cache.__getitem__, 2)
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (1, 2, 2))
+
+    def test_evict_least_recently_used(self):
+        cache = InstanceCache(maxsize=3)
+        for pk in range(1, 4):
+            cache[pk] = _CachedInstance()
+        cache.get(1)
+        cache[4] = _CachedInstance()
+        self.assertEqual(sorted(cache.keys()), [1, 3, 4])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_pinned_not_evicted(self):
+        cache = InstanceCache(maxsize=2)
+        cache[1] = _CachedInstance(pinned=True)
+        cache[2] = _CachedInstance()
+        cache[3] = _CachedInstance()
+        self.assertEqual(sorted(cache.keys()), [1, 3])
+        cache[4] = _CachedInstance(pinned=True)
+        self.assertEqual(sorted(cache.keys()), [1, 4])
+        self.assertEqual(cache.evict(2), 0)
+
+    def test_pinned_checked_once(self):
+        cache = InstanceCache(maxsize=2)
+        pinned = _CachedInstance(pinned=True)
+        cache[1] = pinned
+        for pk in range(2, 10):
+            cache[pk] = _CachedInstance()
+        self.assertEqual(pinned.nflushes, 1)
+        self.assertEqual(cache.evict(1), 1)
+        self.assertEqual(pinned.nflushes, 1)
+        # using it lets the next eviction check it again
+        pinned.pinned = False
+        cache.get(1)
+        self.assertEqual(cache.evict(1), 1)
+        self.assertEqual(pinned.nflushes, 2)
+        self.assertFalse(1 in cache)
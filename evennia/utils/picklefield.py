@@ -27,15 +27,29 @@ Pickle field implementation for Django.
 
 Modified for Evennia by Griatch.
 
+The way values are serialized is decided by the serializer class set by
+`settings.ATTRIBUTE_SERIALIZER`. Values not stored with the default
+pickle serializer are prefixed by their serializer's tag, like
+`~mp1~<data>`, so stored values remain readable also after
+changing serializer. Use `evennia reencode_attributes` to convert all
+stored values to the currently set serializer.
+
+Lookups on the stored value (like `attributes.get(value=...)`) compare
+the encoded data, so they only match values stored with the currently
+set serializer. After changing serializer, run `reencode_attributes`
+before relying on such lookups.
+
 """
 from builtins import object
 from ast import literal_eval
 
+from collections import OrderedDict, deque
 from copy import deepcopy
 from base64 import b64encode, b64decode
 from zlib import compress, decompress
 #import six # this is actually a pypy component, not in default syslib
 import django
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 
@@ -45,6 +59,7 @@ from django.forms.utils import flatatt
 from django.utils.html import format_html
 
 from evennia.utils.dbserialize import from_pickle, to_pickle
+from evennia.utils.utils import class_from_module
 from future.utils import with_metaclass
 
 try:
@@ -58,6 +73,11 @@ try:
 except ImportError:
     from pickle import loads, dumps # cpython 3.x, other interpreters
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 DEFAULT_PROTOCOL = 2
 
 class PickledObject(str):
@@ -95,26 +115,262 @@ def wrap_conflictual_object(obj):
     return obj
 
 
+#
+# Serializers
+#
+
+class PickleSerializer(object):
+    """
+    The default serializer, storing values as pickles. It has no tag,
+    since all values stored before serializers were made configurable
+    are on this form.
+
+    """
+    tag = ""
+
+    def dumps(self, value, protocol=DEFAULT_PROTOCOL):
+        """
+        Serialize a value.
+
+        Args:
+            value (any): The value to serialize.
+            protocol (int, optional): Pickle protocol to use.
+
+        Returns:
+            data (bytes): The serialized data.
+
+        """
+        # We use deepcopy() here to avoid a problem with cPickle, where dumps
+        # can generate different character streams for same lookup value if
+        # they are referenced differently.
+        # The reason this is important is because we do all of our lookups as
+        # simple string matches, thus the character streams must be the same
+        # for the lookups to work properly. See tests.py for more information.
+        return dumps(deepcopy(value), protocol=protocol)
+
+    def loads(self, data):
+        """
+        Un-serialize data created with `dumps`.
+
+        Args:
+            data (bytes): The serialized data.
+
+        Returns:
+            value (any): The un-serialized value.
+
+        """
+        return loads(data)
+
+
+# extension codes used by the MsgpackSerializer
+_EXT_PICKLE = 0
+_EXT_TUPLE = 1
+_EXT_SET = 2
+_EXT_ORDEREDDICT = 3
+_EXT_DEQUE = 4
+_EXT_DBOBJ = 5
+_EXT_SESSION = 6
+# short codes for the natural keys of the core models, to store
+# packed database objects more compactly. Only ever append to this!
+_NATURAL_KEY_CODES = (("objects", "objectdb"), ("players", "playerdb"),
+                      ("scripts", "scriptdb"), ("comms", "channeldb"),
+                      ("comms", "msg"), ("help", "helpentry"))
+_NATURAL_KEY_TO_CODE = dict((key, code) for code, key in enumerate(_NATURAL_KEY_CODES))
+
+
+def _sorted(items):
+    """
+    Sort items if possible, to get a stable order.
+
+    """
+    try:
+        return sorted(items)
+    except TypeError:
+        return list(items)
+
+
+def _normalize(value):
+    """
+    Rebuild all dicts in a value with their keys inserted in sorted
+    order, so dicts with the same content always iterate (and thus get
+    encoded) in the same order, however they were built.
+
+    """
+    dtype = type(value)
+    if dtype == dict:
+        return dict((key, _normalize(value[key])) for key in _sorted(value))
+    elif dtype == list:
+        return [_normalize(val) for val in value]
+    elif dtype == tuple:
+        return tuple(_normalize(val) for val in value)
+    elif dtype == set:
+        return set(_normalize(val) for val in value)
+    elif dtype == OrderedDict:
+        return OrderedDict((key, _normalize(val)) for key, val in value.items())
+    elif dtype == deque:
+        return deque(_normalize(val) for val in value)
+    return value
+
+
+class MsgpackSerializer(PickleSerializer):
+    """
+    A more compact and faster serializer using the msgpack format. This
+    requires the msgpack package (`pip install "msgpack<1.0"` for Python
+    2). Tuples (including packed database objects and sessions), sets,
+    OrderedDicts and deques are stored as msgpack extension types. Any
+    other data msgpack can't handle is stored pickled inside the msgpack
+    data, so nothing is lost.
+
+    Dict keys and set items are stored in sorted order (where they can
+    be sorted), so equal values are always encoded the same, which
+    lookups on the stored value rely on.
+
+    """
+    # change this if the format changes, keeping the old one readable
+    tag = "mp1"
+
+    def __init__(self):
+        if not msgpack:
+            raise ImportError("MsgpackSerializer requires the msgpack package:\n"
+                              "    pip install \"msgpack<1.0\"")
+
+    def _default(self, item):
+        "Convert types msgpack does not support natively."
+        dtype = type(item)
+        if dtype == tuple:
+            # packed entities are stored flat, without any nested extensions
+            if len(item) == 4 and item[0] == '__packed_dbobj__':
+                code = _NATURAL_KEY_TO_CODE.get(tuple(item[1]))
+                key = [code] if code is not None else list(item[1])
+                return msgpack.ExtType(_EXT_DBOBJ, self._pack(key + list(item[2:])))
+            elif len(item) == 3 and item[0] == '__packed_session__':
+                return msgpack.ExtType(_EXT_SESSION, self._pack(list(item[1:])))
+            return msgpack.ExtType(_EXT_TUPLE, self._pack(list(item)))
+        elif dtype == set:
+            return msgpack.ExtType(_EXT_SET, self._pack(_sorted(item)))
+        elif dtype == OrderedDict:
+            return msgpack.ExtType(_EXT_ORDEREDDICT, self._pack(list(item.items())))
+        elif dtype == deque:
+            return msgpack.ExtType(_EXT_DEQUE, self._pack(list(item)))
+        return msgpack.ExtType(_EXT_PICKLE, dumps(item, protocol=DEFAULT_PROTOCOL))
+
+    def _ext_hook(self, code, data):
+        "Convert extension types back."
+        if code == _EXT_PICKLE:
+            return loads(data)
+        elif code == _EXT_DBOBJ:
+            data = msgpack.unpackb(data, raw=False)
+            if len(data) == 3:
+                return ('__packed_dbobj__', _NATURAL_KEY_CODES[data[0]], data[1], data[2])
+            return ('__packed_dbobj__', (data[0], data[1]), data[2], data[3])
+        elif code == _EXT_SESSION:
+            return ('__packed_session__', ) + tuple(msgpack.unpackb(data, raw=False))
+        data = self.loads(data)
+        if code == _EXT_TUPLE:
+            return tuple(data)
+        elif code == _EXT_SET:
+            return set(data)
+        elif code == _EXT_ORDEREDDICT:
+            return OrderedDict(data)
+        elif code == _EXT_DEQUE:
+            return deque(data)
+        raise ValueError("Unknown msgpack extension type %s." % code)
+
+    def _pack(self, value):
+        # strict_types makes subclasses (like OrderedDict) go to _default
+        return msgpack.packb(value, use_bin_type=True, strict_types=True,
+                             default=self._default)
+
+    def dumps(self, value, protocol=DEFAULT_PROTOCOL):
+        return self._pack(_normalize(value))
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False, use_list=True, ext_hook=self._ext_hook)
+
+
+# {tag: serializer} for all serializers able to read stored values
+_SERIALIZERS = {}
+_SERIALIZER = None
+
+
+def _get_serializer(tag=None):
+    """
+    Get a serializer instance.
+
+    Args:
+        tag (str, optional): Get the serializer with this tag. If not
+            given, get the serializer set by `settings.ATTRIBUTE_SERIALIZER`.
+
+    Returns:
+        serializer (PickleSerializer): The serializer.
+
+    Raises:
+        ValueError: If no serializer with this tag is available.
+
+    """
+    global _SERIALIZER
+    if not _SERIALIZER:
+        _SERIALIZERS[PickleSerializer.tag] = PickleSerializer()
+        if msgpack:
+            _SERIALIZERS[MsgpackSerializer.tag] = MsgpackSerializer()
+        serializer = class_from_module(settings.ATTRIBUTE_SERIALIZER)
+        if serializer.tag not in _SERIALIZERS or \
+                type(_SERIALIZERS[serializer.tag]) != serializer:
+            _SERIALIZERS[serializer.tag] = serializer()
+        _SERIALIZER = _SERIALIZERS[serializer.tag]
+    if tag is None:
+        return _SERIALIZER
+    try:
+        return _SERIALIZERS[tag]
+    except KeyError:
+        raise ValueError("No serializer with tag '%s' is available "
+                         "to read this value." % tag)
+
+
+def get_value_tag(value):
+    """
+    Get the serializer tag of a stored (encoded) value.
+
+    Args:
+        value (str): The value as stored in the database.
+
+    Returns:
+        tag (str): The tag, empty for pickled values.
+
+    """
+    # ~ is not part of the base64 alphabet so it can't start an untagged value
+    if value.startswith("~"):
+        return value[1:].split("~", 1)[0]
+    return PickleSerializer.tag
+
+
 def dbsafe_encode(value, compress_object=False, pickle_protocol=DEFAULT_PROTOCOL):
-    # We use deepcopy() here to avoid a problem with cPickle, where dumps
-    # can generate different character streams for same lookup value if
-    # they are referenced differently.
-    # The reason this is important is because we do all of our lookups as
-    # simple string matches, thus the character streams must be the same
-    # for the lookups to work properly. See tests.py for more information.
-    value = dumps(deepcopy(value), protocol=pickle_protocol)
+    serializer = _get_serializer()
+    try:
+        value = serializer.dumps(value, protocol=pickle_protocol)
+    except (TypeError, ValueError, OverflowError):
+        if not serializer.tag:
+            raise
+        # fall back to pickle, which can handle anything dbserialize allows
+        serializer = _get_serializer(PickleSerializer.tag)
+        value = serializer.dumps(value, protocol=pickle_protocol)
     if compress_object:
         value = compress(value)
     value = b64encode(value).decode() # decode bytes to str
+    if serializer.tag:
+        value = "~%s~%s" % (serializer.tag, value)
     return PickledObject(value)
 
 
 def dbsafe_decode(value, compress_object=False):
+    tag = get_value_tag(value)
+    if tag:
+        value = value[len(tag) + 2:]
     value = value.encode() # encode str to bytes
     value = b64decode(value)
     if compress_object:
         value = decompress(value)
-    return loads(value)
+    return _get_serializer(tag).loads(value)
 
 
 class PickledWidget(Textarea):
@@ -367,3 +367,214 @@ class TestEvForm(TestCase):
         # note that in a msg() call, the result would be the  correct |-----,
         # in a print, ansi only gets called once, so ||----- is the result
         self.assertEqual(unicode(evform.EvForm(form={"FORM":"\n||-----"})), "||-----")
+
+from collections import OrderedDict, deque
+from mock import Mock, patch
+from evennia.utils import dbserialize
+from evennia.utils.test_resources import EvenniaTest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+class TestSaveCoalesce(EvenniaTest):
+    @patch.object(dbserialize, "_SAVE_COALESCE", True)
+    def test_coalesce(self):
+        self.obj1.db.mylist = [1, 2]
+        attr = self.obj1.attributes.get("mylist", return_obj=True)
+        mylist = self.obj1.db.mylist
+        with patch.object(attr, "save") as mocksave:
+            mylist.append(3)
+            mylist.append(4)
+            self.assertFalse(mocksave.called)
+            dbserialize.flush_pending_saves()
+            self.assertEqual(mocksave.call_count, 1)
+        self.assertEqual(self.obj1.db.mylist, [1, 2, 3, 4])
+
+    @patch.object(dbserialize, "_SAVE_COALESCE", True)
+    def test_read_pending(self):
+        self.obj1.db.mylist = [1]
+        attr = self.obj1.attributes.get("mylist", return_obj=True)
+        with patch.object(attr, "save") as mocksave:
+            # each append re-reads the Attribute
+            self.obj1.db.mylist.append(2)
+            self.obj1.db.mylist.append(3)
+            self.assertEqual(self.obj1.db.mylist, [1, 2, 3])
+            self.assertFalse(mocksave.called)
+            dbserialize.flush_pending_saves()
+            self.assertEqual(mocksave.call_count, 1)
+        self.assertFalse(dbserialize._PENDING_SAVES)
+
+    @patch.object(dbserialize, "_SAVE_COALESCE", True)
+    def test_set_discards_pending(self):
+        self.obj1.db.mydict = {"a": 1}
+        self.obj1.db.mydict["b"] = 2
+        self.obj1.db.mydict = {"c": 3}
+        dbserialize.flush_pending_saves()
+        self.assertEqual(self.obj1.db.mydict, {"c": 3})
+
+
+class TestFieldSaveCoalesce(EvenniaTest):
+    @patch("evennia.utils.idmapper.models._FIELD_SAVE_COALESCE", True)
+    def test_coalesce(self):
+        from evennia.utils.idmapper import models as idmapper
+        with patch.object(self.obj1, "save", wraps=self.obj1.save) as mocksave:
+            self.obj1.key = "NewKey"
+            self.obj1.typeclass_path = self.obj1.typeclass_path
+            self.assertFalse(mocksave.called)
+            idmapper.flush_field_saves()
+            self.assertEqual(mocksave.call_count, 1)
+            self.assertEqual(sorted(mocksave.call_args[1]["update_fields"]),
+                             ["db_key", "db_typeclass_path"])
+        self.assertFalse(idmapper._PENDING_FIELD_SAVES)
+        self.assertEqual(type(self.obj1).objects.filter(id=self.obj1.id).values_list(
+                         "db_key", flat=True)[0], "NewKey")
+
+    @patch("evennia.utils.idmapper.models._FIELD_SAVE_COALESCE", True)
+    def test_coalesce_location(self):
+        from evennia.utils.idmapper import models as idmapper
+        with patch("evennia.objects.models.logger") as mocklogger:
+            self.obj1.location = self.room2
+            self.assertTrue(self.obj1 in self.room2.contents)
+            self.assertFalse(self.obj1 in self.room1.contents)
+            idmapper.flush_field_saves()
+            self.assertFalse(mocklogger.log_warn.called)
+        self.assertEqual(type(self.obj1).objects.get(id=self.obj1.id).db_location, self.room2)
+
+    def test_save_changed_only(self):
+        self.obj1.db_key = "Direct"
+        with patch.object(self.obj1, "at_db_location_postsave") as mockhook, \
+                CaptureQueriesContext(connection) as queries:
+            self.obj1.save()
+            self.assertEqual(len(queries), 1)
+            self.assertTrue("db_key" in queries[0]["sql"])
+            self.assertFalse("db_typeclass_path" in queries[0]["sql"])
+            self.obj1.save()
+            self.assertEqual(len(queries), 1)
+            self.assertFalse(mockhook.called)
+        self.assertEqual(type(self.obj1).objects.filter(id=self.obj1.id).values_list(
+                         "db_key", flat=True)[0], "Direct")
+
+    def test_save_after_reload(self):
+        # getting a cached instance again must not hide its unsaved changes
+        self.obj1.db_key = "Unsaved"
+        self.assertTrue(type(self.obj1).objects.get(id=self.obj1.id) is self.obj1)
+        self.obj1.save()
+        self.assertEqual(type(self.obj1).objects.filter(id=self.obj1.id).values_list(
+                         "db_key", flat=True)[0], "Unsaved")
+
+    def test_no_coalesce(self):
+        with patch.object(self.obj1, "save", wraps=self.obj1.save) as mocksave:
+            self.obj1.key = "NewKey"
+            mocksave.assert_called_once_with(update_fields=["db_key"])
+
+
+class _Point(object):
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+class _MyList(list):
+    pass
+
+class TestDbSerializeDispatch(TestCase):
+    def setUp(self):
+        # undo the registration afterwards, the tables are process-wide
+        self.patchers = [patch.dict(dbserialize._TO_PICKLE),
+                         patch.dict(dbserialize._CUSTOM_UNPACKERS)]
+        for patcher in self.patchers:
+            patcher.start()
+        dbserialize.register_pickle_type(_Point, lambda p: (p.x, p.y), lambda t: _Point(*t))
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        dbserialize._TO_PICKLE_RESOLVED.clear()
+
+    def test_roundtrip(self):
+        data = {"stats": {"str": 10, "dex": 12.5, "tags": set(["a", "b"])},
+                "log": ["one", u"two", (3, None)],
+                "order": OrderedDict([("x", 1), ("y", [2])]),
+                "queue": deque([1, 2])}
+        self.assertEqual(dbserialize.from_pickle(dbserialize.to_pickle(data)), data)
+
+    def test_str_subclass(self):
+        string = ANSIString("|rtest|n")
+        self.assertTrue(dbserialize.to_pickle(string) is string)
+
+    def test_container_subclass(self):
+        pickled = dbserialize.to_pickle(_MyList([1, 2]))
+        self.assertEqual(type(pickled), _MyList)
+        self.assertEqual(type(dbserialize.from_pickle(pickled)), _MyList)
+        self.assertEqual(type(dbserialize.do_unpickle(dbserialize.do_pickle(pickled))), _MyList)
+
+    def test_saver_tree(self):
+        data = dbserialize.from_pickle({"a": [1, {"b": 2}]}, db_obj=Mock())
+        self.assertEqual(type(data), dbserialize._SaverDict)
+        self.assertEqual(type(data["a"]), dbserialize._SaverList)
+        self.assertEqual(type(data["a"][1]), dbserialize._SaverDict)
+        self.assertTrue(data["a"][1]._parent is data["a"])
+
+    def test_custom_type(self):
+        pickled = dbserialize.to_pickle({"pos": _Point(1, 2)})
+        self.assertEqual(pickled["pos"], ("__packed_custom__", "evennia.utils.tests._Point", (1, 2)))
+        point = dbserialize.dbunserialize(dbserialize.dbserialize([_Point(3, 4)]))[0]
+        self.assertEqual((point.x, point.y), (3, 4))
+
+from unittest import skipIf
+from django.core.management import call_command
+from evennia.utils import picklefield
+
+@skipIf(not picklefield.msgpack, "msgpack not installed")
+class TestMsgpackSerializer(EvenniaTest):
+    def setUp(self):
+        super(TestMsgpackSerializer, self).setUp()
+        picklefield._get_serializer()
+        self.msgpack = picklefield._SERIALIZERS[picklefield.MsgpackSerializer.tag]
+
+    def test_roundtrip(self):
+        value = dbserialize.to_pickle({"a": [1, (2, "b")], u"c": set([3]),
+                                       "d": OrderedDict([("e", deque([4]))]),
+                                       "obj": self.obj1, "f": 2 ** 70, "g": ANSIString("x")})
+        with patch.object(picklefield, "_SERIALIZER", self.msgpack):
+            encoded = picklefield.dbsafe_encode(value)
+        self.assertEqual(picklefield.get_value_tag(encoded), "mp1")
+        self.assertEqual(picklefield.dbsafe_decode(encoded), value)
+
+    def test_dict_order(self):
+        # -1 and -2 have the same hash, so these dicts iterate differently
+        dict1, dict2 = {}, {}
+        dict1[-1], dict1[-2] = 1, 2
+        dict2[-2], dict2[-1] = 2, 1
+        self.assertNotEqual(list(dict1), list(dict2))
+        self.assertEqual(self.msgpack.dumps({"a": dict1, "b": set([3, 1, 2])}),
+                         self.msgpack.dumps({"b": set([2, 1, 3]), "a": dict2}))
+
+    def test_value_lookup(self):
+        with patch.object(picklefield, "_SERIALIZER", self.msgpack):
+            self.obj1.db.test = {"x": 1, "y": [2, 3]}
+            found = type(self.obj1).objects.get_by_attribute(key="test", value={"y": [2, 3], "x": 1})
+        self.assertEqual(list(found), [self.obj1])
+
+    def test_reencode(self):
+        self.obj1.db.test = [1, "a", self.obj2]
+        with patch.object(picklefield, "_SERIALIZER", self.msgpack):
+            call_command("reencode_attributes", stdout=Mock())
+        from evennia.typeclasses.attributes import Attribute
+        attr = Attribute.objects.get(db_key="test")
+        raw = Attribute.objects.filter(id=attr.id).extra(select={"raw": "db_value"}).values("raw")[0]["raw"]
+        self.assertEqual(picklefield.get_value_tag(raw), "mp1")
+        self.assertEqual(Attribute.objects.values_list("db_value", flat=True).get(id=attr.id),
+                         dbserialize.to_pickle([1, "a", self.obj2]))
+
+
+class TestStringCache(TestCase):
+    def test_lru_by_size(self):
+        cache = utils.utils.StringCache(10)
+        cache.set(("a",), "1234")
+        cache.set(("b",), "1234")
+        self.assertEqual(cache.get(("a",)), "1234")
+        cache.set(("c",), "1234")
+        # b was least recently used
+        self.assertEqual(cache.get(("b",)), None)
+        self.assertEqual(cache.get(("c",)), "1234")
+        self.assertEqual((cache.size, cache.hits, cache.misses, cache.evictions), (10, 2, 1, 1))
+        cache.set(("d",), "too long to cache")
+        self.assertEqual(len(cache), 2)
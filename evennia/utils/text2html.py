@@ -14,6 +14,7 @@ from builtins import object
 import re
 import cgi
 from .ansi import *
+from .ansi import _PARSE_CACHE
 
 
 # All xterm256 RGB equivalents
@@ -286,6 +287,11 @@ class TextToHTMLparser(object):
         Returns:
             text (str): Parsed text.
         """
+        cachekey = (text, type(self), strip_ansi)
+        result = _PARSE_CACHE.get(cachekey)
+        if result is not None:
+            return result
+
         # parse everything to ansi first
         text = parse_ansi(text, strip_ansi=strip_ansi, xterm256=True, mxp=True)
         # convert all ansi to html
@@ -303,6 +309,7 @@ class TextToHTMLparser(object):
         # clean out eventual ansi that was missed
         #result = parse_ansi(result, strip_ansi=True)
 
+        _PARSE_CACHE.set(cachekey, result)
         return result
 
 HTML_PARSER = TextToHTMLparser()
@@ -1769,6 +1769,88 @@ class LimitedSizeOrderedDict(OrderedDict):
         super(LimitedSizeOrderedDict, self).update(*args, **kwargs)
         self._check_size()
 
+
+class StringCache(object):
+    """
+    A least-recently-used cache of strings, limited by the total size
+    of the cached strings rather than by their number. This makes it
+    safe to use for caching output text, which may be very long. It
+    keeps count of its hits, misses and evictions.
+
+    """
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes (int): The max total length of all cached keys'
+                strings and values. If 0, nothing is cached.
+
+        """
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _size(self, key, value):
+        "Approximate the size of an entry by the length of its strings."
+        return len(value) + sum(len(part) for part in key if isinstance(part, basestring))
+
+    def get(self, key):
+        """
+        Get a cached string.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            value (str or None): The cached string, or `None` if not
+                cached.
+
+        """
+        try:
+            value = self.cache.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # re-insert to mark it as most recently used
+        self.cache[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Cache a string, evicting the least recently used strings as
+        needed to stay within `max_bytes`.
+
+        Args:
+            key (tuple): The cache key.
+            value (str): The string to cache.
+
+        """
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self.cache:
+            self.size -= self._size(key, self.cache.pop(key))
+        self.cache[key] = value
+        self.size += size
+        while self.size > self.max_bytes:
+            oldkey, oldvalue = self.cache.popitem(last=False)
+            self.size -= self._size(oldkey, oldvalue)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Empty the cache and reset its statistics.
+
+        """
+        self.cache.clear()
+        self.size = self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.cache)
+
 def get_game_dir_path():
     """
     This is called by settings_default in order to determine the path